@@ -0,0 +1,13 @@
+"""
+Downloads Module
+Progressive downloads to ./temp served while they are being written, and a
+bounded queue for downloads made by external tools
+"""
+
+from .downloads import Download, DownloadManager, parse_range
+from .jobs import Job, DownloadQueue, queue_stats, QUEUED, RUNNING, DONE, FAILED
+
+__all__ = [
+    'Download', 'DownloadManager', 'parse_range',
+    'Job', 'DownloadQueue', 'queue_stats', 'QUEUED', 'RUNNING', 'DONE', 'FAILED'
+]
@@ -0,0 +1,235 @@
+"""
+Progressive downloads
+A command writes a media file to stdout, we store it as <file>.part in ./temp
+and any number of requests read it while it grows. When the command ends the
+.part file is renamed to its final name and served as a regular file.
+"""
+
+import os
+import threading
+import time
+from flask import Response, send_file, stream_with_context
+from clases.worker import worker as w
+from clases.log import log as l
+from clases.media_cache import media_cache, PARTIAL, COMPLETE
+
+CHUNK_SIZE = 64 * 1024
+# Seconds a reader waits for new bytes before giving up on a stalled download
+STALL_TIMEOUT = 60
+
+
+class Download:
+    def __init__(self, media_id, variant, command, final_path, mimetype='video/mp4'):
+        """
+        Args:
+            media_id (str): Media ID of the download
+            variant (str): Variant of the media (video, audio...)
+            command (list): Command writing the media to stdout
+            final_path (str): Path of the finished file, the download is
+                written to final_path + '.part' until it ends
+            mimetype (str): Content type served to the player
+        """
+        self.media_id = media_id
+        self.variant = variant
+        self.key = media_cache.key(media_id, variant)
+        self.command = command
+        self.final_path = final_path
+        self.part_path = f'{final_path}.part'
+        self.mimetype = mimetype
+        self.written = 0
+        self.done = False
+        self.failed = False
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        media_cache.put(self.media_id, self.part_path, self.variant, PARTIAL, 0)
+        process = w.worker(self.command).pipe()
+        try:
+            with open(self.part_path, 'wb') as file:
+                while True:
+                    # Whatever is available, not a full chunk: readers see the bytes right away
+                    chunk = process.stdout.read1(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    file.write(chunk)
+                    # Readers open the file on their own, make the bytes visible
+                    file.flush()
+                    with self.condition:
+                        self.written += len(chunk)
+                        self.condition.notify_all()
+            process.wait()
+            self.failed = process.returncode != 0 or self.written == 0
+        except OSError as e:
+            l.log("downloads", f"Error writing {self.part_path}: {e}")
+            self.failed = True
+        finally:
+            if process.poll() is None:
+                process.kill()
+
+        if not self.failed:
+            try:
+                os.replace(self.part_path, self.final_path)
+            except OSError as e:
+                l.log("downloads", f"Error moving {self.part_path} to {self.final_path}: {e}")
+                self.failed = True
+
+        if self.failed:
+            l.log("downloads", f"Download of {self.key} failed")
+            media_cache.remove(self.media_id, self.variant)
+            try:
+                os.remove(self.part_path)
+            except OSError:
+                pass
+        else:
+            media_cache.put(self.media_id, self.final_path, self.variant, COMPLETE, self.written)
+            l.log("downloads", f"Download of {self.key} complete ({self.written} bytes)")
+
+        with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    def wait_for(self, offset, timeout=STALL_TIMEOUT):
+        """Block until more than offset bytes are written or the download ends."""
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.written > offset or self.done,
+                timeout=timeout
+            )
+
+    def open(self):
+        """
+        The .part file, or the final one if it was already renamed. Opened
+        without checking first: the rename may happen in between, and an open
+        handle survives it.
+        """
+        for path in (self.part_path, self.final_path):
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                continue
+        l.log("downloads", f"Download of {self.key} has no file to read")
+        return None
+
+    def read(self, start=0, end=None):
+        """Yield bytes start..end (inclusive), waiting for them to be written."""
+        position = start
+        # The .part file is created by the download thread, wait for the first bytes
+        self.wait_for(0)
+        if self.failed:
+            return
+        file = self.open()
+        if file is None:
+            return
+        with file:
+            file.seek(start)
+            while end is None or position <= end:
+                if position >= self.written:
+                    if self.done:
+                        return
+                    if not self.wait_for(position):
+                        l.log("downloads", f"Download of {self.key} stalled at {position}")
+                        return
+                    continue
+                size = min(CHUNK_SIZE, self.written - position)
+                if end is not None:
+                    size = min(size, end - position + 1)
+                data = file.read(size)
+                if not data:
+                    time.sleep(0.1)
+                    continue
+                position += len(data)
+                yield data
+
+
+def parse_range(range_header):
+    """Return (start, end) of a 'bytes=start-end' header, end may be None."""
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    try:
+        start, _, end = range_header[6:].split(',')[0].partition('-')
+        return int(start or 0), int(end) if end else None
+    except ValueError:
+        return None
+
+
+class DownloadManager:
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def get(self, media_id, variant=''):
+        """Download of media_id/variant, a failed one is dropped so the next start() retries it."""
+        key = media_cache.key(media_id, variant)
+        with self.lock:
+            job = self.jobs.get(key)
+            if job and job.done and job.failed:
+                del self.jobs[key]
+                return None
+            return job
+
+    def start(self, media_id, variant, command, final_path, mimetype='video/mp4'):
+        """Start a download, or return the one already running for media_id/variant."""
+        key = media_cache.key(media_id, variant)
+        with self.lock:
+            job = self.jobs.get(key)
+            if job and not (job.done and job.failed):
+                return job
+            job = Download(media_id, variant, command, final_path, mimetype)
+            self.jobs[key] = job
+        job.start()
+        return job
+
+    def serve(self, job, range_header=None):
+        """
+        Response for a download: the finished file (send_file handles Range)
+        or the partial file, limited to the bytes written so far.
+        """
+        if job.done and not job.failed and os.path.exists(job.final_path):
+            with self.lock:
+                self.jobs.pop(job.key, None)
+            media_cache.get(job.media_id, job.variant)
+            return send_file(job.final_path, mimetype=job.mimetype, conditional=True)
+
+        # Wait for the first bytes, a download failing right now gets an
+        # error instead of an empty 200
+        job.wait_for(0)
+        if job.done and job.failed:
+            with self.lock:
+                if self.jobs.get(job.key) is job:
+                    del self.jobs[job.key]
+            return Response('Download failed', status=502)
+
+        requested = parse_range(range_header)
+        if requested is None:
+            # Whole file, streamed as it is written
+            return Response(
+                stream_with_context(job.read()),
+                mimetype=job.mimetype,
+                headers={'Accept-Ranges': 'bytes'}
+            )
+
+        start, end = requested
+        if start >= job.written:
+            job.wait_for(start)
+        if job.done and job.failed:
+            return Response('Download failed', status=502)
+        if start >= job.written:
+            return Response(status=416, headers={'Content-Range': 'bytes */*'})
+
+        # The total size is unknown until the download ends
+        end = job.written - 1 if end is None else min(end, job.written - 1)
+        return Response(
+            stream_with_context(job.read(start, end)),
+            status=206,
+            mimetype=job.mimetype,
+            headers={
+                'Accept-Ranges': 'bytes',
+                'Content-Range': f'bytes {start}-{end}/*',
+                'Content-Length': str(end - start + 1)
+            }
+        )
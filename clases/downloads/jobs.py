@@ -0,0 +1,206 @@
+"""
+Download queue
+Downloads made by a tool that writes its own files (not stdout) run as jobs in
+a bounded queue with a fixed number of workers. A media ID has at most one job
+queued or running, every request for it waits on the same job.
+"""
+
+import os
+import queue
+import threading
+import time
+from clases.log import log as l
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+CHUNK_SIZE = 64 * 1024
+# Seconds a reader of a partial file waits for new bytes before giving up
+STALL_TIMEOUT = 60
+
+# Every DownloadQueue by name, the dashboard shows their jobs
+queues = {}
+
+
+class Job:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.state = QUEUED
+        self.progress = 0.0
+        self.path = None
+        # File being written that a player can already read, if any
+        self.partial_path = None
+        self.attempts = 0
+        self.created = time.time()
+        self.updated = self.created
+        self.condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+    def update(self, **fields):
+        with self.condition:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self.updated = time.time()
+            self.condition.notify_all()
+
+    def wait(self, ready=None, timeout=None):
+        """
+        Block until the job ends, or ready(job) is True
+
+        Returns:
+            bool: False on timeout
+        """
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.finished or (ready is not None and ready(self)),
+                timeout=timeout
+            )
+
+    def read_partial(self, path):
+        """Yield path (a partial_path of the job) from the start while it is written, until the job ends."""
+        # An open handle survives the file being renamed or removed after muxing
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            # Removed before it was opened, the final file is served instead
+            self.wait(timeout=STALL_TIMEOUT)
+            if self.state != DONE or not self.path:
+                l.log("downloads", f"Partial file of {self.job_id} is gone: {path}")
+                return
+            try:
+                file = open(self.path, 'rb')
+            except FileNotFoundError:
+                l.log("downloads", f"File of {self.job_id} is gone: {self.path}")
+                return
+        with file:
+            idle_since = time.time()
+            while True:
+                data = file.read(CHUNK_SIZE)
+                if data:
+                    idle_since = time.time()
+                    yield data
+                    continue
+                if self.finished:
+                    return
+                if time.time() - idle_since > STALL_TIMEOUT:
+                    l.log("downloads", f"Partial file of {self.job_id} stalled")
+                    return
+                self.wait(timeout=1)
+
+    def as_dict(self):
+        return {
+            'id': self.job_id,
+            'state': self.state,
+            'progress': round(self.progress, 1),
+            'attempts': self.attempts,
+            'partial': bool(self.partial_path)
+        }
+
+
+class DownloadQueue:
+    def __init__(self, name, run, workers=2, max_queued=20, retries=1, keep_finished=20):
+        """
+        Args:
+            name (str): Name shown in logs and the dashboard
+            run (callable): run(job) downloads job.job_id, reporting progress
+                with job.update(), and returns the final path or None
+            workers (int): Downloads running at the same time
+            max_queued (int): Jobs waiting for a worker, submit() refuses more
+            retries (int): Extra attempts of a failed download, run() gets
+                the same job so it can resume the partial files
+            keep_finished (int): Finished jobs kept for the dashboard
+        """
+        self.name = name
+        self.run = run
+        self.workers = max(1, workers)
+        self.retries = max(0, retries)
+        self.keep_finished = keep_finished
+        self.queue = queue.Queue(maxsize=max(1, max_queued))
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.threads = []
+        queues[name] = self
+
+    def start_workers(self):
+        # Lazy, nothing runs until the first download is asked for
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(target=self.worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, job_id):
+        """
+        Job of job_id, queued now or the one already queued or running
+
+        Returns:
+            Job: None if the queue is full
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            # A finished download is only reused while its file is there
+            if job and (not job.finished or (job.state == DONE and os.path.exists(job.path))):
+                return job
+            job = Job(job_id)
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                l.log("downloads", f"{self.name} queue full, {job_id} refused")
+                return None
+            self.jobs[job_id] = job
+            self.prune()
+            self.start_workers()
+        l.log("downloads", f"{self.name}: {job_id} queued")
+        return job
+
+    def prune(self):
+        finished = sorted(
+            (job for job in self.jobs.values() if job.finished),
+            key=lambda job: job.updated
+        )
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job.job_id]
+
+    def worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self.process(job)
+            finally:
+                self.queue.task_done()
+
+    def process(self, job):
+        for attempt in range(1, self.retries + 2):
+            job.update(state=RUNNING, attempts=attempt)
+            try:
+                path = self.run(job)
+            except Exception as e:
+                l.log("downloads", f"{self.name}: error downloading {job.job_id}: {e}")
+                path = None
+            if path and os.path.exists(path):
+                job.update(state=DONE, path=path, progress=100.0, partial_path=None)
+                l.log("downloads", f"{self.name}: {job.job_id} done")
+                return
+            if attempt <= self.retries:
+                l.log("downloads", f"{self.name}: {job.job_id} failed, resuming (attempt {attempt + 1})")
+        job.update(state=FAILED, partial_path=None)
+        l.log("downloads", f"{self.name}: {job.job_id} failed")
+
+    def stats(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        order = {RUNNING: 0, QUEUED: 1, FAILED: 2, DONE: 3}
+        jobs.sort(key=lambda job: (order[job.state], -job.updated))
+        return {
+            'running': sum(1 for job in jobs if job.state == RUNNING),
+            'queued': sum(1 for job in jobs if job.state == QUEUED),
+            'jobs': [job.as_dict() for job in jobs]
+        }
+
+
+def queue_stats():
+    return {name: download_queue.stats() for name, download_queue in queues.items()}
@@ -4,6 +4,7 @@ import time
 import platform
 from clases.config import config as c
 from clases.log import log as l
+from clases.media_cache import media_cache, SIDECAR_NAME
 import threading
 
 class folders:
@@ -11,6 +12,7 @@ class folders:
 
     keep_downloaded = 86400
     temp_aria2_ffmpeg_files = 600
+    full_scan_interval = 300
     if 'ytdlp2strm_temp_file_duration' in ytdlp2strm_config:
         keep_downloaded = int(ytdlp2strm_config['ytdlp2strm_temp_file_duration'])
 
@@ -19,6 +21,7 @@ class folders:
 
     keep_downloaded = 86400
     temp_aria2_ffmpeg_files = 600
+    full_scan_interval = 300
     if 'ytdlp2strm_temp_file_duration' in ytdlp2strm_config:
         keep_downloaded = int(ytdlp2strm_config['ytdlp2strm_temp_file_duration'])
 
@@ -113,18 +116,34 @@ class folders:
         return stat.st_mtime
     
     def clean_old_videos(self, stop_event):
-
+        # Indexed files are checked every 5 seconds, the full listing of temp
+        # only runs every few minutes to catch files the index doesn't know
+        last_scan = 0
         while not stop_event.is_set():
             try:
                 time.sleep(5)
                 path = os.getcwd()
                 temp_path = os.path.join(path, 'temp')
                 now = time.time()
+
+                for entry in media_cache.expired(self.keep_downloaded, self.temp_aria2_ffmpeg_files):
+                    media_cache.remove(entry['media_id'], entry['variant'])
+                    if os.path.isfile(entry['path']):
+                        log_text = (f"Removing old video file: {entry['path']}")
+                        l.log("folder", log_text)
+                        os.remove(entry['path'])
+                media_cache.save()
+
+                if now - last_scan < self.full_scan_interval:
+                    continue
+                last_scan = now
+
                 aria2_ffmpeg_files = ['.part', 'aria2', 'urls', '.temp', 'm4a', '.ytdl']
+                indexed = media_cache.paths()
 
                 for f in os.listdir(temp_path):
                     temp_file = os.path.join(temp_path, f)
-                    if not f == "__init__.py":
+                    if not f == "__init__.py" and not f == SIDECAR_NAME and temp_file not in indexed:
                         if any(keyword in f for keyword in aria2_ffmpeg_files):
                             if os.path.isfile(temp_file) and self.modified_date(temp_file) < now - self.temp_aria2_ffmpeg_files:
                                 log_text = (f"Removing old temporary file: {temp_file}")
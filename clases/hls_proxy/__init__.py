@@ -0,0 +1,8 @@
+"""
+HLS Proxy Module
+Rewrites HLS playlists to local routes and caches the segments
+"""
+
+from .hls_proxy import HlsProxy, SegmentCache
+
+__all__ = ['HlsProxy', 'SegmentCache']
@@ -0,0 +1,340 @@
+"""
+HLS proxy
+Rewrites playlist and segment URIs to local routes so every player goes through
+ytdlp2STRM. Segments are fetched with a pooled session and kept in a bounded
+LRU cache (memory first, spilled to disk) for seeks and concurrent viewers.
+Tokens and cache entries are keyed on the URL without its host and signature,
+so a re-signed URL of the same segment is the same entry. When the signed URLs
+expire (403/410) the playlist they came from is fetched (or resolved) again.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit, parse_qsl, urlencode
+import requests
+from cachetools import TTLCache
+from clases.log import log as l
+from clases.http_client import client
+
+# URI="..." inside tags (#EXT-X-MEDIA, #EXT-X-MAP, #EXT-X-KEY...)
+_URI_ATTR_RE = re.compile(r'URI="([^"]*)"')
+
+PLAYLIST = 'playlist'
+SEGMENT = 'segment'
+
+DEFAULT_CONTENT_TYPE = 'video/mp2t'
+# Upstream answers of a signed URL that expired
+EXPIRED_STATUS = (403, 410)
+# Signature, expiry and per-client params, in the query or as /name/value/ path
+# pairs (googlevideo), they change every time the same media is resolved
+VOLATILE_PARAMS = {
+    'expire', 'expires', 'exp', 'ei', 'ip', 'ipbits', 'sig', 'signature', 'lsig',
+    'sparams', 'lsparams', 'initcwndbps', 'mh', 'mm', 'mn', 'ms', 'mv', 'mvi',
+    'pl', 'rms', 'pcm2cms', 'token', 'hdnts', 'hdnea', 'policy', 'key-pair-id',
+    'x-amz-signature', 'x-amz-date', 'x-amz-expires', 'x-amz-credential',
+    'x-amz-security-token'
+}
+
+
+def stable_key(url):
+    """URL path and query without host, signature and expiry params."""
+    parts = urlsplit(url)
+    segments = parts.path.split('/')
+    path = []
+    skip = False
+    for index, segment in enumerate(segments):
+        if skip:
+            skip = False
+            continue
+        if segment.lower() in VOLATILE_PARAMS and index + 1 < len(segments):
+            skip = True
+            continue
+        path.append(segment)
+    query = [
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in VOLATILE_PARAMS
+    ]
+    key = '/'.join(path)
+    return f'{key}?{urlencode(query)}' if query else key
+
+
+class SegmentCache:
+    def __init__(self, memory_bytes, disk_bytes=0, disk_dir=None):
+        """
+        Args:
+            memory_bytes (int): Max bytes kept in memory
+            disk_bytes (int): Max bytes spilled to disk, 0 disables the disk tier
+            disk_dir (str): Folder for spilled segments
+        """
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes if disk_dir else 0
+        self.disk_dir = disk_dir
+        self.memory = OrderedDict()
+        self.disk = OrderedDict()
+        self.memory_size = 0
+        self.disk_size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.disk_bytes:
+            os.makedirs(disk_dir, exist_ok=True)
+            # Spilled files of a previous run are not indexed, start clean
+            for name in os.listdir(disk_dir):
+                if name.endswith('.seg'):
+                    try:
+                        os.remove(os.path.join(disk_dir, name))
+                    except OSError:
+                        pass
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.seg')
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (data, content_type), None if not cached
+        """
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return entry
+            disk_entry = self.disk.get(key)
+            if disk_entry is not None:
+                self.disk.move_to_end(key)
+
+        if disk_entry is not None:
+            try:
+                with open(self._disk_path(key), 'rb') as file:
+                    data = file.read()
+            except OSError:
+                with self.lock:
+                    self.disk_size -= self.disk.pop(key, (0, None))[0]
+            else:
+                with self.lock:
+                    self.hits += 1
+                return data, disk_entry[1]
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data, content_type=DEFAULT_CONTENT_TYPE):
+        if len(data) > self.memory_bytes:
+            return
+        spilled = []
+        with self.lock:
+            if key in self.memory:
+                return
+            self.memory[key] = (data, content_type)
+            self.memory_size += len(data)
+            while self.memory_size > self.memory_bytes:
+                old_key, (old_data, old_type) = self.memory.popitem(last=False)
+                self.memory_size -= len(old_data)
+                spilled.append((old_key, old_data, old_type))
+
+        for old_key, old_data, old_type in spilled:
+            self._spill(old_key, old_data, old_type)
+
+    def _spill(self, key, data, content_type):
+        if not self.disk_bytes or len(data) > self.disk_bytes:
+            return
+        try:
+            with open(self._disk_path(key), 'wb') as file:
+                file.write(data)
+        except OSError as e:
+            l.log("hls_proxy", f"Unable to spill segment to disk: {e}")
+            return
+
+        removed = []
+        with self.lock:
+            if key not in self.disk:
+                self.disk[key] = (len(data), content_type)
+                self.disk_size += len(data)
+            while self.disk_size > self.disk_bytes:
+                old_key, (size, _) = self.disk.popitem(last=False)
+                self.disk_size -= size
+                removed.append(old_key)
+
+        for old_key in removed:
+            try:
+                os.remove(self._disk_path(old_key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                'memory_items': len(self.memory),
+                'memory_bytes': self.memory_size,
+                'disk_items': len(self.disk),
+                'disk_bytes': self.disk_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class HlsProxy:
+    def __init__(self, base_url, cache, proxy_url="", timeout=15, token_ttl=6 * 60 * 60):
+        """
+        Args:
+            base_url (str): Public prefix of the proxy routes,
+                e.g. http://host:port/youtube/proxy
+            cache (SegmentCache): Segment cache
+            proxy_url (str): Optional upstream proxy
+            timeout (int): Upstream request timeout in seconds
+            token_ttl (int): Seconds a rewritten URI stays valid
+        """
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache
+        self.timeout = timeout
+        self.tokens = TTLCache(maxsize=200000, ttl=token_ttl)
+        # Token of the playlist every URI was found in
+        self.parents = TTLCache(maxsize=200000, ttl=token_ttl)
+        # source() of every master playlist, see rewrite_playlist
+        self.sources = TTLCache(maxsize=1000, ttl=token_ttl)
+        self.lock = threading.Lock()
+
+        self.session = client(proxy_url)
+
+    def register(self, url, parent=None):
+        """
+        Return the token of an upstream URL. The same media always gets the
+        same token, a re-signed URL replaces the one registered before.
+        """
+        token = hashlib.sha1(stable_key(url).encode('utf-8')).hexdigest()
+        with self.lock:
+            self.tokens[token] = url
+            if parent:
+                self.parents[token] = parent
+        return token
+
+    def resolve(self, token):
+        with self.lock:
+            return self.tokens.get(token)
+
+    def local_url(self, kind, url, parent=None):
+        return f'{self.base_url}/{kind}/{self.register(url, parent)}'
+
+    def rewrite_playlist(self, content, base_url, source=None, parent=None):
+        """
+        Point every URI of a playlist to the proxy
+
+        In a master playlist the URIs are media playlists, in a media playlist
+        they are segments (init segments and keys included).
+
+        Args:
+            source (callable): source() returns (content, base_url) of the
+                same master playlist resolved again, or None. Called when its
+                signed URLs expire
+            parent (str): Token of the playlist being rewritten
+        """
+        if source is not None:
+            parent = parent or self.register(base_url)
+            with self.lock:
+                self.sources[parent] = source
+
+        is_master = '#EXT-X-STREAM-INF' in content
+        output = []
+
+        for line in content.splitlines():
+            if not line:
+                output.append(line)
+                continue
+
+            if line.startswith('#'):
+                if 'URI="' in line:
+                    kind = PLAYLIST if line.startswith('#EXT-X-MEDIA:') else SEGMENT
+                    line = _URI_ATTR_RE.sub(
+                        lambda m: f'URI="{self.local_url(kind, urljoin(base_url, m.group(1)), parent)}"',
+                        line
+                    )
+                output.append(line)
+                continue
+
+            kind = PLAYLIST if is_master else SEGMENT
+            output.append(self.local_url(kind, urljoin(base_url, line.strip()), parent))
+
+        return '\n'.join(output) + '\n'
+
+    def remap(self, token):
+        """
+        Fetch again the playlist token was found in, so it points to a freshly
+        signed URL. A master playlist is resolved again with its source().
+
+        Returns:
+            bool: False if there is nothing to fetch again or it failed
+        """
+        with self.lock:
+            parent = self.parents.get(token)
+            source = self.sources.get(parent) if parent else None
+        if not parent:
+            return False
+        l.log("hls_proxy", "Upstream URL expired, fetching its playlist again")
+        if source is None:
+            return self.playlist(parent) is not None
+        try:
+            fresh = source()
+        except Exception as e:
+            l.log("hls_proxy", f"Unable to resolve the master playlist again: {e}")
+            return False
+        if not fresh:
+            return False
+        content, base_url = fresh
+        self.rewrite_playlist(content, base_url, source=source, parent=parent)
+        return True
+
+    def fetch(self, token):
+        """
+        Upstream response of token, mapped again once if its URL expired
+
+        Returns:
+            Response: None if the token is unknown or the request failed
+        """
+        for attempt in (1, 2):
+            url = self.resolve(token)
+            if not url:
+                return None
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                if response.status_code in EXPIRED_STATUS and attempt == 1 and self.remap(token):
+                    continue
+                response.raise_for_status()
+            except requests.RequestException as e:
+                l.log("hls_proxy", f"Upstream error: {e}")
+                return None
+            return response
+        return None
+
+    def playlist(self, token):
+        """Fetch an upstream playlist and return it rewritten, None on error."""
+        response = self.fetch(token)
+        if response is None:
+            return None
+        response.encoding = 'utf-8'
+        return self.rewrite_playlist(response.text, response.url, parent=token)
+
+    def segment(self, token):
+        """
+        Return the bytes of a segment, from the cache when possible
+
+        Returns:
+            tuple: (data, content_type) or (None, None) if unknown/failed
+        """
+        cached = self.cache.get(token)
+        if cached is not None:
+            return cached
+
+        response = self.fetch(token)
+        if response is None:
+            return None, None
+
+        data = response.content
+        content_type = response.headers.get('Content-Type', DEFAULT_CONTENT_TYPE)
+        self.cache.put(token, data, content_type)
+        return data, content_type
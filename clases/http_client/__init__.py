@@ -0,0 +1,8 @@
+"""
+HTTP Client Module
+Pooled HTTP client shared by plugins and helpers
+"""
+
+from .http_client import HttpClient, HostBusy, client, plugin_client
+
+__all__ = ['HttpClient', 'HostBusy', 'client', 'plugin_client']
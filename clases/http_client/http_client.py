@@ -0,0 +1,169 @@
+"""
+Shared HTTP client
+One keep-alive pool per host, default timeouts, retries with backoff for
+idempotent requests and a concurrency cap per host. Plugins get a client per
+proxy setting with client(proxy_url).
+"""
+
+import threading
+import weakref
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from clases.log import log as l
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5, 30)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Seconds a request waits for a free slot of its host
+SLOT_TIMEOUT = 30
+
+
+class HostBusy(requests.RequestException):
+    """No slot of the host was free within slot_timeout."""
+
+
+class HttpClient:
+    def __init__(self, proxy_url="", timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.5,
+                 pool_size=16, host_limit=8, stream_limit=64, slot_timeout=SLOT_TIMEOUT):
+        """
+        Args:
+            proxy_url (str): Proxy for every request of this client
+            timeout (tuple|int): Default timeout, requests may override it
+            retries (int): Retries for connection errors and RETRY_STATUS
+                answers of idempotent requests (GET, HEAD, OPTIONS, PUT, DELETE)
+            backoff (float): Backoff factor between retries (0.5, 1, 2...)
+            pool_size (int): Keep-alive connections per host
+            host_limit (int): Max concurrent requests per host, until their
+                headers arrive
+            stream_limit (int): Max stream=True bodies open per host. They
+                last as long as a playback, so they don't count against
+                host_limit
+            slot_timeout (int): Seconds to wait for a slot before raising
+                HostBusy
+        """
+        self.timeout = timeout
+        self.host_limit = host_limit
+        self.stream_limit = stream_limit
+        self.slot_timeout = slot_timeout
+        self.host_slots = {}
+        self.lock = threading.Lock()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS,
+            # Callers check the status code, don't raise after the last retry
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if proxy_url:
+            self.session.proxies = {'http': proxy_url, 'https': proxy_url}
+
+    def _acquire(self, url, stream=False):
+        """Take a request (or stream body) slot of the host of url, HostBusy if none frees up."""
+        host = urlparse(url).netloc
+        key = (host, stream)
+        with self.lock:
+            slot = self.host_slots.get(key)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.stream_limit if stream else self.host_limit)
+                self.host_slots[key] = slot
+        if not slot.acquire(timeout=self.slot_timeout):
+            kind = 'streams' if stream else 'requests'
+            l.log("http_client", f"No free slot for {host} after {self.slot_timeout}s ({kind})")
+            raise HostBusy(f"Too many concurrent {kind} to {host}")
+        return slot
+
+    def request(self, method, url, **kwargs):
+        """
+        Request holding a slot of the host until its headers arrive. With
+        stream=True the body holds a stream slot until it is read to the end
+        or the response is closed.
+
+        Raises:
+            HostBusy: No slot was free within slot_timeout
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        stream_slot = self._acquire(url, stream=True) if kwargs.get('stream') else None
+        try:
+            slot = self._acquire(url)
+        except HostBusy:
+            if stream_slot:
+                stream_slot.release()
+            raise
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except BaseException:
+            if stream_slot:
+                stream_slot.release()
+            raise
+        finally:
+            slot.release()
+        if stream_slot:
+            self._hold(stream_slot, response)
+        return response
+
+    @staticmethod
+    def _hold(slot, response):
+        released = []
+        release_lock = threading.Lock()
+
+        def release():
+            with release_lock:
+                if released:
+                    return
+                released.append(True)
+            slot.release()
+
+        def wrap(close):
+            def wrapped(*args, **kwargs):
+                try:
+                    return close(*args, **kwargs)
+                finally:
+                    release()
+            return wrapped
+
+        # urllib3 releases the connection once the body is read to the end,
+        # close() covers the bodies left unread. A response dropped without
+        # either frees the slot when it is collected
+        response.close = wrap(response.close)
+        raw_release = getattr(response.raw, 'release_conn', None)
+        if raw_release is not None:
+            response.raw.release_conn = wrap(raw_release)
+        weakref.finalize(response, release)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client(proxy_url=""):
+    """Shared client for a proxy setting ("" for direct connections)."""
+    proxy_url = proxy_url or ""
+    with _clients_lock:
+        shared = _clients.get(proxy_url)
+        if shared is None:
+            shared = HttpClient(proxy_url)
+            _clients[proxy_url] = shared
+        return shared
+
+
+def plugin_client(config):
+    """Shared client using the proxy / proxy_url keys of a plugin config."""
+    proxy = str(config.get('proxy', 'False')).lower() == 'true'
+    return client(config.get('proxy_url', '') if proxy else "")
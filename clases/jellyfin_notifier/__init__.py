@@ -3,6 +3,6 @@ Jellyfin/Emby Notifier Module
 Provides library scan notification functionality for Jellyfin and Emby servers
 """
 
-from .jellyfin_notifier import JellyfinNotifier, notify_jellyfin
+from .jellyfin_notifier import JellyfinNotifier, notify_jellyfin, get_notifier
 
-__all__ = ['JellyfinNotifier', 'notify_jellyfin']
+__all__ = ['JellyfinNotifier', 'notify_jellyfin', 'get_notifier']
@@ -3,8 +3,20 @@ Jellyfin/Emby Library Scanner Notifier
 Notifies Jellyfin or Emby to scan a specific library when new content is added
 """
 
+import os
+import threading
 import requests
 from clases.log import log as l
+from clases.http_client import client
+
+# Above this many files, their folders are sent instead
+MAX_UPDATED_PATHS = 200
+
+_lock = threading.Lock()
+# Library IDs by (base_url, library name)
+_library_ids = {}
+# Shared notifiers by config, see get_notifier
+_notifiers = {}
 
 class JellyfinNotifier:
     def __init__(self, config):
@@ -26,6 +38,8 @@ class JellyfinNotifier:
         self.api_key = config.get('jellyfin_api_key', '')
         self.library_name = config.get('jellyfin_library_name', '')
         self.server_type = 'jellyfin'  # Default to jellyfin, can be 'emby'
+        self.pending = set()
+        self.lock = threading.Lock()
         
         # Validate configuration
         if self.enabled:
@@ -46,13 +60,19 @@ class JellyfinNotifier:
     
     def get_library_id(self):
         """
-        Get the library ID by name
+        Get the library ID by name. Found IDs are cached for the whole
+        process, a missing library is looked up again next time
         
         Returns:
             str: Library ID or None if not found
         """
         if not self.enabled:
             return None
+
+        cache_key = (self.base_url, self.library_name.lower())
+        with _lock:
+            if cache_key in _library_ids:
+                return _library_ids[cache_key]
         
         try:
             # Endpoint is the same for both Jellyfin and Emby
@@ -61,22 +81,24 @@ class JellyfinNotifier:
                 'X-Emby-Token': self.api_key
             }
             
-            response = requests.get(url, headers=headers, timeout=10)
+            response = client().get(url, headers=headers, timeout=10)
             response.raise_for_status()
             
             libraries = response.json()
             
+            library_id = None
             for library in libraries:
                 if library.get('Name', '').lower() == self.library_name.lower():
-                    # Get the first ItemId from Locations
-                    locations = library.get('Locations', [])
-                    if locations:
-                        # For Jellyfin/Emby, we need to get the library ID from the CollectionType
-                        # We'll use the library name to trigger a scan
-                        return library.get('ItemId') or library.get('Name')
-            
-            l.log("jellyfin_notifier", f"Library '{self.library_name}' not found")
-            return None
+                    library_id = library.get('ItemId')
+                    break
+
+            if not library_id:
+                l.log("jellyfin_notifier", f"Library '{self.library_name}' not found")
+                return None
+
+            with _lock:
+                _library_ids[cache_key] = library_id
+            return library_id
             
         except requests.exceptions.RequestException as e:
             l.log("jellyfin_notifier", f"Error getting library ID: {e}")
@@ -87,7 +109,7 @@ class JellyfinNotifier:
     
     def scan_library(self):
         """
-        Trigger a library scan
+        Trigger a library scan, only the configured library when its ID is known
         
         Returns:
             bool: True if scan was triggered successfully, False otherwise
@@ -95,22 +117,18 @@ class JellyfinNotifier:
         if not self.enabled:
             return False
         
+        headers = {
+            'X-Emby-Token': self.api_key
+        }
+
         try:
-            # First, try to get the library ID
             library_id = self.get_library_id()
             
             if library_id:
-                # Scan specific library by ID
-                url = f"{self.base_url}/Library/Refresh"
-                headers = {
-                    'X-Emby-Token': self.api_key,
-                    'Content-Type': 'application/json'
-                }
-                
-                # Try with library ID in query params
-                params = {}
-                
-                response = requests.post(url, headers=headers, params=params, timeout=10)
+                # Refresh only this library
+                url = f"{self.base_url}/Items/{library_id}/Refresh"
+                params = {'Recursive': 'true'}
+                response = client().post(url, headers=headers, params=params, timeout=10)
                 response.raise_for_status()
                 
                 l.log("jellyfin_notifier", f"Library scan triggered successfully for '{self.library_name}'")
@@ -118,11 +136,7 @@ class JellyfinNotifier:
             else:
                 # Fallback: trigger a full library scan
                 url = f"{self.base_url}/Library/Refresh"
-                headers = {
-                    'X-Emby-Token': self.api_key
-                }
-                
-                response = requests.post(url, headers=headers, timeout=10)
+                response = client().post(url, headers=headers, timeout=10)
                 response.raise_for_status()
                 
                 l.log("jellyfin_notifier", f"Full library scan triggered (library '{self.library_name}' not found)")
@@ -134,25 +148,104 @@ class JellyfinNotifier:
         except Exception as e:
             l.log("jellyfin_notifier", f"Unexpected error triggering library scan: {e}")
             return False
+
+    def media_updated(self, paths):
+        """
+        Tell the server exactly which paths changed (/Library/Media/Updated)
+        
+        Args:
+            paths (list): Created or modified files/folders
+        
+        Returns:
+            bool: True if the server accepted the update
+        """
+        # Too many single files, send their folders instead
+        if len(paths) > MAX_UPDATED_PATHS:
+            paths = sorted({os.path.dirname(path) for path in paths})
+
+        url = f"{self.base_url}/Library/Media/Updated"
+        headers = {
+            'X-Emby-Token': self.api_key,
+            'Content-Type': 'application/json'
+        }
+        body = {
+            'Updates': [{'Path': path, 'UpdateType': 'Created'} for path in paths]
+        }
+
+        try:
+            response = client().post(url, headers=headers, json=body, timeout=10)
+            response.raise_for_status()
+            l.log("jellyfin_notifier", f"{len(paths)} updated paths sent to {self.server_type.capitalize()}")
+            return True
+        except requests.exceptions.RequestException as e:
+            l.log("jellyfin_notifier", f"Media updated endpoint not available ({e}), refreshing library")
+            return False
+
+    def record(self, path):
+        """
+        Remember a written file, the server is notified once by the flush()
+        at the end of the run
+        """
+        if not self.enabled or not path:
+            return
+        with self.lock:
+            self.pending.add(path)
+
+    def flush(self):
+        """
+        Send every recorded path in one notification, nothing is sent if no
+        file was written
+        
+        Returns:
+            bool: True if a notification was sent
+        """
+        with self.lock:
+            paths = sorted(self.pending)
+            self.pending.clear()
+
+        if not self.enabled or not paths:
+            return False
+
+        return self.media_updated(paths) or self.scan_library()
     
     def notify_new_content(self, content_path=None):
         """
         Notify Jellyfin/Emby about new content
-        This is a convenience method that triggers a library scan
+        Debounced: the paths are coalesced and sent together by flush()
         
         Args:
-            content_path (str, optional): Path to the new content (for logging purposes)
+            content_path (str, optional): Path to the new content
         
         Returns:
-            bool: True if notification was successful, False otherwise
+            bool: True if the content was recorded, False otherwise
         """
         if not self.enabled:
             return False
         
         if content_path:
-            l.log("jellyfin_notifier", f"New content added: {content_path}")
-        
-        return self.scan_library()
+            self.record(content_path)
+        return True
+
+
+def get_notifier(config):
+    """
+    Shared notifier for a server/library, so every plugin run coalesces its
+    notifications in one place. Jobs flushing on their own schedule (the
+    Twitch live watch) create their own JellyfinNotifier instead, their
+    flush() would send the paths of a run still in progress
+    """
+    key = (
+        str(config.get('jellyfin_integration', 'False')).lower(),
+        config.get('jellyfin_base_url', '').rstrip('/'),
+        config.get('jellyfin_api_key', ''),
+        config.get('jellyfin_library_name', '')
+    )
+    with _lock:
+        notifier = _notifiers.get(key)
+        if notifier is None:
+            notifier = JellyfinNotifier(config)
+            _notifiers[key] = notifier
+        return notifier
 
 
 # Convenience function for quick usage
@@ -167,5 +260,6 @@ def notify_jellyfin(config, content_path=None):
     Returns:
         bool: True if notification was successful, False otherwise
     """
-    notifier = JellyfinNotifier(config)
-    return notifier.notify_new_content(content_path)
+    notifier = get_notifier(config)
+    notifier.notify_new_content(content_path)
+    return notifier.flush()
@@ -0,0 +1,8 @@
+"""
+Media Model Module
+Compact records shared by all plugins for videos, episodes and their series
+"""
+
+from .media import MediaItem, Series
+
+__all__ = ['MediaItem', 'Series']
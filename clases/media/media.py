@@ -0,0 +1,101 @@
+"""
+Media records
+__slots__ classes used instead of per-plugin dicts and split strings
+"""
+
+import sys
+import zlib
+
+# Descriptions longer than this are kept zlib-compressed until read
+COMPRESS_DESCRIPTION_OVER = 256
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class MediaItem:
+    """
+    One playable item (video, VOD, episode)
+
+    platform, channel_id, uploader and season_name repeat across thousands of
+    items of the same channel or series, so they are interned. The description
+    is the only large field and is stored compressed until it is read.
+    """
+    __slots__ = (
+        'platform', 'media_id', 'title', 'upload_date', 'thumbnail',
+        'channel_id', 'uploader', 'season_id', 'season', 'season_name',
+        'episode', 'url', 'audio', '_description'
+    )
+
+    def __init__(self, platform, media_id, title=None, upload_date=None,
+                 thumbnail=None, description=None, channel_id=None,
+                 uploader=None, season_id=None, season=None, season_name=None,
+                 episode=None, url=None, audio=False):
+        self.platform = _intern(platform)
+        self.media_id = media_id
+        self.title = title
+        self.upload_date = upload_date
+        self.thumbnail = thumbnail
+        self.channel_id = _intern(channel_id)
+        self.uploader = _intern(uploader)
+        self.season_id = _intern(season_id)
+        self.season = season
+        self.season_name = _intern(season_name)
+        self.episode = episode
+        self.url = url
+        self.audio = audio
+        self.description = description
+
+    @property
+    def id(self):
+        """ID used in the strm URL, audio variants carry the -audio suffix."""
+        return f"{self.media_id}-audio" if self.audio else self.media_id
+
+    @property
+    def description(self):
+        value = self._description
+        if isinstance(value, bytes):
+            return zlib.decompress(value).decode('utf-8')
+        return value
+
+    @description.setter
+    def description(self, value):
+        if isinstance(value, str) and len(value) > COMPRESS_DESCRIPTION_OVER:
+            value = zlib.compress(value.encode('utf-8'))
+        self._description = value
+
+    def as_audio(self):
+        item = self.copy()
+        item.audio = True
+        return item
+
+    def copy(self):
+        item = MediaItem.__new__(MediaItem)
+        for slot in MediaItem.__slots__:
+            setattr(item, slot, getattr(self, slot))
+        return item
+
+    def __repr__(self):
+        return f"MediaItem({self.platform}, {self.id!r}, {self.title!r})"
+
+
+class Series:
+    """A channel, playlist or show grouping MediaItems (tvshow.nfo data)."""
+    __slots__ = (
+        'platform', 'series_id', 'name', 'url', 'description',
+        'poster', 'landscape'
+    )
+
+    def __init__(self, platform, series_id, name=None, url=None,
+                 description=None, poster=None, landscape=None):
+        self.platform = _intern(platform)
+        self.series_id = _intern(series_id)
+        self.name = _intern(name)
+        self.url = url
+        self.description = description
+        self.poster = poster
+        self.landscape = landscape
+
+    def __repr__(self):
+        return f"Series({self.platform}, {self.series_id!r}, {self.name!r})"
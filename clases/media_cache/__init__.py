@@ -0,0 +1,8 @@
+"""
+Media Cache Module
+Index of the media files downloaded to ./temp
+"""
+
+from .media_cache import MediaCache, media_cache, SIDECAR_NAME, PARTIAL, COMPLETE
+
+__all__ = ['MediaCache', 'media_cache', 'SIDECAR_NAME', 'PARTIAL', 'COMPLETE']
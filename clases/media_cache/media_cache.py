@@ -0,0 +1,176 @@
+"""
+Media cache index
+In-memory map of the media files kept in ./temp, persisted to a small sidecar
+file. Lookups by media ID are O(1) instead of listing the folder on every
+request.
+"""
+
+import json
+import os
+import threading
+import time
+from clases.log import log as l
+
+SIDECAR_NAME = 'media_cache.index'
+
+PARTIAL = 'partial'
+COMPLETE = 'complete'
+
+
+class MediaCache:
+    def __init__(self, temp_dir):
+        """
+        Args:
+            temp_dir (str): Folder holding the media files and the sidecar
+        """
+        self.temp_dir = temp_dir
+        self.sidecar = os.path.join(temp_dir, SIDECAR_NAME)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    @staticmethod
+    def key(media_id, variant=''):
+        return f'{media_id}|{variant}' if variant else str(media_id)
+
+    def load(self):
+        if not os.path.exists(self.sidecar):
+            return
+        try:
+            with open(self.sidecar, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+        except (ValueError, OSError) as e:
+            l.log("media_cache", f"Unable to read {self.sidecar}: {e}")
+            return
+
+        # Partial files of a previous run can't be resumed by their writer
+        self.entries = {
+            key: entry for key, entry in entries.items()
+            if entry.get('state') == COMPLETE and os.path.exists(entry.get('path', ''))
+        }
+
+    def save(self, force=False):
+        with self.lock:
+            if not (self.dirty or force):
+                return
+            data = json.dumps(self.entries)
+            self.dirty = False
+        try:
+            with open(self.sidecar, 'w', encoding='utf-8') as file:
+                file.write(data)
+        except OSError as e:
+            l.log("media_cache", f"Unable to write {self.sidecar}: {e}")
+
+    def put(self, media_id, path, variant='', state=COMPLETE, size=None):
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+        now = time.time()
+        key = self.key(media_id, variant)
+        with self.lock:
+            entry = self.entries.get(key, {'hits': 0, 'created': now})
+            entry.update({
+                'media_id': media_id,
+                'variant': variant,
+                'path': path,
+                'size': size,
+                'state': state,
+                'last_access': now
+            })
+            self.entries[key] = entry
+            self.dirty = True
+        return entry
+
+    def get(self, media_id, variant='', state=COMPLETE):
+        """
+        Entry of media_id/variant whose file still exists, None otherwise.
+        A hit updates the last access time and hit count.
+        """
+        key = self.key(media_id, variant)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry and (state is None or entry['state'] == state) and os.path.exists(entry['path']):
+            with self.lock:
+                entry['last_access'] = time.time()
+                entry['hits'] += 1
+                self.hits += 1
+                self.dirty = True
+            return entry
+
+        with self.lock:
+            self.misses += 1
+            if entry and not os.path.exists(entry['path']):
+                self.entries.pop(key, None)
+                self.dirty = True
+        return None
+
+    def path(self, media_id, variant='', state=COMPLETE):
+        entry = self.get(media_id, variant, state)
+        return entry['path'] if entry else None
+
+    def contains(self, media_id):
+        """True if any variant of media_id is cached (complete or being written)."""
+        prefix = f'{media_id}|'
+        with self.lock:
+            return any(
+                key == str(media_id) or key.startswith(prefix)
+                for key in self.entries
+            )
+
+    def remove(self, media_id, variant=''):
+        with self.lock:
+            entry = self.entries.pop(self.key(media_id, variant), None)
+            if entry:
+                self.dirty = True
+        return entry
+
+    def paths(self):
+        with self.lock:
+            return {entry['path'] for entry in self.entries.values()}
+
+    def expired(self, keep_complete, keep_partial):
+        """
+        Entries whose file should be removed
+
+        Args:
+            keep_complete (int): Seconds a complete file is kept after its last access
+            keep_partial (int): Seconds a partial file is kept without being written
+        """
+        now = time.time()
+        result = []
+        with self.lock:
+            entries = list(self.entries.values())
+        for entry in entries:
+            if entry['state'] == COMPLETE:
+                if entry['last_access'] < now - keep_complete:
+                    result.append(entry)
+            else:
+                try:
+                    modified = os.path.getmtime(entry['path'])
+                except OSError:
+                    modified = 0
+                if modified < now - keep_partial:
+                    result.append(entry)
+        return result
+
+    def stats(self):
+        with self.lock:
+            entries = list(self.entries.values())
+            hits = self.hits
+            misses = self.misses
+        return {
+            'files': len(entries),
+            'complete': sum(1 for e in entries if e['state'] == COMPLETE),
+            'partial': sum(1 for e in entries if e['state'] == PARTIAL),
+            'bytes': sum(e['size'] for e in entries),
+            'hits': hits,
+            'misses': misses
+        }
+
+
+media_cache = MediaCache(os.path.join(os.getcwd(), 'temp'))
@@ -5,6 +5,7 @@ from PIL import Image
 from io import BytesIO
 from clases.folders import folders as f
 from clases.log import log as l
+from clases.http_client import client
 
 class nfo:
     def __init__(self, nfo_type, nfo_path, nfo_data):
@@ -59,7 +60,7 @@ class nfo:
         
         try:
             l.log("nfo", f"Attempting to download image from: {url}")
-            response = requests.get(url, timeout=10)
+            response = client().get(url, timeout=10)
             response.raise_for_status()  # Check if the request was successful
             
             # Convertir a PNG
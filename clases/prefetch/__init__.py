@@ -0,0 +1,8 @@
+"""
+Prefetch Module
+Warms the next episode of whatever is playing on the media server
+"""
+
+from .prefetch import PrefetchEngine, Policy, BandwidthBudget, JellyfinSessions, from_config, on_webhook, webhook_authorized
+
+__all__ = ['PrefetchEngine', 'Policy', 'BandwidthBudget', 'JellyfinSessions', 'from_config', 'on_webhook', 'webhook_authorized']
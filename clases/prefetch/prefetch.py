@@ -0,0 +1,412 @@
+"""
+Prefetch engine
+Watches what is being played on the media server and warms the next item of
+the season before the player asks for it. What "warming" means depends on the
+plugin serving the item (see Policy).
+"""
+
+import hmac
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from cachetools import TTLCache
+from clases.config import config as c
+from clases.http_client import client
+from clases.log import log as l
+
+## -- POLICIES
+# resolve:  GET /<plugin>/warm/<id>?mode=resolve, the plugin resolves and
+#           caches the upstream URL/probe without reading media
+# bytes:    read the first max_bytes of the strm URL (manifest, first segments,
+#           first MB of a download)
+# download: GET /<plugin>/warm/<id>?mode=download, the plugin queues the
+#           download and answers right away
+# Plugins without a warm route have nothing to resolve or download ahead
+RESOLVE = 'resolve'
+BYTES = 'bytes'
+DOWNLOAD = 'download'
+OFF = 'off'
+
+
+class Policy:
+    __slots__ = ('mode', 'max_bytes')
+
+    def __init__(self, mode=RESOLVE, max_bytes=8 * 1024 * 1024):
+        self.mode = mode
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_config(cls, config):
+        """Policy from the prefetch_policy / prefetch_mb keys of a plugin config."""
+        mode = str(config.get('prefetch_policy', RESOLVE)).lower()
+        if mode not in (RESOLVE, BYTES, DOWNLOAD, OFF):
+            mode = RESOLVE
+        try:
+            max_bytes = int(config.get('prefetch_mb', 8)) * 1024 * 1024
+        except (TypeError, ValueError):
+            max_bytes = 8 * 1024 * 1024
+        return cls(mode, max_bytes)
+
+
+def plugin_policy(plugin):
+    """Policy declared in ./plugins/<plugin>/config.json."""
+    config = c.config(f'./plugins/{plugin}/config.json').get_config() or {}
+    return Policy.from_config(config)
+
+
+def warm_url(url, mode):
+    """http://host/<plugin>/<method>/.../<id> -> http://host/<plugin>/warm/<id>?mode=<mode>"""
+    parsed = urlparse(url)
+    parts = parsed.path.strip('/').split('/')
+    if len(parts) < 3:
+        return None
+    return f"{parsed.scheme}://{parsed.netloc}/{parts[0]}/warm/{parts[-1]}?mode={mode}"
+## -- END
+
+WEBHOOK_EVENTS = ('PlaybackStart', 'PlaybackProgress')
+
+# Every engine created, webhooks are dispatched to all of them
+engines = []
+
+
+class BandwidthBudget:
+    def __init__(self, bytes_per_hour):
+        """
+        Args:
+            bytes_per_hour (int): Max bytes prefetched per hour, 0 for unlimited
+        """
+        self.bytes_per_hour = bytes_per_hour
+        self.window_start = time.time()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def _roll(self):
+        if time.time() - self.window_start >= 3600:
+            self.window_start = time.time()
+            self.used = 0
+
+    def remaining(self):
+        with self.lock:
+            self._roll()
+            if not self.bytes_per_hour:
+                return float('inf')
+            return max(0, self.bytes_per_hour - self.used)
+
+    def consume(self, size):
+        with self.lock:
+            self._roll()
+            self.used += size
+
+
+class JellyfinSessions:
+    def __init__(self, base_url, api_key, user_id, timeout=10, season_ttl=15 * 60):
+        """Media server adapter for Jellyfin/Emby."""
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.user_id = user_id
+        self.timeout = timeout
+        # Episode IDs of each season, a whole season is watched in a row
+        self.seasons = TTLCache(maxsize=256, ttl=season_ttl)
+        self.lock = threading.Lock()
+        self.session = client()
+        self.headers = {'X-Emby-Token': api_key}
+
+    def get(self, path, **params):
+        response = self.session.get(f'{self.base_url}{path}', params=params, headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def playing(self):
+        """Now playing episodes of every active session."""
+        items = []
+        for session in self.get('/Sessions'):
+            item = session.get('NowPlayingItem')
+            if item and item.get('Type') == 'Episode':
+                items.append(item)
+        return items
+
+    def season_episodes(self, series_id, season_id):
+        with self.lock:
+            ids = self.seasons.get(season_id)
+        if ids is None:
+            episodes = self.get(
+                f"/Shows/{series_id}/Episodes",
+                seasonId=season_id,
+                userId=self.user_id,
+                Fields='Id'
+            ).get('Items', [])
+            ids = [episode['Id'] for episode in episodes]
+            with self.lock:
+                self.seasons[season_id] = ids
+        return ids
+
+    def next_item(self, item):
+        """Episode after item in its season, None if it is the last one."""
+        if not item.get('SeasonId'):
+            # Webhooks of some servers only carry the item ID
+            item = self.get(f"/Users/{self.user_id}/Items/{item['Id']}")
+        ids = self.season_episodes(item.get('SeriesId'), item.get('SeasonId'))
+        if item['Id'] in ids:
+            index = ids.index(item['Id'])
+            if index < len(ids) - 1:
+                return {'Id': ids[index + 1]}
+        return None
+
+    def item_path(self, item_id):
+        """Path of an item, for strm files it is the URL inside them."""
+        details = self.get(f'/Users/{self.user_id}/Items/{item_id}')
+        sources = details.get('MediaSources') or [{}]
+        return sources[0].get('Path', '')
+
+
+class PrefetchEngine:
+    def __init__(self, server, policies=None, budget_bytes_per_hour=0,
+                 poll_interval=60, workers=2, default_policy=None,
+                 max_poll_interval=15 * 60):
+        """
+        Args:
+            server: Media server adapter (playing, next_item, item_path)
+            policies (dict): plugin name -> Policy. Plugins not listed use
+                plugin_policy(plugin)
+            budget_bytes_per_hour (int): Bandwidth budget, 0 for unlimited
+            poll_interval (int): Seconds between session polls while
+                something is playing, 0 disables polling (webhook input only)
+            workers (int): Concurrent prefetches
+            default_policy (Policy): Policy of plugins not in policies,
+                None reads it from the plugin config
+            max_poll_interval (int): Polling backs off up to this interval
+                while nothing plays or webhooks are arriving
+        """
+        self.server = server
+        self.policies = dict(policies or {})
+        self.default_policy = default_policy
+        self.budget = BandwidthBudget(budget_bytes_per_hour)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(max_poll_interval, poll_interval)
+        self.last_webhook = 0
+        self.wake = threading.Event()
+        # Items being played that were already handled, progress events repeat every few seconds
+        self.playing = TTLCache(maxsize=1000, ttl=10 * 60)
+        # Items being warmed right now
+        self.pending = set()
+        self.slots = threading.Semaphore(workers)
+        # Items already prefetched recently, one prefetch per item
+        self.done = TTLCache(maxsize=1000, ttl=60 * 60)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.session = client()
+        engines.append(self)
+
+    def policy_for(self, url):
+        """(plugin, Policy) for a strm URL like http://host:port/<plugin>/<mode>/<id>."""
+        parts = urlparse(url).path.strip('/').split('/')
+        plugin = parts[0] if parts and parts[0] else None
+        if not plugin:
+            return None, None
+        with self.lock:
+            if plugin not in self.policies:
+                self.policies[plugin] = self.default_policy or plugin_policy(plugin)
+            return plugin, self.policies[plugin]
+
+    def on_playing(self, item):
+        """Entry point for polls and webhooks: item is the media server item being played."""
+        item_id = item.get('Id')
+        with self.lock:
+            if item_id in self.playing or item_id in self.pending:
+                return
+            self.pending.add(item_id)
+        threading.Thread(target=self.warm, args=(item,), daemon=True).start()
+
+    def warm(self, item):
+        """
+        Prefetch the item after item. item is only marked as handled when that
+        worked, after an error the next poll or webhook tries again.
+        """
+        item_id = item.get('Id')
+        try:
+            try:
+                next_item = self.server.next_item(item)
+            except Exception as e:
+                l.log("prefetch", f"Unable to get the next item of {item_id}: {e}")
+                return
+
+            if next_item:
+                with self.lock:
+                    warmed = next_item['Id'] in self.done
+                if not warmed:
+                    if not self.prefetch_item(next_item['Id']):
+                        return
+                    with self.lock:
+                        self.done[next_item['Id']] = True
+
+            with self.lock:
+                self.playing[item_id] = True
+        finally:
+            with self.lock:
+                self.pending.discard(item_id)
+
+    def prefetch_item(self, item_id):
+        """True if the item was warmed, or there is nothing to warm."""
+        try:
+            url = self.server.item_path(item_id)
+        except Exception as e:
+            l.log("prefetch", f"Unable to get the path of {item_id}: {e}")
+            return False
+        if not url.startswith('http'):
+            return True
+        return self.prefetch(url)
+
+    def prefetch(self, url):
+        """True if url was warmed or its policy is off."""
+        plugin, policy = self.policy_for(url)
+        if not policy or policy.mode == OFF:
+            return True
+
+        if self.budget.remaining() <= 0:
+            l.log("prefetch", f"Bandwidth budget spent, skipping {url}")
+            return False
+
+        with self.slots:
+            l.log("prefetch", f"Prefetching ({plugin}, {policy.mode}) {url}")
+            try:
+                if policy.mode == BYTES:
+                    return self.read_bytes(url, policy.max_bytes)
+                return self.warm_plugin(url, policy.mode)
+            except requests.RequestException as e:
+                l.log("prefetch", f"Error prefetching {url}: {e}")
+                return False
+
+    def warm_plugin(self, url, mode):
+        """
+        Ask the plugin to resolve or queue the download of url. The strm URL
+        itself is never opened: for some plugins that starts a full download.
+        """
+        target = warm_url(url, mode)
+        if not target:
+            return True
+        response = self.session.get(target, timeout=60)
+        if response.status_code == 404:
+            # The plugin has no warm route, or nothing to warm for this item
+            return True
+        if response.status_code >= 400:
+            l.log("prefetch", f"Error prefetching {url}: HTTP {response.status_code}")
+            return False
+        # A queued download reports its expected size when the plugin knows it
+        try:
+            size = int((response.json() or {}).get('bytes') or 0)
+        except (ValueError, TypeError, AttributeError):
+            size = 0
+        self.budget.consume(size)
+        return True
+
+    def read_bytes(self, url, max_bytes):
+        limit = min(max_bytes, self.budget.remaining())
+        read = 0
+        with self.session.get(url, stream=True, timeout=60) as response:
+            if response.status_code >= 400:
+                l.log("prefetch", f"Error prefetching {url}: HTTP {response.status_code}")
+                return False
+            for chunk in response.iter_content(64 * 1024):
+                read += len(chunk)
+                if read >= limit:
+                    break
+        self.budget.consume(read)
+        return True
+
+    def on_webhook(self, payload):
+        """
+        Jellyfin Webhook plugin event (PlaybackStart / PlaybackProgress)
+
+        Returns:
+            bool: True if the event was used
+        """
+        if payload.get('NotificationType') not in WEBHOOK_EVENTS:
+            return False
+        if payload.get('ItemType', 'Episode') != 'Episode' or not payload.get('ItemId'):
+            return False
+
+        self.last_webhook = time.time()
+        item = {
+            'Id': payload['ItemId'],
+            'SeriesId': payload.get('SeriesId'),
+            'SeasonId': payload.get('SeasonId'),
+            'Type': 'Episode'
+        }
+        self.on_playing(item)
+        return True
+
+    def poll(self):
+        """Poll the sessions once, returns the number of items playing."""
+        try:
+            items = self.server.playing()
+        except Exception as e:
+            l.log("prefetch", f"Unable to get sessions: {e}")
+            return 0
+        for item in items:
+            self.on_playing(item)
+        return len(items)
+
+    def next_interval(self, interval, playing):
+        # Webhooks already report playback, polling is only a safety net
+        if time.time() - self.last_webhook < self.max_poll_interval:
+            return self.max_poll_interval
+        if playing:
+            return self.poll_interval
+        # Nobody watching, back off
+        return min(interval * 2, self.max_poll_interval)
+
+    def run(self, stop_event=None):
+        stop_event = stop_event or self.stop_event
+        if not self.poll_interval:
+            return
+        l.log("prefetch", f"Prefetch engine started, polling every {self.poll_interval}s (up to {self.max_poll_interval}s when idle)")
+        interval = self.poll_interval
+        while not stop_event.is_set() and not self.stop_event.is_set():
+            interval = self.next_interval(interval, self.poll())
+            self.wake.wait(interval)
+            self.wake.clear()
+        l.log("prefetch", "Prefetch engine stopped")
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake.set()
+
+
+def webhook_authorized(config, secret):
+    """
+    True if secret matches ytdlp2strm_prefetch_webhook_secret. The webhook
+    can start downloads, without a secret configured it is refused.
+    """
+    expected = str(config.get('ytdlp2strm_prefetch_webhook_secret', '') or '')
+    if not expected:
+        return False
+    return hmac.compare_digest(expected.encode('utf-8'), str(secret or '').encode('utf-8'))
+
+
+def on_webhook(payload):
+    """Send a media server webhook event to every running engine."""
+    return any([engine.on_webhook(payload) for engine in engines])
+
+
+def from_config(config):
+    """
+    Engine from the general config, None when ytdlp2strm_prefetch is disabled
+
+    Keys: ytdlp2strm_prefetch, ytdlp2strm_prefetch_server_url,
+    ytdlp2strm_prefetch_api_key, ytdlp2strm_prefetch_user_id,
+    ytdlp2strm_prefetch_poll_interval, ytdlp2strm_prefetch_budget_mb
+    (ytdlp2strm_prefetch_webhook_secret is checked by the webhook route)
+    """
+    if str(config.get('ytdlp2strm_prefetch', 'False')).lower() != 'true':
+        return None
+    base_url = config.get('ytdlp2strm_prefetch_server_url', '')
+    api_key = config.get('ytdlp2strm_prefetch_api_key', '')
+    if not base_url or not api_key:
+        l.log("prefetch", "Warning: ytdlp2strm_prefetch enabled but server url or api key is empty")
+        return None
+    return PrefetchEngine(
+        JellyfinSessions(base_url, api_key, config.get('ytdlp2strm_prefetch_user_id', '')),
+        budget_bytes_per_hour=int(config.get('ytdlp2strm_prefetch_budget_mb', 0)) * 1024 * 1024,
+        poll_interval=int(config.get('ytdlp2strm_prefetch_poll_interval', 60))
+    )
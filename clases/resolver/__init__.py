@@ -0,0 +1,8 @@
+"""
+Resolver Module
+Stable local stream URLs that survive upstream URL expiry
+"""
+
+from .resolver import StreamResolver, url_expiry, parse_byte_range, parse_content_range, response_range
+
+__all__ = ['StreamResolver', 'url_expiry', 'parse_byte_range', 'parse_content_range', 'response_range']
@@ -0,0 +1,257 @@
+"""
+Stable stream URLs
+Maps a media ID to its current signed upstream URL. Range requests are proxied
+to it, and when upstream answers 403/410 (expired signature) the URL is
+resolved again and the same range is retried, so players never see the
+expiry.
+"""
+
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+import requests
+from clases.log import log as l
+from clases.http_client import client
+
+EXPIRED_STATUS = (403, 410)
+
+# Headers forwarded from upstream to the player
+PASS_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'Last-Modified', 'ETag')
+
+
+def url_expiry(url, default_ttl):
+    """
+    Return the epoch when a signed URL expires
+
+    googlevideo URLs carry it as expire=<epoch> in the query or /expire/<epoch>/
+    in the path. Unknown URLs get default_ttl seconds.
+    """
+    parsed = urlparse(url)
+    value = parse_qs(parsed.query).get('expire', [None])[0]
+    if value is None and '/expire/' in parsed.path:
+        value = parsed.path.split('/expire/', 1)[1].split('/', 1)[0]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return time.time() + default_ttl
+
+
+class StreamResolver:
+    def __init__(self, name, resolve, proxy_url="", timeout=15,
+                 default_ttl=5 * 60 * 60, refresh_margin=10 * 60):
+        """
+        Args:
+            name (str): Plugin name, used in logs
+            resolve (callable): resolve(media_id, refresh) returning the
+                upstream URL or None. refresh=True must skip any cached probe.
+            proxy_url (str): Optional upstream proxy
+            timeout (int): Upstream connect/read timeout in seconds
+            default_ttl (int): Lifetime of URLs without an expire parameter
+            refresh_margin (int): Seconds before expiry to refresh the URL in
+                the background
+        """
+        self.name = name
+        self.resolve = resolve
+        self.timeout = timeout
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self.urls = {}
+        self.lock = threading.Lock()
+        # One lock per media ID, concurrent requests share the same probe
+        self.id_locks = {}
+        self.refreshing = set()
+        self.metrics = {
+            'resolutions': 0,
+            're_resolutions': 0,
+            'background_refreshes': 0,
+            'expired_responses': 0,
+            'resumed_streams': 0,
+            'failures': 0
+        }
+
+        self.session = client(proxy_url)
+
+    def count(self, metric):
+        with self.lock:
+            self.metrics[metric] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.metrics, cached_urls=len(self.urls))
+
+    def _id_lock(self, media_id):
+        with self.lock:
+            return self.id_locks.setdefault(media_id, threading.Lock())
+
+    def _resolve(self, media_id, refresh, stale_url=None):
+        with self._id_lock(media_id):
+            # Another request may have refreshed it while we waited
+            with self.lock:
+                cached = self.urls.get(media_id)
+            if cached and cached[0] != stale_url and cached[1] > time.time():
+                return cached[0]
+
+            url = self.resolve(media_id, refresh)
+            if not url:
+                self.count('failures')
+                return None
+
+            with self.lock:
+                self.urls[media_id] = (url, url_expiry(url, self.default_ttl))
+            self.count('re_resolutions' if refresh else 'resolutions')
+            return url
+
+    def _refresh_in_background(self, media_id, stale_url):
+        with self.lock:
+            if media_id in self.refreshing:
+                return
+            self.refreshing.add(media_id)
+
+        def run():
+            try:
+                self._resolve(media_id, True, stale_url)
+                self.count('background_refreshes')
+            finally:
+                with self.lock:
+                    self.refreshing.discard(media_id)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def current(self, media_id):
+        """Upstream URL for media_id, refreshed in the background when close to expiring."""
+        with self.lock:
+            cached = self.urls.get(media_id)
+
+        if cached:
+            url, expires = cached
+            now = time.time()
+            if expires > now:
+                if expires - now < self.refresh_margin:
+                    self._refresh_in_background(media_id, url)
+                return url
+
+        return self._resolve(media_id, bool(cached), cached[0] if cached else None)
+
+    def open(self, media_id, range_header=None):
+        """
+        GET the upstream URL of media_id, re-resolving once if it has expired
+
+        Returns:
+            requests.Response or None
+        """
+        url = self.current(media_id)
+        if not url:
+            return None
+
+        headers = {'Range': range_header} if range_header else {}
+        for attempt in range(2):
+            try:
+                response = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+            except requests.RequestException as e:
+                l.log(self.name, f"Upstream error for {media_id}: {e}")
+                response = None
+
+            if response is not None and response.status_code not in EXPIRED_STATUS:
+                return response
+
+            if response is not None:
+                self.count('expired_responses')
+                response.close()
+
+            if attempt == 0:
+                l.log(self.name, f"Upstream URL of {media_id} rejected, resolving again")
+                url = self._resolve(media_id, True, url)
+                if not url:
+                    return None
+
+        self.count('failures')
+        return None
+
+    def iter_content(self, media_id, response, range_header=None, chunk_size=64 * 1024):
+        """
+        Yield the body of an upstream response. If the connection drops or the
+        URL expires mid-transfer, continue from the last byte sent up to the
+        end of the range asked for, never past it.
+
+        Args:
+            range_header (str): Range header the response answers
+        """
+        start, end = response_range(response, range_header)
+        sent = 0
+        while response is not None:
+            try:
+                for chunk in response.iter_content(chunk_size):
+                    sent += len(chunk)
+                    yield chunk
+                # A dropped connection may also look like a clean end
+                if end is None or start is None or start + sent > end:
+                    return
+                l.log(self.name, f"Stream of {media_id} ended early at {start + sent}")
+            except requests.RequestException as e:
+                l.log(self.name, f"Stream of {media_id} interrupted at {start + sent}: {e}")
+            finally:
+                response.close()
+
+            if start is None:
+                l.log(self.name, f"Stream of {media_id} can't be resumed, unknown offset")
+                return
+            if end is not None and start + sent > end:
+                return
+            self.count('resumed_streams')
+            response = self.open(media_id, f"bytes={start + sent}-{'' if end is None else end}")
+            if response is not None and response.status_code != 206:
+                # Upstream ignored the range, we can't resume without duplicating bytes
+                response.close()
+                response = None
+
+
+def parse_byte_range(range_header):
+    """
+    (start, end) of a 'bytes=start-end' header, end inclusive or None when
+    open. A suffix range 'bytes=-N' (the last N bytes) gives (None, N).
+
+    Returns:
+        tuple: None when missing or unparseable
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    first, _, last = range_header[6:].split(',')[0].strip().partition('-')
+    try:
+        if not first:
+            return None, int(last)
+        return int(first), int(last) if last else None
+    except ValueError:
+        return None
+
+
+def parse_content_range(header):
+    """(start, end) of a 'bytes start-end/total' Content-Range, None if unparseable."""
+    if not header or not header.startswith('bytes '):
+        return None
+    span = header[6:].split('/', 1)[0]
+    first, _, last = span.partition('-')
+    try:
+        return int(first), int(last)
+    except ValueError:
+        return None
+
+
+def response_range(response, range_header=None):
+    """
+    (start, end) of the file bytes an upstream response carries. The
+    Content-Range of a 206 is authoritative, it also resolves suffix ranges.
+    A 200 is the whole file, Content-Length gives its end. start is None
+    when it can't be known.
+    """
+    if response is None:
+        return None, None
+    if response.status_code == 206:
+        served = parse_content_range(response.headers.get('Content-Range'))
+        if served:
+            return served
+        requested = parse_byte_range(range_header)
+        if requested and requested[0] is not None:
+            return requested
+        return None, None
+    length = response.headers.get('Content-Length', '')
+    return 0, int(length) - 1 if length.isdigit() else None
@@ -1,17 +1,10 @@
 import os
+import json
 import subprocess
 import shlex
-import requests
-import time
 import threading
 from clases.log import log as l
 
-# Inicializa un objeto Lock para el control de concurrencia
-preload_lock = threading.Lock()
-
-# Variable de cierre para controlar la ejecución concurrente de la función preload_video
-is_preloading = False
-
 
 class worker:
     def __init__(self, command):
@@ -25,10 +18,66 @@ class worker:
             capture_output=True,  # Capturamos stdout y stderr
             text=True
         )
-        if process.stderr:
-            if not 'The channel is not currently live' in process.stderr and not '[twitch:stream] videos: videos does not exist' in process.stderr:
-                l.log("worker", process.stderr)
+        self.log_stderr(process.stderr)
         return process.stdout
+
+    def log_stderr(self, stderr):
+        if stderr:
+            if not 'The channel is not currently live' in stderr and not '[twitch:stream] videos: videos does not exist' in stderr:
+                l.log("worker", stderr)
+
+    def pipe(self):
+        return subprocess.Popen(
+            self.command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+
+    def stream_lines(self):
+        """Yield stdout lines as the process writes them instead of waiting for it to exit."""
+        process = subprocess.Popen(
+            self.command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1
+        )
+        # stderr se lee en otro hilo para que no se llene el pipe y bloquee el proceso
+        stderr_lines = []
+        stderr_thread = threading.Thread(
+            target=lambda: stderr_lines.extend(process.stderr),
+            daemon=True
+        )
+        stderr_thread.start()
+        try:
+            for line in process.stdout:
+                yield line.rstrip('\n')
+        finally:
+            # The consumer may stop early, don't leave the process running
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            stderr_thread.join(timeout=5)
+            self.log_stderr(''.join(stderr_lines))
+
+    def stream_json(self):
+        """Yield one parsed object per JSON line of stdout (yt-dlp --dump-json / -j)."""
+        for line in self.stream_lines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                l.log("worker", f"Skipping non JSON line: {line[:200]}")
+                continue
+            # Callers read fields with .get(), a bare value or list is not an entry
+            if isinstance(data, dict):
+                yield data
+            else:
+                l.log("worker", f"Skipping JSON line that is not an object: {line[:200]}")
     
     def shell(self):
         process = subprocess.run(
@@ -74,49 +123,3 @@ class worker:
                 l.log("worker", log_text)
         rc = process.poll()
         return rc
-
-    def preload(self):
-        global is_preloading
-
-        current_dir = os.getcwd()
-
-        # Construyes la ruta hacia la carpeta 'temp' dentro del directorio actual
-        temp_dir = os.path.join(current_dir, 'temp')
-
-        # Intenta adquirir el Lock
-        if not preload_lock.acquire(blocking=False):
-            # Si no se puede adquirir el Lock, significa que otra instancia ya está ejecutando preload_video
-            return
-        
-        # Verifica si ya se está ejecutando la función
-        if is_preloading:
-            preload_lock.release()  # No olvides liberar el Lock si decides no proceder
-            return
-        
-        is_preloading = True  # Marca el inicio de la ejecución
-
-        def download_and_cancel():
-            try:
-                with requests.get(self.command, stream=True) as r:
-                    time.sleep(5)  # Esperamos 5 segundos y luego cancelamos la solicitud
-            except:
-                log_text = ("error on preloading {}".format(self.command))
-                l.log("worker", log_text)
-
-        video_id = self.command.split('_')[-1]
-
-        isin = False
-        # Iterar sobre todos los archivos en la carpeta 'temp'
-        for filename in os.listdir(temp_dir):
-            # Comprobar si el crunchroll_id está en el nombre del archivo
-            if video_id in filename:
-                isin = True
-                # Si necesitas hacer algo más que imprimir, este es el lugar.
-                # Por ejemplo, podrías romper el bucle con 'break' si solo te interesa saber si al menos uno existe
-
-        if not isin:
-            preload_thread = threading.Thread(target=download_and_cancel)
-            preload_thread.start()
-
-        is_preloading = False  # Restablece el estado
-        preload_lock.release()  # Libera el Lock
\ No newline at end of file
@@ -10,6 +10,7 @@ from clases.config import config as c
 from clases.folders import folders as f
 from clases.log import log as l
 from clases.cron import cron as cron
+from clases import prefetch
 
 # Variables globales para controlar el reinicio y parada
 restart_flag = False
@@ -78,6 +79,25 @@ if __name__ == "__main__":
     log_text = (" * Clean old videos thread started")
     l.log("main", log_text)
 
+    # Precarga del siguiente episodio de lo que se reproduce en el media server
+    prefetch_engine = prefetch.from_config(ytdlp2strm_config)
+    if prefetch_engine:
+        thread_prefetch = Thread(target=prefetch_engine.run, args=(stop_event,))
+        thread_prefetch.daemon = True
+        thread_prefetch.start()
+        log_text = (" * Prefetch thread started")
+        l.log("main", log_text)
+
+    # Vigilancia ligera de directos de Twitch, separada de la sincronización completa
+    from plugins.twitch import live as twitch_live
+    live_watcher = twitch_live.from_config()
+    if live_watcher:
+        thread_live_watch = Thread(target=live_watcher.run, args=(stop_event,))
+        thread_live_watch.daemon = True
+        thread_live_watch.start()
+        log_text = (" * Twitch live watch thread started")
+        l.log("main", log_text)
+
     # Crear un proceso para la aplicación Flask
     port = ytdlp2strm_config['ytdlp2strm_port']
     flask_thread = Thread(target=run_flask_app, args=(stop_event, port))
@@ -0,0 +1,124 @@
+"""
+Crunchyroll catalog
+Series -> seasons -> episodes as last listed by multi-downloader-nx, with a
+fingerprint per season. Complete seasons are served from here until
+recheck_days pass, and only strm files not written yet go to the writer.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from clases.log import log as l
+
+DAY = 24 * 60 * 60
+
+
+def fingerprint(lines):
+    return hashlib.sha1(json.dumps(lines).encode('utf-8')).hexdigest()
+
+
+class Catalog:
+    def __init__(self, catalog_file, recheck_days=7, complete_after_days=30):
+        """
+        Args:
+            catalog_file (str): JSON file of the catalog
+            recheck_days (int): Days a complete season is not listed again
+            complete_after_days (int): The last season of a series counts as
+                complete when its episodes did not change for this long, the
+                others as soon as a newer season exists
+        """
+        self.catalog_file = catalog_file
+        self.recheck = recheck_days * DAY
+        self.complete_after = complete_after_days * DAY
+        self.lock = threading.Lock()
+        self.data = self.load()
+
+    def load(self):
+        if os.path.exists(self.catalog_file):
+            try:
+                with open(self.catalog_file, 'r', encoding='utf-8') as file:
+                    return json.load(file)
+            except (ValueError, OSError) as e:
+                l.log("crunchyroll", f"Unable to read catalog {self.catalog_file}: {e}")
+        return {}
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.data)
+        try:
+            with open(self.catalog_file, 'w', encoding='utf-8') as file:
+                file.write(data)
+        except OSError as e:
+            l.log("crunchyroll", f"Unable to write catalog {self.catalog_file}: {e}")
+
+    def series(self, series_id):
+        return self.data.setdefault(series_id, {'seasons': {}, 'written': []})
+
+    def cached_episodes(self, series_id, season_id, last):
+        """
+        Episode lines of a season that does not need to be listed again
+
+        Args:
+            last (bool): It is the last season of the series
+
+        Returns:
+            list: [(is_special, number, title)] or None to list it
+        """
+        with self.lock:
+            season = self.series(series_id)['seasons'].get(season_id)
+            if not season:
+                return None
+            now = time.time()
+            complete = not last or now - season['changed'] > self.complete_after
+            if not complete or now - season['checked'] > self.recheck:
+                return None
+            return [tuple(line) for line in season['episodes']]
+
+    def stored_episodes(self, series_id, season_id):
+        """Last known episode lines of a season, whatever their age."""
+        with self.lock:
+            season = self.series(series_id)['seasons'].get(season_id) or {}
+            return [tuple(line) for line in season.get('episodes', [])]
+
+    def seasons(self, series_id):
+        """Last known [(season_id, number, name)] of a series."""
+        with self.lock:
+            seasons = self.series(series_id)['seasons']
+            return [(season_id, season['number'], season['name']) for season_id, season in seasons.items()]
+
+    def update(self, series_id, season, lines):
+        """
+        Store a fresh listing of a season, returns True if it changed
+
+        Args:
+            season (tuple): (season_id, number, name)
+            lines (list): [(is_special, number, title)]
+        """
+        season_id, number, name = season
+        lines = [list(line) for line in lines]
+        digest = fingerprint(lines)
+        now = time.time()
+        with self.lock:
+            seasons = self.series(series_id)['seasons']
+            season = seasons.get(season_id)
+            changed = not season or season['fingerprint'] != digest
+            seasons[season_id] = {
+                'number': number,
+                'name': name,
+                'fingerprint': digest,
+                'episodes': lines,
+                'checked': now,
+                'changed': now if changed else season['changed']
+            }
+        return changed
+
+    def written(self, series_id):
+        """strm files already written for a series."""
+        with self.lock:
+            return set(self.series(series_id)['written'])
+
+    def set_written(self, series_id, paths):
+        with self.lock:
+            self.series(series_id)['written'] = sorted(paths)
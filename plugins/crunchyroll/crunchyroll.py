@@ -1,4 +1,4 @@
-from flask import send_file, redirect, stream_with_context, Response, abort
+from flask import send_file, redirect, stream_with_context, Response, abort, jsonify
 from utils.sanitize import sanitize
 import os
 import ffmpeg
@@ -9,7 +9,14 @@ from clases.worker import worker as w
 from clases.folders import folders as f
 from clases.nfo import nfo as n
 from clases.log import log as l
+from clases.media_cache import media_cache, PARTIAL
+from clases.downloads import DownloadQueue, DONE
+from clases.media import MediaItem
 from plugins.crunchyroll.jellyfin import daemon
+from plugins.crunchyroll.session import CrunchyrollSession, is_auth_error
+from plugins.crunchyroll.parser import read_lines, run_lines, parse_episode_line, parse_progress, output_files, SeasonList
+from plugins.crunchyroll.catalog import Catalog
+from concurrent.futures import ThreadPoolExecutor
 import subprocess
 import threading
 
@@ -23,21 +30,8 @@ class Crunchyroll:
             self.videos = self.get_videos()
     
     def authenticate(self):
-        """Autenticar con Crunchyroll usando multi-downloader-nx"""
-        auth_command = [
-            'node', multi_downloader_path,
-            '--service', 'crunchy',
-            '-u', crunchyroll_username,
-            '-p', crunchyroll_password,
-            '--auth'
-        ]
-        l.log("crunchyroll", "Authenticating with Crunchyroll...")
-        result = subprocess.run(auth_command, capture_output=True, text=True, stdin=subprocess.DEVNULL)
-        if result.returncode != 0:
-            l.log("crunchyroll", f"Auth error: {result.stderr}")
-            return False
-        l.log("crunchyroll", "Authentication successful")
-        return True
+        """Sesión compartida, solo hace login si no hay una válida"""
+        return session.ensure()
     
     def get_series_id(self):
         """Extraer el ID de la serie de la URL"""
@@ -59,9 +53,7 @@ class Crunchyroll:
         return None
     
     def get_videos(self):
-        """Obtener lista de episodios usando --series y parseando la salida"""
-        import time
-        
+        """Obtener lista de episodios: temporadas con --series y episodios de cada temporada en paralelo"""
         l.log("crunchyroll", "Fetching episodes from Crunchyroll...")
         
         # Autenticar
@@ -69,243 +61,139 @@ class Crunchyroll:
             return []
         
         series_id = self.get_series_id()
+        seasons = self.get_seasons(series_id)
+        if not seasons:
+            # Sin respuesta, se usa lo último que hay en el catálogo
+            seasons = catalog.seasons(series_id)
+        
+        # Las temporadas completas y revisadas hace poco salen del catálogo
+        last_season_id = seasons[-1][0] if seasons else None
+        season_episodes = [
+            catalog.cached_episodes(series_id, season[0], season[0] == last_season_id)
+            for season in seasons
+        ]
+        pending = [i for i, lines in enumerate(season_episodes) if lines is None]
+        l.log("crunchyroll", f"Found {len(seasons)} seasons, {len(seasons) - len(pending)} from the catalog, fetching episodes for {len(pending)}...")
+        
+        # Una consulta por temporada, como mucho season_workers a la vez
+        with ThreadPoolExecutor(max_workers=season_workers) as executor:
+            listings = executor.map(
+                lambda i: self.get_season_episodes(series_id, seasons[i][0]),
+                pending
+            )
+            for i, lines in zip(pending, listings):
+                # Una temporada sin episodios también se guarda, no se lista en cada ejecución
+                if lines is not None:
+                    if catalog.update(series_id, seasons[i], lines):
+                        l.log("crunchyroll", f"Season {seasons[i][0]} changed")
+                else:
+                    # Listado fallido, no se pisa el catálogo
+                    lines = catalog.stored_episodes(series_id, seasons[i][0])
+                season_episodes[i] = lines
+        catalog.save()
         
-        # PASO 1: Listar solo las temporadas (rápido, <30s)
+        # La numeración depende del orden de las temporadas
+        episodes = self.number_episodes(series_id, seasons, season_episodes)
+        l.log("crunchyroll", f"Found {len(episodes)} episodes total")
+        return episodes
+
+    def get_seasons(self, series_id):
+        """Lista de temporadas [(season_id, number, name)], deja de leer en cuanto la lista termina"""
         command = [
             'node', multi_downloader_path,
             '--service', 'crunchy',
             '--series', series_id,
             '--locale', valid_locale
         ]
-        
         self.set_proxy(command)
         l.log("crunchyroll", f"Getting seasons list for series: {series_id}")
-        l.log("crunchyroll", f"Command: {' '.join(command)}")
-        
-        # Ejecutar y matar después de 30 segundos (solo necesitamos la lista de temporadas)
-        import time
-        import threading
         
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            stdin=subprocess.PIPE,
-            bufsize=0,
-            encoding='utf-8',
-            errors='replace'
-        )
-        
-        # Enviar "0" para cancelar la selección
-        time.sleep(2)
-        try:
-            process.stdin.write("0\n")
-            process.stdin.flush()
-            process.stdin.close()
-        except:
+        season_list = SeasonList()
+        for _ in read_lines(command, season_list):
             pass
         
-        # Leer salida con timeout de 30 segundos
-        output_lines = []
-        error_lines = []
-        
-        def read_stream(stream, lines_list):
-            try:
-                for line in iter(stream.readline, ''):
-                    if not line:
-                        break
-                    lines_list.append(line)
-            except Exception as e:
-                l.log("crunchyroll", f"Error reading stream: {e}")
-        
-        stdout_thread = threading.Thread(target=read_stream, args=(process.stdout, output_lines))
-        stderr_thread = threading.Thread(target=read_stream, args=(process.stderr, error_lines))
-        
-        stdout_thread.start()
-        stderr_thread.start()
-        
-        # Esperar máximo 30 segundos
-        start_time = time.time()
-        timeout = 30
-        
-        while process.poll() is None:
-            elapsed = int(time.time() - start_time)
-            if elapsed > timeout:
-                l.log("crunchyroll", f"Stopping season list command after {timeout}s")
-                process.kill()
-                break
-            time.sleep(0.5)
-        
-        stdout_thread.join(timeout=5)
-        stderr_thread.join(timeout=5)
-        
-        output = ''.join(output_lines)
-        l.log("crunchyroll", f"Seasons list received ({len(output)} chars)")
+        # Una entrada por season_id, en el orden en que aparecen
+        seasons = list({season[0]: season for season in season_list.seasons}.values())
+        for season_id, season_number, season_name in seasons:
+            l.log("crunchyroll", f"Found season: {season_id} (S{season_number}) - {season_name[:50]}")
+        return seasons
+
+    def get_season_episodes(self, series_id, season_id):
+        """
+        Líneas de episodio [(is_special, number, title)] de una temporada,
+        [] si no tiene episodios y None si el listado falló
+        """
+        command = [
+            'node', multi_downloader_path,
+            '--service', 'crunchy',
+            '--series', series_id,
+            '-s', season_id,
+            '--locale', valid_locale
+        ]
+        self.set_proxy(command)
         
-        # Parsear la salida para extraer season_id y episodios
         episodes = []
-        current_season_id = None
-        current_season_number = None
-        current_season_name = None
-        
-        # Mapeo de season_id a información de temporada (para corregir nombres)
-        seasons_map = {}
-        
-        # Primera pasada: extraer información de todas las temporadas
-        for line in output.split('\n'):
-            line = line.strip()
-            if line.startswith('[S:') and ']' in line:
-                try:
-                    season_id = line[line.find('[S:')+3:line.find(']')]
-                    # Extraer nombre de temporada (después de ] y antes de (Season:)
-                    season_title = line[line.find(']')+1:].strip()
-                    if '(Season:' in season_title:
-                        season_title = season_title[:season_title.find('(Season:')].strip()
-                    
-                    # Extraer número de temporada
-                    season_num = "1"
-                    if '(Season:' in line:
-                        season_num_str = line[line.find('(Season:')+8:line.find(')', line.find('(Season:'))]
-                        season_num = season_num_str.strip()
-                    
-                    seasons_map[season_id] = {
-                        'number': season_num,
-                        'name': season_title
-                    }
-                    l.log("crunchyroll", f"Found season: {season_id} (S{season_num}) - {season_title[:50]}")
-                except Exception as e:
-                    l.log("crunchyroll", f"Error parsing season: {e}")
-        
-        l.log("crunchyroll", f"Found {len(seasons_map)} seasons, now fetching episodes for each...")
-        
-        # PASO 2: Para cada temporada, obtener sus episodios
+        output = []
+        try:
+            for line in read_lines(command):
+                output.append(line)
+                episode = parse_episode_line(line)
+                if episode:
+                    episodes.append(episode)
+        except Exception as e:
+            l.log("crunchyroll", f"Error fetching season {season_id}: {e}")
+            return None
+        # Sin salida (parado por inactividad) o sesión rechazada no es una temporada vacía
+        if not episodes and (not output or is_auth_error('\n'.join(output))):
+            l.log("crunchyroll", f"No listing for season {season_id}")
+            return None
+        return episodes
+
+    def number_episodes(self, series_id, seasons, season_episodes):
+        """MediaItems con numeración absoluta, por temporada y de especiales"""
         episodes = []
         specials_count = 0  # Contador global de especiales
         absolute_episode_number = 0  # Contador global de episodios (no especiales)
         season_episode_counts = {}  # Contador de episodios por season_number (para manejar temporadas duplicadas)
         
-        for season_id, season_info in seasons_map.items():
-            season_number = season_info['number']
-            season_name = season_info['name']
+        for (season_id, season_number, season_name), lines in zip(seasons, season_episodes):
+            # Usar el contador del season_number (no resetear si hay múltiples season_id con mismo número)
+            season_episode_counts.setdefault(season_number, 0)
+            episode_count_before = season_episode_counts[season_number]
             
-            # Inicializar contador para este season_number si no existe
-            if season_number not in season_episode_counts:
-                season_episode_counts[season_number] = 0
-            
-            l.log("crunchyroll", f"Fetching episodes for season {season_id} (S{season_number})...")
-            
-            # Comando para obtener episodios de una temporada específica
-            # Usar --series junto con -s para filtrar la temporada
-            command = [
-                'node', multi_downloader_path,
-                '--service', 'crunchy',
-                '--series', series_id,
-                '-s', season_id,
-                '--locale', valid_locale
-            ]
-            
-            self.set_proxy(command)
+            for is_special, ep_num, episode_title in lines:
+                if is_special:
+                    # Es un especial - va a carpeta Specials
+                    specials_count += 1
+                    episodes.append(MediaItem(
+                        source_platform,
+                        f"S{ep_num}",  # Mantener el ID original del especial
+                        title=episode_title,
+                        channel_id=series_id,
+                        season_id='specials',
+                        season='00',  # Temporada 00 para especiales
+                        season_name='Specials',
+                        episode=specials_count,  # Número incremental de especiales
+                        description=''
+                    ))
+                else:
+                    # Episodio normal - usar contador absoluto
+                    season_episode_counts[season_number] += 1
+                    absolute_episode_number += 1
+                    episodes.append(MediaItem(
+                        source_platform,
+                        str(absolute_episode_number),  # Número absoluto global
+                        title=episode_title,
+                        channel_id=series_id,
+                        season_id=season_id,
+                        season=season_number,
+                        season_name=season_name,
+                        episode=season_episode_counts[season_number],  # Número dentro de esta temporada
+                        description=''
+                    ))
             
-            try:
-                # Ejecutar comando con timeout de 60 segundos por temporada
-                result = subprocess.run(
-                    command,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=60
-                )
-                
-                season_output = result.stdout.decode('utf-8', errors='replace')
-                
-                # Log para debug (solo primeras 500 chars)
-                if len(season_output) < 100:
-                    l.log("crunchyroll", f"  Output: {season_output[:200]}")
-                
-                # Parsear episodios de esta temporada
-                # Usar el contador del season_number (no resetear si hay múltiples season_id con mismo número)
-                episode_count_before = season_episode_counts[season_number]
-                for line in season_output.split('\n'):
-                    line = line.strip()
-                    
-                    # Detectar episodios normales [E1] o especiales [S1]
-                    # IMPORTANTE: [S:XXX] son temporadas, NO especiales
-                    # Los especiales son [S1], [S2], etc. (sin dos puntos)
-                    is_special = line.startswith('[S') and not line.startswith('[S:')
-                    is_episode = line.startswith('[E')
-                    
-                    if (is_episode or is_special) and ']' in line:
-                        try:
-                            # Extraer número de episodio: [E1] o [S1]
-                            prefix = '[S' if is_special else '[E'
-                            ep_num = line[line.find(prefix)+2:line.find(']')]
-                            
-                            # Extraer título (después de la segunda ])
-                            # Formato: [E1] [2021-10-10] Título - Season 206 - Título Episodio
-                            rest_of_line = line[line.find(']')+1:]  # Después de [E1] o [S1]
-                            if ']' in rest_of_line:
-                                rest_of_line = rest_of_line[rest_of_line.find(']')+1:].strip()  # Después de [fecha]
-                            
-                            # Extraer el título del episodio
-                            episode_title = rest_of_line.strip()
-                            
-                            # Si hay " - Season XXX - ", el título real está después
-                            if ' - Season' in rest_of_line:
-                                # Buscar el último " - Season" en la línea
-                                season_start = rest_of_line.rfind(' - Season')
-                                after_season = rest_of_line[season_start:]  # Desde " - Season"
-                                
-                                # Buscar el siguiente " - " después de "Season XXX"
-                                parts = after_season.split(' - ', 2)  # Dividir en máximo 3 partes
-                                if len(parts) >= 3:
-                                    # parts[0] = "", parts[1] = "Season 14", parts[2] = "Título"
-                                    episode_title = parts[2].strip()
-                                elif len(parts) == 2:
-                                    # Solo hay "Season 14" sin título después
-                                    episode_title = rest_of_line[:season_start].strip()
-                            
-                            if is_special:
-                                # Es un especial - va a carpeta Specials
-                                specials_count += 1
-                                episodes.append({
-                                    'season_id': 'specials',
-                                    'season_number': '00',  # Temporada 00 para especiales
-                                    'episode_id': f"S{ep_num}",  # Mantener el ID original del especial
-                                    'episode_number': f"S{ep_num}",
-                                    'season_episode_number': specials_count,  # Número incremental de especiales
-                                    'title': episode_title,
-                                    'season_name': 'Specials',
-                                    'description': ''
-                                })
-                            else:
-                                # Episodio normal - usar contador absoluto
-                                season_episode_counts[season_number] += 1
-                                absolute_episode_number += 1
-                                
-                                current_season_ep = season_episode_counts[season_number]
-                                
-                                episodes.append({
-                                    'season_id': season_id,
-                                    'season_number': season_number,
-                                    'episode_id': str(absolute_episode_number),  # Número absoluto global
-                                    'episode_number': str(absolute_episode_number),
-                                    'season_episode_number': current_season_ep,  # Número dentro de esta temporada (continúa si hay duplicados)
-                                    'title': episode_title,
-                                    'season_name': season_name,
-                                    'description': ''
-                                })
-                            
-                        except Exception as e:
-                            l.log("crunchyroll", f"Error parsing episode: {e} | Line: {line[:80]}")
-                
-                episodes_added = season_episode_counts[season_number] - episode_count_before
-                l.log("crunchyroll", f"  -> Found {episodes_added} episodes for season {season_id} (S{season_number} now has {season_episode_counts[season_number]} total episodes)")
-                
-            except subprocess.TimeoutExpired:
-                l.log("crunchyroll", f"Timeout fetching episodes for season {season_id}")
-            except Exception as e:
-                l.log("crunchyroll", f"Error fetching season {season_id}: {e}")
-        
-        l.log("crunchyroll", f"Found {len(episodes)} episodes total")
+            episodes_added = season_episode_counts[season_number] - episode_count_before
+            l.log("crunchyroll", f"  -> Found {episodes_added} episodes for season {season_id} (S{season_number} now has {season_episode_counts[season_number]} total episodes)")
         return episodes
 
     def set_auth(self, command, quotes=False):
@@ -348,6 +236,42 @@ crunchyroll_password = config.get('crunchyroll_password', '')
 # Multi-downloader-nx configuration
 multi_downloader_path = config.get('multi_downloader_path', 'D:\\opt\\multi-downloader-nx\\lib\\index.js')
 
+# Consultas de temporada simultáneas por serie
+season_workers = max(1, int(config.get('season_workers', 4)))
+
+# Cola de descargas: simultáneas, en espera y reintentos que reanudan los parciales
+download_workers = max(1, int(config.get('download_workers', 2)))
+download_queue_size = max(1, int(config.get('download_queue_size', 20)))
+download_retries = max(0, int(config.get('download_retries', 2)))
+# Segmentos que multi-downloader-nx descarga en paralelo por episodio
+download_partsize = max(1, int(config.get('download_partsize', 10)))
+# Sin límite total, solo se corta una descarga que no escribe nada en este tiempo
+download_idle_timeout = max(30, int(config.get('download_idle_timeout', 300)))
+# Servir el .ts parcial en cuanto tiene download_playable_mb en vez de esperar al final
+download_stream_partial = str(config.get('download_stream_partial', 'False')).lower() == 'true'
+download_playable_bytes = int(config.get('download_playable_mb', 16)) * 1024 * 1024
+# Segundos que una petición espera a la descarga (o a su parcial) antes de responder 504
+download_wait_timeout = max(1, int(config.get('download_wait_timeout', 600)))
+# Variante de media_cache del .ts que multi-downloader-nx está escribiendo
+PARTIAL_VARIANT = 'ts'
+
+# Temporadas y episodios ya listados, solo los nuevos llegan a escribirse
+catalog = Catalog(
+    config.get('catalog_file', './plugins/crunchyroll/catalog.json'),
+    int(config.get('catalog_recheck_days', 7)),
+    int(config.get('catalog_complete_after_days', 30))
+)
+
+# One login shared by every multi-downloader-nx call
+session = CrunchyrollSession(
+    multi_downloader_path,
+    crunchyroll_username,
+    crunchyroll_password,
+    config.get('session_state_file', './plugins/crunchyroll/session.json'),
+    int(config.get('session_ttl_hours', 24)),
+    config.get('multi_downloader_token_file') or None
+)
+
 # Mapeo de locales
 locale_map = {
     'ja-JP': 'und',
@@ -369,9 +293,9 @@ if SECRET_KEY:
 
 
 if 'jellyfin_preload' in config:
-    jellyfin_preload = bool(config['jellyfin_preload'])
+    jellyfin_preload = str(config['jellyfin_preload']).lower() == 'true'
 if 'jellyfin_preload_last_episode' in config:
-    jellyfin_preload_last_episode = bool(config['jellyfin_preload_last_episode'])
+    jellyfin_preload_last_episode = str(config['jellyfin_preload_last_episode']).lower() == 'true'
 if 'proxy' in config:
     proxy = config['proxy']
     proxy_url = config['proxy_url']
@@ -417,25 +341,31 @@ def to_strm(method):
         import re
         unified_season_names = {}
         for ep in episodes:
-            season_num = str(ep['season_number']).zfill(2)
+            season_num = str(ep.season).zfill(2)
             if season_num not in unified_season_names:
-                season_name = ep.get('season_name', f'Season {season_num}')
+                season_name = ep.season_name or f'Season {season_num}'
                 # Quitar paréntesis y su contenido: (1089-1122), (Season: 14), etc.
                 clean_name = re.sub(r'\s*\([^)]*\)\s*', ' ', season_name)
                 # Limpiar espacios múltiples
                 clean_name = re.sub(r'\s+', ' ', clean_name).strip()
                 unified_season_names[season_num] = clean_name
         
+        # strm ya escritos en otras sincronizaciones, no se vuelven a tocar
+        # mientras sigan en disco (un strm borrado se escribe de nuevo)
+        written = catalog.written(series_id)
+        current = set()
+        existing_folders = set()
+        
         # Procesar cada episodio
         total_episodes = len(episodes)
         for idx, ep in enumerate(episodes, 1):
-            season_number = str(ep['season_number']).zfill(2)  # S01, S02, etc.
-            episode_number = str(ep['season_episode_number']).zfill(2)  # Número dentro de la temporada
-            episode_title = ep['title']
-            episode_id = ep['episode_id']  # Número absoluto de Crunchyroll (E37)
-            season_id = ep['season_id']
+            season_number = str(ep.season).zfill(2)  # S01, S02, etc.
+            episode_number = str(ep.episode).zfill(2)  # Número dentro de la temporada
+            episode_title = ep.title
+            episode_id = ep.media_id  # Número absoluto de Crunchyroll (E37)
+            season_id = ep.season_id
             # Usar el nombre unificado sin paréntesis
-            season_name = unified_season_names.get(season_number, ep.get('season_name', episode_title))
+            season_name = unified_season_names.get(season_number, ep.season_name or episode_title)
             
             # Diccionario para mutaciones
             data = {
@@ -482,25 +412,35 @@ def to_strm(method):
                 sanitize(season_name)
             )
             
-            f.folders().make_clean_folder(season_folder, False, config)
-            
             # Crear archivo STRM
             file_path = "{}/{}.strm".format(
                 season_folder,
                 sanitize(video_name)
             )
+            current.add(file_path)
+            
+            # Una vez por temporada, antes de mirar sus strm
+            if season_folder not in existing_folders:
+                f.folders().make_clean_folder(season_folder, False, config)
+                existing_folders.add(season_folder)
             
-            if not os.path.isfile(file_path):
-                f.folders().write_file(file_path, file_content)
-                # Solo hacer log cada 50 episodios, el primero y el último para no saturar
-                if idx == 1 or idx == total_episodes or idx % 50 == 0:
-                    l.log("crunchyroll", f"Created: {video_name} ({idx}/{total_episodes})")
+            if os.path.isfile(file_path):
+                continue
+            
+            f.folders().write_file(file_path, file_content)
+            # Solo hacer log cada 50 episodios, el primero y el último para no saturar
+            if idx == 1 or idx == total_episodes or idx % 50 == 0:
+                l.log("crunchyroll", f"Created: {video_name} ({idx}/{total_episodes})")
+        
+        l.log("crunchyroll", f"{len(current - written)} new strm files")
+        catalog.set_written(series_id, current)
+        catalog.save()
         
         # Si jellyfin_preload_last_episode está activado, descargar el último episodio
         if jellyfin_preload_last_episode and len(episodes) > 0:
             last_episode = episodes[-1]
-            last_episode_id = last_episode['episode_id']
-            last_episode_title = last_episode['title']
+            last_episode_id = last_episode.media_id
+            last_episode_title = last_episode.title
             crunchyroll_id = f"{series_id}_{last_episode_id}"
             
             l.log("crunchyroll", f"Preloading last episode: {last_episode_title} (ID: {crunchyroll_id})")
@@ -542,106 +482,173 @@ def direct(crunchyroll_id):
 
     return download(crunchyroll_id)
 
-def download(crunchyroll_id, return_file=True):
-    current_dir = os.getcwd()
-    temp_dir = os.path.join(current_dir, 'temp')
+def split_id(crunchyroll_id):
+    """series_id_episode_id -> (series_id, episode_id), None if it is not valid"""
+    series_id, _, episode_id = crunchyroll_id.partition('_')
+    if not series_id or not episode_id:
+        return None
+    return series_id, episode_id
+
+def partial_file(crunchyroll_id):
+    """.ts multi-downloader-nx is writing for crunchyroll_id as registered in media_cache, None if there is none"""
+    return media_cache.path(crunchyroll_id, PARTIAL_VARIANT, state=PARTIAL)
+
+def run_episode_download(job):
+    """
+    Download of the queue: runs multi-downloader-nx and follows its output.
+    The partial files stay in ./temp under the same name when it fails, so
+    the next attempt (or the next request) resumes them.
+    """
+    crunchyroll_id = job.job_id
+    series_id, episode_id = split_id(crunchyroll_id)
+    temp_dir = os.path.join(os.getcwd(), 'temp')
+    l.log("crunchyroll", f"Downloading episode: {episode_id} from series: {series_id}")
+    
+    # Mapeo de dubLang
+    dub_map = {
+        'ja-JP': 'jpn',
+        'es-ES': 'spa-ES',
+        'es-419': 'spa-419',
+        'en-US': 'eng',
+        'pt-BR': 'por',
+        'fr-FR': 'fra',
+        'de-DE': 'deu'
+    }
+    dub_lang = dub_map.get(audio_language, 'jpn')
+    
+    # Comando de descarga usando multi-downloader-nx
+    # Usar ruta absoluta en fileName para forzar descarga en temp_dir
+    output_path = os.path.join(temp_dir, crunchyroll_id)
+    
+    command = [
+        'node', multi_downloader_path,
+        '--service', 'crunchy',
+        '--series', series_id,  # Usar --series con series ID
+        '--dubLang', dub_lang,
+        '--dlsubs', subtitle_language if subtitle_language else 'all',
+        '--locale', valid_locale,
+        '--tsd',
+        '-q', '0',  # Máxima calidad
+        '-e', episode_id,
+        '--partsize', str(download_partsize),  # Segmentos descargados a la vez
+        '--fileName', output_path  # Ruta absoluta
+    ]
+    
+    Crunchyroll().set_proxy(command)
+    l.log("crunchyroll", f"Command: {' '.join(command)}")
+    
+    # Archivos que multi-downloader-nx nombra en su salida, sin listar ./temp.
+    # El primer .ts es el vídeo, el audio se descarga después
+    partial_paths = []
+    final_paths = []
+    
+    def register_partial():
+        """Registra en media_cache el .ts nombrado en cuanto existe, devuelve su ruta"""
+        path = partial_file(crunchyroll_id)
+        if not path and partial_paths and os.path.exists(partial_paths[0]):
+            path = partial_paths[0]
+            media_cache.put(crunchyroll_id, path, PARTIAL_VARIANT, PARTIAL, 0)
+        return path
+    
+    def run_download():
+        output = []
+        last_check = [0]
+        
+        def on_line(line):
+            output.append(line)
+            del output[:-50]
+            for path in output_files(line, output_path):
+                (partial_paths if path.endswith('.ts') else final_paths).append(path)
+            progress = parse_progress(line)
+            if progress is not None:
+                job.update(progress=progress)
+            # Mirar el .ts parcial como mucho cada pocos segundos
+            if not job.partial_path and time.time() - last_check[0] > 5:
+                last_check[0] = time.time()
+                path = register_partial()
+                try:
+                    playable = download_stream_partial and path and os.path.getsize(path) >= download_playable_bytes
+                except OSError:
+                    playable = False
+                if playable:
+                    job.update(partial_path=path)
+        
+        returncode = run_lines(command, on_line, download_idle_timeout, cwd=temp_dir)
+        return returncode, '\n'.join(output)
+    
+    session.ensure()
+    returncode, output = run_download()
+    if returncode != 0 and is_auth_error(output):
+        # Token rechazado, login de nuevo y un solo reintento
+        l.log("crunchyroll", "Session rejected, authenticating again")
+        session.invalidate()
+        if session.ensure():
+            returncode, output = run_download()
     
-    # Extraer series_id y episode_id del crunchyroll_id
-    # Formato: series_id_episode_id
-    try:
-        series_id, episode_id = crunchyroll_id.split('_', 1)
-    except:
+    l.log("crunchyroll", f"=== multi-downloader-nx return code: {returncode} ===")
+    if returncode != 0:
+        for line in output.split('\n')[-10:]:
+            if line.strip():
+                l.log("crunchyroll", f"OUTPUT: {line}")
+        return None
+    
+    # El archivo final que nombró en su salida, o --fileName con la extensión del muxer
+    for path in final_paths[::-1] + [f'{output_path}.mkv', f'{output_path}.mp4']:
+        if os.path.exists(path):
+            media_cache.put(crunchyroll_id, path)
+            media_cache.remove(crunchyroll_id, PARTIAL_VARIANT)
+            return path
+    
+    l.log("crunchyroll", "Downloaded file not found")
+    return None
+
+download_queue = DownloadQueue(
+    'crunchyroll',
+    run_episode_download,
+    workers=download_workers,
+    max_queued=download_queue_size,
+    retries=download_retries
+)
+
+def download(crunchyroll_id, return_file=True):
+    if not split_id(crunchyroll_id):
         l.log("crunchyroll", f"Invalid crunchyroll_id format: {crunchyroll_id}")
         if return_file:
             abort(400)
         return None
     
     # Buscar archivo ya descargado
-    existing_file = None
-    for filename in os.listdir(temp_dir):
-        if crunchyroll_id in filename and (filename.endswith('.mp4') or filename.endswith('.mkv')):
-            existing_file = os.path.join(temp_dir, filename)
-            break
+    existing_file = media_cache.path(crunchyroll_id)
     
     if not existing_file:
-        l.log("crunchyroll", f"Downloading episode: {episode_id} from series: {series_id}")
-        
-        # Mapeo de dubLang
-        dub_map = {
-            'ja-JP': 'jpn',
-            'es-ES': 'spa-ES',
-            'es-419': 'spa-419',
-            'en-US': 'eng',
-            'pt-BR': 'por',
-            'fr-FR': 'fra',
-            'de-DE': 'deu'
-        }
-        dub_lang = dub_map.get(audio_language, 'jpn')
-        
-        # Comando de descarga usando multi-downloader-nx
-        # Usar ruta absoluta en fileName para forzar descarga en temp_dir
-        output_path = os.path.join(temp_dir, crunchyroll_id)
-        
-        command = [
-            'node', multi_downloader_path,
-            '--service', 'crunchy',
-            '--series', series_id,  # Usar --series con series ID
-            '--dubLang', dub_lang,
-            '--dlsubs', subtitle_language if subtitle_language else 'all',
-            '--locale', valid_locale,
-            '--tsd',
-            '-q', '0',  # Máxima calidad
-            '-e', episode_id,
-            '--fileName', output_path  # Ruta absoluta
-        ]
-        
-        Crunchyroll().set_proxy(command)
-        
-        # Ejecutar descarga con stdin para seleccionar episodio
-        l.log("crunchyroll", f"Command: {' '.join(command)}")
-        
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            stdin=subprocess.PIPE,
-            text=True,
-            cwd=temp_dir
-        )
-        
-        
-        # Esperar a que termine
-        stdout, stderr = process.communicate(timeout=300)
+        # Una sola descarga por episodio, las peticiones repetidas esperan a la misma
+        job = download_queue.submit(crunchyroll_id)
+        if job is None:
+            if return_file:
+                return Response('Download queue full', status=503, headers={'Retry-After': '30'})
+            return None
         
-        # Loguear la salida completa
-        l.log("crunchyroll", "=== multi-downloader-nx ===")
-        #if stdout:
-        #    for line in stdout.split('\n'):
-        #        if line.strip():
-        #            l.log("crunchyroll", f"STDOUT: {line}")
-        if stderr:
-            for line in stderr.split('\n'):
-                if line.strip():
-                    l.log("crunchyroll", f"STDERR: {line}")
-        l.log("crunchyroll", f"=== Return code: {process.returncode} ===")
+        if return_file and download_stream_partial:
+            job.wait(lambda current: current.partial_path is not None, timeout=download_wait_timeout)
+            partial_path = job.partial_path
+            if not job.finished and partial_path:
+                l.log("crunchyroll", f"Streaming partial file: {partial_path}")
+                return Response(stream_with_context(job.read_partial(partial_path)), mimetype='video/mp2t')
         
-        if process.returncode != 0:
-            l.log("crunchyroll", f"Download failed with return code: {process.returncode}")
+        if not job.wait(timeout=download_wait_timeout):
+            # La descarga sigue en la cola, la próxima petición esperará al mismo job
+            l.log("crunchyroll", f"Download still running after {download_wait_timeout}s: {crunchyroll_id}")
             if return_file:
-                abort(500)
+                return Response('Download still running', status=504, headers={'Retry-After': '30'})
             return None
         
-        # Buscar el archivo descargado
-        for filename in os.listdir(temp_dir):
-            if crunchyroll_id in filename and (filename.endswith('.mp4') or filename.endswith('.mkv')):
-                existing_file = os.path.join(temp_dir, filename)
-                break
-        
-        if not existing_file:
-            l.log("crunchyroll", "Downloaded file not found")
+        if job.state != DONE:
+            l.log("crunchyroll", f"Download failed: {crunchyroll_id}")
             if return_file:
-                abort(404)
+                # Un job fallido no se reutiliza, la siguiente petición lo intenta de nuevo
+                return Response('Download failed', status=503, headers={'Retry-After': '30'})
             return None
+        existing_file = job.path
     
     if return_file:
         l.log("crunchyroll", f"Serving file: {existing_file}")
@@ -651,6 +658,21 @@ def download(crunchyroll_id, return_file=True):
         return existing_file
 
 #experimental not works.
+def warm(crunchyroll_id, mode):
+    """
+    Prefetch of the next episode: download queues it and answers right
+    away, the download is not waited for. There is nothing to resolve
+    ahead for resolve.
+    """
+    if not split_id(crunchyroll_id):
+        abort(400)
+    if mode != 'download' or media_cache.path(crunchyroll_id):
+        return jsonify({'bytes': 0})
+    if download_queue.submit(crunchyroll_id) is None:
+        return Response('Download queue full', status=503, headers={'Retry-After': '30'})
+    return jsonify({'bytes': 0}), 202
+
+
 def streams(media, crunchyroll_id):
     log_text = (f'Remuxing {media} - {crunchyroll_id}')
     l.log("crunchyroll", log_text)
@@ -1,11 +1,7 @@
-import os
-import requests
-import schedule
-import time
-import threading
 from clases.config import config as c
-from clases.worker import worker as w
 from clases.log import log as l
+from clases.prefetch import PrefetchEngine, Policy, JellyfinSessions
+from clases.prefetch.prefetch import DOWNLOAD, OFF
 
 config = c.config(
     './plugins/crunchyroll/config.json'
@@ -14,103 +10,27 @@ config = c.config(
 base_url = config['jellyfin_base_url']
 api_key = config['jellyfin_api_key']
 user_id = config['jellyfin_user_id']
+preload = str(config.get('jellyfin_preload', 'False')).lower() == 'true'
 
+# Crunchyroll solo se sirve descargado, la precarga lanza la descarga del siguiente episodio.
+# Sin jellyfin_preload no se crea: los webhooks llegan a todos los motores creados
+engine = None
+if preload and base_url and api_key:
+    engine = PrefetchEngine(
+        JellyfinSessions(base_url, api_key, user_id),
+        policies={'crunchyroll': Policy(DOWNLOAD)},
+        default_policy=Policy(OFF)
+    )
 
-# Inicializa un objeto Lock para el control de concurrencia
-preload_lock = threading.Lock()
-
-# Variable de cierre para controlar la ejecución concurrente de la función preload_video
-is_preloading = False
-
-# Flag para detener el daemon
-daemon_running = True
-
-
-def get_next_episode(serie_id, temporada_id, episodio_id):
-    """Obtiene el ID del siguiente episodio basado en la ID actual del episodio."""
-    url = f"{base_url}/Shows/{serie_id}/Episodes?seasonId={temporada_id}&userId={user_id}"
-    headers = {'X-Emby-Token': api_key}
-    response = requests.get(url, headers=headers)
-    episodios = response.json().get('Items', [])
-    
-    episodio_actual_index = next((i for i, episodio in enumerate(episodios) if episodio['Id'] == episodio_id), None)
-
-    if episodio_actual_index is not None and episodio_actual_index < len(episodios) - 1:
-        siguiente_episodio = episodios[episodio_actual_index + 1]
-        return siguiente_episodio['Id']
-    else:
-        return None
-    
-def fetch_item_details(item_id, user_id, api_key):
-    url = f"{base_url}/Users/{user_id}/Items/{item_id}?api_key={api_key}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        log_text = (f"Error fetching item details: {response.status_code}")
-        l.log("jellyfin", log_text)
-        return None
-
-def preload_video(item_id, user_id, api_key):
-    item_details = fetch_item_details(item_id, user_id, api_key)
-    if item_details is None:
-        return
-    file_content = item_details['MediaSources'][0].get("Path", "")
-    if 'crunchyroll' in file_content:
-        w.worker(file_content).preload()
-
-
-def preload_next_episode():
-    url = f"{base_url}/Sessions?api_key={api_key}"
-    headers = {'X-Emby-Token': api_key}
-    try:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            sessions = response.json()
-            
-            for session in sessions:
-                if session.get('NowPlayingItem') and session.get('NowPlayingItem').get('Type') == 'Episode':
-                    now_playing = session.get('NowPlayingItem')
-                    serie_id = now_playing.get('SeriesId')
-                    temporada_id = now_playing.get('SeasonId')
-                    episodio_id = now_playing.get('Id')
-                    
-                    siguiente_episodio_id = get_next_episode(serie_id, temporada_id, episodio_id)
-                    
-                    if siguiente_episodio_id:
-                        preload_video(siguiente_episodio_id, user_id, api_key)
-                        # Aquí puedes agregar la lógica para "precargar" el siguiente episodio
-                    else:
-                        pass
-        else:
-            log_text = (f"Error: El servidor devolvió un estado HTTP {response.status_code}")
-            l.log("jellyfin", log_text)
-    except requests.exceptions.RequestException as e:
-        log_text = (f"Error HTTP: {e}")
-        l.log("jellyfin", log_text)
-    except ValueError as e:
-        log_text = (f"Error JSON: {e}")
-        l.log("jellyfin", log_text)
 
 def daemon():
     """Inicia el daemon que verificará el estado de reproducción cada minuto."""
-    global daemon_running
-    if not base_url == "" \
-    and not api_key == "" :
+    if engine:
         l.log("jellyfin", "Jellyfin daemon started")
-        while daemon_running:
-            try:
-                preload_next_episode()
-            except Exception as e:
-                l.log("jellyfin", f"Error in preload: {e}")
-            # Sleep en intervalos pequeños para poder detener rápidamente
-            for _ in range(60):
-                if not daemon_running:
-                    break
-                time.sleep(1)
-        l.log("jellyfin", "Jellyfin daemon stopped")
+        engine.run()
+
 
 def stop_daemon():
     """Detiene el daemon de Jellyfin."""
-    global daemon_running
-    daemon_running = False
+    if engine:
+        engine.stop()
@@ -0,0 +1,207 @@
+"""
+multi-downloader-nx output parser
+Reads the --series / -s listings line by line as they are printed and stops
+as soon as the information asked for is complete, instead of sleeping and
+killing the process after a fixed time. Downloads are followed the same way,
+line by line, to report their progress.
+"""
+
+import queue
+import re
+import subprocess
+import threading
+from clases.log import log as l
+
+# Seconds without a new line before a listing is considered stalled
+IDLE_TIMEOUT = 30
+
+PROGRESS = re.compile(r'(\d{1,3}(?:\.\d+)?)\s*%')
+
+
+def parse_season_line(line):
+    """
+    "[S:GRMG8ZQZR] One Piece (Season: 14)" -> ('GRMG8ZQZR', '14', 'One Piece')
+
+    Returns:
+        tuple: (season_id, number, name) or None if it is not a season line
+    """
+    line = line.strip()
+    if not line.startswith('[S:') or ']' not in line:
+        return None
+    season_id = line[3:line.find(']')]
+    name = line[line.find(']') + 1:].strip()
+    number = "1"
+    if '(Season:' in line:
+        start = line.find('(Season:') + 8
+        number = line[start:line.find(')', start)].strip()
+    if '(Season:' in name:
+        name = name[:name.find('(Season:')].strip()
+    return season_id, number, name
+
+
+def parse_episode_line(line):
+    """
+    "[E1] [2021-10-10] Series - Season 14 - Title" -> (False, '1', 'Title')
+    Specials are [S1], [S2]... ([S:ID] lines are seasons, not specials)
+
+    Returns:
+        tuple: (is_special, number, title) or None if it is not an episode line
+    """
+    line = line.strip()
+    is_special = line.startswith('[S') and not line.startswith('[S:')
+    if not (line.startswith('[E') or is_special) or ']' not in line:
+        return None
+
+    number = line[2:line.find(']')]
+    # [ERROR], [SUCCESS]... are log lines, episode numbers start with a digit
+    if not number[:1].isdigit():
+        return None
+    # Title after [E1] and [date]
+    rest = line[line.find(']') + 1:]
+    if ']' in rest:
+        rest = rest[rest.find(']') + 1:].strip()
+    title = rest.strip()
+
+    # "Series - Season XXX - Title", the real title is after the last " - Season"
+    if ' - Season' in rest:
+        season_start = rest.rfind(' - Season')
+        parts = rest[season_start:].split(' - ', 2)
+        if len(parts) >= 3:
+            title = parts[2].strip()
+        elif len(parts) == 2:
+            title = rest[:season_start].strip()
+    return is_special, number, title
+
+
+def parse_progress(line):
+    """
+    Last percentage printed in a download line, "... 45.3% ..." -> 45.3
+
+    Returns:
+        float: None if the line has no percentage
+    """
+    matches = PROGRESS.findall(line)
+    if not matches:
+        return None
+    return min(100.0, float(matches[-1]))
+
+
+def output_files(line, prefix):
+    """
+    Paths starting with prefix (the --fileName given) that a download line
+    mentions, e.g. 'Writing "/app/temp/G1_E2.ts"' -> ['/app/temp/G1_E2.ts']
+    The prefix must not run on into letters or digits (G1_E2 is not G1_E20).
+    """
+    return re.findall(re.escape(prefix) + r'(?![0-9A-Za-z])[^"\'\s]*\.(?:ts|mkv|mp4)\b', line)
+
+
+def read_lines(command, complete=None, idle_timeout=IDLE_TIMEOUT):
+    """
+    Yield the stdout lines of command while it prints them
+
+    Args:
+        command (list): multi-downloader-nx command, its selection prompt
+            gets "0" (cancel) on stdin
+        complete (callable): complete(line) returning True once everything
+            needed has been read, the process is stopped right away
+        idle_timeout (int): Stop if nothing is printed for this long
+    """
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        stdin=subprocess.PIPE,
+        encoding='utf-8',
+        errors='replace'
+    )
+    try:
+        process.stdin.write("0\n")
+        process.stdin.close()
+    except OSError:
+        pass
+
+    lines = line_queue(process)
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=idle_timeout)
+            except queue.Empty:
+                l.log("crunchyroll", f"No output for {idle_timeout}s, listing stopped: {' '.join(command[2:])}")
+                return
+            if line is None:
+                return
+            yield line.rstrip('\n')
+            if complete and complete(line):
+                return
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+
+def line_queue(process):
+    """Queue with the stdout lines of process, None once it is closed."""
+    lines = queue.Queue()
+
+    def reader():
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    threading.Thread(target=reader, daemon=True).start()
+    return lines
+
+
+def run_lines(command, on_line, idle_timeout, cwd=None):
+    """
+    Run command calling on_line(line) for every line of stdout and stderr.
+    There is no limit for the whole run, it is only stopped when it prints
+    nothing for idle_timeout seconds.
+
+    Returns:
+        int: Return code, None if it was stopped
+    """
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        stdin=subprocess.DEVNULL,
+        encoding='utf-8',
+        errors='replace',
+        cwd=cwd
+    )
+    lines = line_queue(process)
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=idle_timeout)
+            except queue.Empty:
+                l.log("crunchyroll", f"No output for {idle_timeout}s, stopped: {' '.join(command[2:])}")
+                return None
+            if line is None:
+                return process.wait()
+            on_line(line.rstrip('\n'))
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+class SeasonList:
+    """
+    complete() for read_lines: the season list ends at the first line after
+    it that is not a season, a detail line ("- Versions: ...") or empty.
+    """
+
+    def __init__(self):
+        self.seasons = []
+
+    def __call__(self, line):
+        season = parse_season_line(line)
+        if season:
+            self.seasons.append(season)
+            return False
+        line = line.strip()
+        if not line or line.startswith('-'):
+            return False
+        return bool(self.seasons)
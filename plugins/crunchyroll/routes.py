@@ -1,5 +1,6 @@
 from __main__ import app
-from plugins.crunchyroll.crunchyroll import direct, download, streams, remux_streams
+from flask import request
+from plugins.crunchyroll.crunchyroll import direct, download, streams, remux_streams, warm
 
 ### CRUNCHY ZONE
 @app.route("/crunchyroll/direct/<crunchyroll_id>")
@@ -9,6 +10,10 @@ def crunchyroll_direct(crunchyroll_id):
 @app.route("/crunchyroll/download/<crunchyroll_id>")
 def crunchyroll_download(crunchyroll_id):
     return download(crunchyroll_id)
+#Prefetch of the next episode, ?mode=download queues it
+@app.route("/crunchyroll/warm/<crunchyroll_id>")
+def crunchyroll_warm(crunchyroll_id):
+    return warm(crunchyroll_id, request.args.get('mode', 'resolve'))
 @app.route("/crunchyroll/stream/<media>/<crunchyroll_id>")
 def crunchyroll_remux(media, crunchyroll_id):
     return streams(media, crunchyroll_id)
@@ -0,0 +1,115 @@
+"""
+Crunchyroll session
+multi-downloader-nx keeps its own token (and refreshes it) once --auth has
+run, so we log in once and remember until when that login is trusted. Every
+multi-downloader-nx call asks ensure() first instead of running --auth.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from clases.log import log as l
+
+# Output of a multi-downloader-nx call that failed because of the login
+AUTH_ERRORS = ('401', 'unauthorized', 'invalid_grant', 'not logged in', 'authentication')
+
+
+def is_auth_error(output):
+    output = (output or '').lower()
+    return any(error in output for error in AUTH_ERRORS)
+
+
+class CrunchyrollSession:
+    def __init__(self, multi_downloader_path, username, password, state_file,
+                 ttl_hours=24, token_file=None):
+        """
+        Args:
+            multi_downloader_path (str): Path of multi-downloader-nx lib/index.js
+            username (str): Crunchyroll username
+            password (str): Crunchyroll password
+            state_file (str): JSON file with the time and expiry of the last login
+            ttl_hours (int): Hours a login is trusted before running --auth again
+            token_file (str): Token written by multi-downloader-nx. If it was
+                there after the login, the session is only trusted while it
+                exists. Default: config/cr_token.yml next to the
+                multi-downloader-nx lib folder
+        """
+        self.multi_downloader_path = multi_downloader_path
+        self.username = username
+        self.password = password
+        self.state_file = state_file
+        self.ttl = ttl_hours * 60 * 60
+        self.token_file = token_file or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(multi_downloader_path))),
+            'config', 'cr_token.yml'
+        )
+        self.lock = threading.Lock()
+        self.state = self.load()
+
+    def load(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as file:
+                    return json.load(file)
+            except (ValueError, OSError) as e:
+                l.log("crunchyroll", f"Unable to read session state {self.state_file}: {e}")
+        return {}
+
+    def save(self):
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as file:
+                json.dump(self.state, file, indent=4)
+        except OSError as e:
+            l.log("crunchyroll", f"Unable to write session state {self.state_file}: {e}")
+
+    def account(self):
+        # The password is not stored, only whether the credentials changed
+        return hashlib.sha256(f'{self.username}:{self.password}'.encode('utf-8')).hexdigest()
+
+    def valid(self):
+        """Cheap check: same credentials, not expired and the token file is still there."""
+        return (
+            self.state.get('account') == self.account()
+            and self.state.get('expires', 0) > time.time()
+            and (not self.state.get('token_file') or os.path.exists(self.token_file))
+        )
+
+    def authenticate(self):
+        command = [
+            'node', self.multi_downloader_path,
+            '--service', 'crunchy',
+            '-u', self.username,
+            '-p', self.password,
+            '--auth'
+        ]
+        l.log("crunchyroll", "Authenticating with Crunchyroll...")
+        result = subprocess.run(command, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+        if result.returncode != 0:
+            l.log("crunchyroll", f"Auth error: {result.stderr}")
+            return False
+        now = time.time()
+        self.state = {
+            'account': self.account(),
+            'authenticated': now,
+            'expires': now + self.ttl,
+            'token_file': os.path.exists(self.token_file)
+        }
+        self.save()
+        l.log("crunchyroll", "Authentication successful")
+        return True
+
+    def ensure(self):
+        """Log in only if there is no trusted session, concurrent callers share one login."""
+        with self.lock:
+            if self.valid():
+                return True
+            return self.authenticate()
+
+    def invalidate(self):
+        """A call failed because of the login, the next ensure() logs in again."""
+        with self.lock:
+            self.state['expires'] = 0
+            self.save()
@@ -2,6 +2,7 @@
 
 import requests
 from __main__ import app
+from clases.http_client import client
 from flask import Response, stream_with_context, request
 
 
@@ -15,10 +16,17 @@ def telegram_direct(telegram_id):
         headers['Range'] = request.headers['Range']
     
     try:
-        req = requests.get(quart_url, stream=True, headers=headers, timeout=None)  # timeout=None para esperar indefinidamente
+        req = client().get(quart_url, stream=True, headers=headers, timeout=None)  # timeout=None para esperar indefinidamente
 
         # En este punto, asumiendo que req.status_code es 200 o 206, pero deberías manejar otros códigos según sea necesario
-        return Response(stream_with_context(req.iter_content(chunk_size=1024)), 
+        def generate():
+            # Cerrar la respuesta libera la conexión aunque el cliente corte antes
+            try:
+                yield from req.iter_content(chunk_size=1024)
+            finally:
+                req.close()
+
+        return Response(stream_with_context(generate()), 
                         content_type=req.headers['Content-Type'],
                         status=req.status_code,
                         headers=dict(req.headers))  # Reenvía todos los headers de la respuesta de Quart
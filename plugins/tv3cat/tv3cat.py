@@ -1,4 +1,3 @@
-import requests
 from bs4 import BeautifulSoup
 import json
 import os
@@ -7,6 +6,8 @@ from clases.worker import worker as w
 from clases.folders import folders as f
 from clases.nfo import nfo as n
 from clases.log import log as l
+from clases.http_client import plugin_client
+from clases.media import MediaItem
 from utils.sanitize import sanitize
 
 class tv3cat:
@@ -17,7 +18,7 @@ class tv3cat:
 
         if program_id and seasons:
             self.episodes = self.fetch_json_data(program_id, seasons)
-            self.channel_name = self.episodes[0]['programa']
+            self.channel_name = self.episodes[0].uploader
         else:
             log_text = ("No se pudo extraer el programId o las temporadas.")
             l.log("tv3cat", log_text)
@@ -41,7 +42,7 @@ class tv3cat:
 
     def fetch_program_id_and_seasons(self):
         url = self.channel
-        response = requests.get(url)
+        response = plugin_client(config).get(url)
         seasons = []
 
         if response.status_code == 200:
@@ -65,7 +66,7 @@ class tv3cat:
 
     def get_video_url(self, video_id, base_path=None):
         url = f"https://api-media.ccma.cat/pvideo/media.jsp?media=video&versio=vast&idint={video_id}&profile=pc_3cat&format=dm"
-        response = requests.get(url)
+        response = plugin_client(config).get(url)
         if response.status_code == 200:
             json_data = response.json()
             video_url = json_data.get('media', {}).get('url', [])[0].get('file')
@@ -80,7 +81,7 @@ class tv3cat:
             if subtitles_url and base_path:
                 try:
                     # Descargar el archivo VTT
-                    vtt_response = requests.get(subtitles_url)
+                    vtt_response = plugin_client(config).get(subtitles_url)
                     if vtt_response.status_code == 200:
                         # Usar la misma ruta que el STRM pero con extensión .vtt
                         vtt_filename = base_path.replace('.strm', '.vtt')
@@ -99,7 +100,7 @@ class tv3cat:
     def fetch_json_data(self, program_id, seasons):
         episodes = []
         url = f"https://www.3cat.cat/api/3cat/dades/?queryKey=%5B%22tira%22%2C%7B%22url%22%3A%22%2F%2Fapi.3cat.cat%2Fvideos%3F_format%3Djson%26ordre%3D-capitol%26origen%3Dllistat%26programatv_id%3D{program_id}%26tipus_contingut%3DPPD%26items_pagina%3D1000%26pagina%3D1%26sdom%3Dimg%26version%3D2.0%26cache%3D180%26https%3Dtrue%26master%3Dyes%26ordre%3Dcapitol%26temporada%3D%26ordre%3Dcapitol%26temporada%3D%22%7D%5D"
-        response = requests.get(url)
+        response = plugin_client(config).get(url)
         
         if response.status_code == 200:
             json_data = response.json()
@@ -119,17 +120,18 @@ class tv3cat:
                 if capitulo > 0:
                     video_url = self.get_video_url(video_id)
                     
-                    episode_data = {
-                        'id': video_id,
-                        'titulo': titulo,
-                        'capitulo': capitulo,
-                        'temporada': temporada,
-                        'programa': programa,
-                        'video_url': video_url
-                    }
-                    episodes.append(episode_data)
-                if episode_data['capitulo'] > 0:
-                    episodes.append(episode_data)
+                    episodes.append(
+                        MediaItem(
+                            'tv3cat',
+                            video_id,
+                            title=titulo,
+                            season=temporada,
+                            episode=capitulo,
+                            channel_id=programa,
+                            uploader=programa,
+                            url=video_url
+                        )
+                    )
         return episodes
 
 
@@ -171,13 +173,13 @@ def to_strm(method):
             for episode in tv3.episodes:
                 video_name = "{} - {}".format(
                     "S{}E{}".format(
-                        str(episode['temporada']).zfill(2), 
-                        str(episode['capitulo']).zfill(2),
+                        str(episode.season).zfill(2), 
+                        str(episode.episode).zfill(2),
                     ),
-                    episode['titulo']
+                    episode.title
                 )
 
-                file_content = episode['video_url']
+                file_content = episode.url
                 file_path = "{}/{}/{}/{}.{}".format(
                     media_folder,  
                     sanitize(
@@ -187,7 +189,7 @@ def to_strm(method):
                     ),  
                     sanitize(
                         "S{}".format(
-                            str(episode['temporada']).zfill(2)
+                            str(episode.season).zfill(2)
                         )
                     ), 
                     sanitize(video_name), 
@@ -204,7 +206,7 @@ def to_strm(method):
                     ),  
                     sanitize(
                         "S{}".format(
-                            str(episode['temporada']).zfill(2)
+                            str(episode.season).zfill(2)
                         )
                     )
                 )
@@ -214,4 +216,4 @@ def to_strm(method):
                 f.folders().write_file(file_path, file_content)
                 
                 # Descargar subtítulos si están disponibles
-                tv3.get_video_url(episode['id'], file_path)
\ No newline at end of file
+                tv3.get_video_url(episode.media_id, file_path)
\ No newline at end of file
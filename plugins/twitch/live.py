@@ -0,0 +1,105 @@
+"""
+Twitch live watch
+Checks the live status of every channel with one batched GQL request every
+live_watch_interval seconds and only creates or removes the
+!000-live-<channel> files when a channel goes live or offline. The full sync
+(twitch.to_strm) keeps handling VODs, thumbnails and NFOs.
+"""
+
+import os
+from clases.config import config as c
+from clases.log import log as l
+from clases.http_client import plugin_client
+from clases.jellyfin_notifier import JellyfinNotifier
+from plugins.twitch import gql
+from plugins.twitch import twitch as t
+
+
+class LiveWatcher:
+    def __init__(self, interval, method='direct'):
+        """
+        Args:
+            interval (int): Seconds between checks
+            method (str): Mode written in the live strm (direct, bridge)
+        """
+        self.interval = interval
+        self.method = method
+        # login -> stream ID, '' while offline
+        self.state = {}
+        self.logins = []
+        self.channels_mtime = None
+        # Its own notifier: flushing the shared one would cut a to_strm run in two
+        self.jellyfin_notifier = JellyfinNotifier(t.config)
+
+    def load_logins(self):
+        # The channel list is only read again when it changes
+        try:
+            mtime = os.path.getmtime(t.channels_list)
+        except OSError:
+            return self.logins
+        if mtime != self.channels_mtime:
+            self.channels_mtime = mtime
+            channels = c.config(t.channels_list).get_channels() or []
+            self.logins = [channel.replace('https://www.twitch.tv/', '') for channel in channels]
+            self.state = {login: self.state[login] for login in self.logins if login in self.state}
+        return self.logins
+
+    def check(self):
+        """Check every channel once, returns the number of state changes."""
+        logins = self.load_logins()
+        if not logins:
+            return 0
+        channels_info = gql.channels_info(logins, plugin_client(t.config))
+
+        changes = 0
+        jellyfin_notifier = self.jellyfin_notifier
+        for login in logins:
+            info = channels_info.get(login)
+            if not info or info['live'] is None:
+                continue
+            stream_id = info['stream_id'] if info['live'] else ''
+            # The first check reconciles whatever the last sync left on disk
+            if login in self.state and self.state[login] == stream_id:
+                continue
+            previous = self.state.get(login)
+            self.state[login] = stream_id
+            changes += 1
+
+            if previous or not stream_id:
+                # Offline, or a new stream replacing the previous one
+                if t.remove_live(login) and not stream_id:
+                    l.log("twitch", f"{login} is offline, live files removed")
+            if stream_id:
+                l.log("twitch", f"{login} is live ({stream_id})")
+                t.write_live(
+                    login,
+                    stream_id,
+                    info['name'] or login,
+                    "",
+                    f"https://static-cdn.jtvnw.net/previews-ttv/live_user_{login}-1920x1080.jpg",
+                    self.method,
+                    jellyfin_notifier
+                )
+        jellyfin_notifier.flush()
+        return changes
+
+    def run(self, stop_event):
+        l.log("twitch", f"Live watch started, checking every {self.interval}s")
+        while not stop_event.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                l.log("twitch", f"Live watch error: {e}")
+            stop_event.wait(self.interval)
+        l.log("twitch", "Live watch stopped")
+
+
+def from_config():
+    """Watcher from live_watch_interval / live_watch_method, None when disabled."""
+    try:
+        interval = int(t.config.get('live_watch_interval', 0))
+    except (TypeError, ValueError):
+        interval = 0
+    if interval <= 0:
+        return None
+    return LiveWatcher(max(interval, 15), t.config.get('live_watch_method', 'direct'))
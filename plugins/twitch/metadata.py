@@ -0,0 +1,59 @@
+"""
+Twitch channel metadata cache
+Name and artwork of every channel, kept on disk between syncs. They rarely
+change, so they are only fetched again after ttl_days.
+"""
+
+import json
+import os
+import threading
+import time
+from clases.log import log as l
+
+
+class MetadataCache:
+    def __init__(self, cache_file, ttl_days=7):
+        """
+        Args:
+            cache_file (str): JSON file with the metadata of every channel
+            ttl_days (int): Days before the metadata of a channel is refreshed
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl_days * 24 * 60 * 60
+        self.lock = threading.Lock()
+        self.data = self.load()
+        self.dirty = False
+
+    def load(self):
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as file:
+                    return json.load(file)
+            except (ValueError, OSError) as e:
+                l.log("twitch", f"Unable to read metadata cache {self.cache_file}: {e}")
+        return {}
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps(self.data, indent=4)
+            self.dirty = False
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as file:
+                file.write(data)
+        except OSError as e:
+            l.log("twitch", f"Unable to write metadata cache {self.cache_file}: {e}")
+
+    def get(self, channel, key):
+        """Cached value, None if missing or older than the TTL."""
+        with self.lock:
+            entry = self.data.get(channel, {}).get(key)
+        if not entry or time.time() - entry.get('updated', 0) > self.ttl:
+            return None
+        return entry.get('value')
+
+    def put(self, channel, key, value):
+        with self.lock:
+            self.data.setdefault(channel, {})[key] = {'value': value, 'updated': time.time()}
+            self.dirty = True
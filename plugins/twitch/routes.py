@@ -1,5 +1,5 @@
 from __main__ import app
-from plugins.twitch.twitch import direct, bridge
+from plugins.twitch.twitch import direct, bridge, proxy_playlist, proxy_segment, warm
 from flask import request  # Importa request desde Flask
 
 ### TWITCH ZONE
@@ -11,3 +11,17 @@ def twitch_direct(twitch_id):
 @app.route("/twitch/bridge/<twitch_id>")
 def twitch_bridge(twitch_id):
     return bridge(twitch_id)
+
+#Prefetch of the next VOD, resolves its URLs
+@app.route("/twitch/warm/<twitch_id>")
+def twitch_warm(twitch_id):
+    return warm(twitch_id, request.args.get('mode', 'resolve'))
+
+#HLS proxy mode (hls_proxy in config), playlists and segments served by ytdlp2STRM
+@app.route("/twitch/proxy/playlist/<token>")
+def twitch_proxy_playlist(token):
+    return proxy_playlist(token)
+
+@app.route("/twitch/proxy/segment/<token>")
+def twitch_proxy_segment(token):
+    return proxy_segment(token)
@@ -1,11 +1,12 @@
-from flask import stream_with_context, Response, send_file, redirect
+from flask import stream_with_context, Response, send_file, redirect, abort, jsonify
 from utils.sanitize import sanitize
 import os
-import requests
 import re
 from utils.episode_numbering import format_episode_title
 import time
 import sys
+import queue
+import threading
 from datetime import datetime
 from cachetools import TTLCache
 from clases.config import config as c
@@ -13,18 +14,70 @@ from clases.worker import worker as w
 from clases.folders import folders as f
 from clases.nfo import nfo as n
 from clases.log import log as l
-from clases.jellyfin_notifier.jellyfin_notifier import JellyfinNotifier
+from clases.media import MediaItem
+from clases.jellyfin_notifier import get_notifier
+from clases.http_client import plugin_client
+from clases.hls_proxy import HlsProxy, SegmentCache
+from utils import hls
+from plugins.twitch import gql
+from plugins.twitch.metadata import MetadataCache
 
 
 ## -- TWITCH CLASS
 class Twitch:
-    def __init__(self, channel):
+    def __init__(self, channel, info=None):
+        """
+        Args:
+            channel (str): Channel login
+            info (dict): Channel info from gql.channels_info, None to query it
+        """
         self.channel = channel
+        self.info = info
         self.twitch_channel_url = "https://www.twitch.tv/{}".format(channel)
-        self.channel_name = self.get_name()
-        self.images = self.get_thumbs()
-        self.direct = self.get_direct()
-        self.videos = self.get_videos()
+        # Everything below is fetched on first use, name and artwork come
+        # from the metadata cache while they are fresh
+        self._channel_name = None
+        self._images = None
+        self._direct = None
+        self.images_refreshed = False
+
+    @property
+    def channel_name(self):
+        if self._channel_name is None:
+            name = (self.info or {}).get('name') or metadata.get(self.channel, 'name')
+            if not name:
+                name = self.get_name()
+                if name != self.channel:
+                    metadata.put(self.channel, 'name', name)
+            self._channel_name = name
+        return self._channel_name
+
+    @property
+    def images(self):
+        if self._images is None:
+            images = metadata.get(self.channel, 'images')
+            if images is None:
+                images = self.get_thumbs()
+                metadata.put(self.channel, 'images', images)
+                self.images_refreshed = True
+            elif self.info:
+                # GQL already answered this run, keep its artwork
+                images = dict(images)
+                images['poster'] = self.info.get('poster') or images['poster']
+                images['landscape'] = self.info.get('landscape') or images['landscape']
+            self._images = images
+        return self._images
+
+    @property
+    def direct(self):
+        if self._direct is None:
+            self._direct = self.get_direct()
+        return self._direct
+
+    @property
+    def videos(self):
+        """VOD MediaItems, oldest first, yielded while yt-dlp lists them."""
+        return self.get_videos()
     
     def set_cookies(self, command):
         if cookies and cookie_value and cookies.strip() and cookie_value.strip():
@@ -63,10 +116,13 @@ class Twitch:
 
     def get_direct(self):
         #Get current livestream
+        if self.get_pictures().get('live') is False:
+            # Offline according to GQL, no need to ask yt-dlp
+            return []
         l.log("twitch", "Getting direct stream (live)")
         command = [
             'yt-dlp', 
-            '--print', '"%(id)s;%(title)s;%(description)s;%(thumbnail)s;%(upload_date)s"', 
+            '--print', LISTING_FIELDS, 
             '--ignore-errors',
             '--no-warnings',
             '{}'.format(
@@ -76,50 +132,16 @@ class Twitch:
         
         self.set_cookies(command)
 
-        result = w.worker(command).output()
+        result = [item_from_info(data, self.channel) for data in w.worker(command).stream_json()]
         l.log("twitch", f"Direct stream result obtained")
-        return [result]
+        return result
 
 
     def get_pictures(self):
-        headers = {
-            'Accept': '*/*',
-            'Client-Id': '{}'.format(client_id),
-            'Client-Version': '{}'.format(client_version),
-            'Connection': 'keep-alive',
-            'Content-Type': 'text/plain;charset=UTF-8',
-            'Origin': 'https://www.twitch.tv',
-            'Referer': 'https://www.twitch.tv/',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-site',
-        }
-        data = [
-            {
-                "operationName":"ChannelShell",
-                "variables":{
-                    "login":"{}".format(
-                        self.channel
-                    )
-                },
-                "extensions":{
-                    "persistedQuery":{
-                        "versions":1,
-                        "sha256Hash":"{}".format(
-                            sha256_channelShell
-                        )
-                    }
-                }
-            }
-        ]
-
-        response = requests.post(
-            'https://gql.twitch.tv/gql', 
-            headers=headers, 
-            json=data
-        )
-
-        return response.json()
+        """Name, artwork and live status from GQL (already batched by to_strm)."""
+        if self.info is None:
+            self.info = gql.channels_info([self.channel], plugin_client(config)).get(self.channel, {})
+        return self.info
     
     def get_thumbs(self):
         #Table thumbnails
@@ -175,22 +197,11 @@ class Twitch:
             log_text = ("No poster detected")
             l.log("twitch", log_text)
         
-        l.log("twitch", f"Getting pictures from Twitch API")
         pictures = self.get_pictures()
-        l.log("twitch", f"Pictures obtained")
-        poster = ""
-        landscape = ""
-
-        for picture in pictures:
-            poster = picture['data']['userOrError']['profileImageURL'].replace(
-                '70x70',
-                '300x300'
-            )
-            landscape = picture['data']['userOrError']['bannerImageURL']
 
         return {
-            "poster" : poster,
-            "landscape" : landscape,
+            "poster" : pictures.get('poster', ''),
+            "landscape" : pictures.get('landscape', ''),
             "preview" : preview
         }
 
@@ -198,10 +209,12 @@ class Twitch:
         l.log("twitch", f"Getting videos for channel")
         command = [
             'yt-dlp', 
-            '--print', '"%(id)s;%(title)s;%(description)s;%(thumbnail)s;%(upload_date)s"', 
+            '--print', LISTING_FIELDS, 
             '--dateafter', "today-{}days".format(days_after),
             '--playlist-start', '1', 
             '--playlist-end', videos_limit, 
+            # Oldest videos first so they get lower episode numbers
+            '--playlist-reverse',
             '--ignore-errors',
             '--no-warnings',
             '{}/{}'.format(
@@ -212,9 +225,11 @@ class Twitch:
         
         self.set_cookies(command)
         
-        result = w.worker(command).output().split('\n')
-        l.log("twitch", f"Got {len(result)} video entries")
-        return result
+        count = 0
+        for data in w.worker(command).stream_json():
+            count += 1
+            yield item_from_info(data, self.channel)
+        l.log("twitch", f"Got {count} video entries")
 ## -- END
 
 recent_requests = TTLCache(maxsize=200, ttl=30)
@@ -235,9 +250,8 @@ channels = c.config(
 media_folder = config["strm_output_folder"]
 channels_list = config["channels_list_file"]
 source_platform = "twitch"
-sha256_channelShell = "580ab410bcd0c1ad194224957ae2241e5d252b2c5173d8e0cce9d32d5bb14efe"
-client_id = "kimne78kx3ncx6brgo4mv6wki5h1ko"
-client_version = "21e5a00f-b4e2-4fe7-a6a1-13de6e72e9b1"
+# One JSON object per entry, titles and descriptions may hold any character
+LISTING_FIELDS = '%(.{id,title,description,thumbnail,upload_date})j'
 
 if 'days_dateafter' in config:
     days_after = config["days_dateafter"]
@@ -258,6 +272,30 @@ try:
 except:
     episode_format = 'sequential'
 
+# Channel names and artwork, refreshed every metadata_ttl_days
+metadata = MetadataCache(
+    config.get('metadata_cache_file', './plugins/twitch/metadata_cache.json'),
+    int(config.get('metadata_ttl_days', 7))
+)
+
+host = ytdlp2strm_config['ytdlp2strm_host']
+port = ytdlp2strm_config['ytdlp2strm_port']
+if os.environ.get('AM_I_IN_A_DOCKER_CONTAINER', False):
+    port = os.environ.get('DOCKER_PORT', False)
+
+# Serve HLS playlists and segments through ytdlp2STRM instead of the Twitch CDN
+hls_proxy = None
+if str(config.get('hls_proxy', 'False')).lower() == 'true':
+    hls_proxy = HlsProxy(
+        f'http://{host}:{port}/twitch/proxy',
+        SegmentCache(
+            int(config.get('hls_cache_memory_mb', 64)) * 1024 * 1024,
+            int(config.get('hls_cache_disk_mb', 256)) * 1024 * 1024,
+            config.get('hls_cache_dir', './temp/hls_cache_twitch')
+        ),
+        proxy_url=config.get('proxy_url', '') if str(config.get('proxy', 'False')).lower() == 'true' else ""
+    )
+
 # Función helper para agregar cookies a comandos
 def set_cookies_to_command(command):
     if cookies and cookie_value and cookies.strip() and cookie_value.strip():
@@ -267,6 +305,99 @@ def set_cookies_to_command(command):
 ## -- END
 
 
+def info_field(data, name):
+    value = data.get(name)
+    return '' if value is None else str(value)
+
+
+def item_from_info(data, channel):
+    """MediaItem of one LISTING_FIELDS JSON line, missing fields are empty strings."""
+    return MediaItem(
+        source_platform,
+        info_field(data, 'id'),
+        title=info_field(data, 'title'),
+        description=info_field(data, 'description'),
+        thumbnail=info_field(data, 'thumbnail'),
+        upload_date=info_field(data, 'upload_date'),
+        channel_id=channel,
+        uploader=channel
+    )
+
+
+## -- LIVE FILES
+def live_file_path(channel):
+    return "{}/{}/{}.{}".format(
+        media_folder,
+        sanitize(channel),
+        sanitize("!000-live-{}".format(channel)),
+        "strm"
+    )
+
+
+def write_live(channel, video_id, title, description, thumbnail, method, jellyfin_notifier=None):
+    """Create the !000-live-<channel> strm and nfo (and preview png) of a live stream."""
+    file_path = live_file_path(channel)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    video_name = "{} [{}]".format(title, video_id)
+
+    file_content = "http://{}:{}/{}/{}/{}".format(
+        ytdlp2strm_config['ytdlp2strm_host'],
+        ytdlp2strm_config['ytdlp2strm_port'],
+        source_platform,
+        method,
+        "{}@{}".format(
+            channel,
+            video_id
+        )
+    )
+
+    if not os.path.isfile(file_path):
+        f.folders().write_file(
+            file_path,
+            file_content
+        )
+        if jellyfin_notifier:
+            jellyfin_notifier.record(file_path)
+
+    ## -- BUILD VIDEO NFO FILE
+    n.nfo(
+        "episode",
+        "{}/{}".format(
+            media_folder,
+            channel
+        ),
+        {
+            "item_name" : sanitize(
+                "!000-live-{}".format(
+                    channel
+                )
+            ),
+            "title" : sanitize(f'!000-live-{video_name}'),
+            "upload_date" : "",
+            "year" : "",
+            "plot" : description.replace('\n', ' <br/>\n '),
+            "season" : "1",
+            "episode" : "",
+            "preview" : thumbnail
+        }
+    ).make_nfo()
+    ## -- END
+
+
+def remove_live(channel):
+    """Remove the live files of a channel, returns True if there were any."""
+    file_path = live_file_path(channel)
+    removed = False
+    for path in (file_path, file_path.replace('.strm', '.nfo'), file_path.replace('.strm', '.png')):
+        try:
+            os.remove(path)
+            removed = True
+        except OSError:
+            pass
+    return removed
+## -- END
+
+
 def video_id_exists_in_content(media_folder, video_id):
     for root, dirs, files in os.walk(media_folder):
         for file in files:
@@ -279,11 +410,19 @@ def video_id_exists_in_content(media_folder, video_id):
 
 ## -- MANDATORY TO_STRM FUNCTION 
 def to_strm(method):
+    # One library notification for the whole run, only if strm files were written
+    jellyfin_notifier = get_notifier(config)
+    # Artwork and live status of every channel in a few GQL requests
+    logins = [channel.replace('https://www.twitch.tv/', '') for channel in channels]
+    channels_info = gql.channels_info(logins, plugin_client(config))
+    # Offline channels skip the yt-dlp live lookup in Twitch.get_direct
+    l.log("twitch", f"{sum(bool(info['live']) for info in channels_info.values())} of {len(logins)} channels live")
+
     for twitch_channel in channels:
         log_text = ("Preparing channel {}".format(twitch_channel))
         l.log("twitch", log_text)
         twitch_channel = twitch_channel.replace('https://www.twitch.tv/', '')
-        twitch = Twitch(twitch_channel)
+        twitch = Twitch(twitch_channel, channels_info.get(twitch_channel))
 
         # -- MAKES CHANNEL DIR IF NOT EXIST,
         f.folders().make_clean_folder(
@@ -299,259 +438,335 @@ def to_strm(method):
             ytdlp2strm_config
         )
         ## -- END
-        # -- MAKES CHANNEL DIR IF NOT EXIST,
-        f.folders().make_clean_folder(
-            "{}/{}".format(
-                media_folder,  
-                sanitize(
+
+        ## -- BUILD CHANNEL NFO FILE
+        # Only when missing or when the cached artwork expired, it downloads the images
+        tvshow_path = "{}/{}/tvshow.nfo".format(media_folder, twitch.channel)
+        images = twitch.images
+        if twitch.images_refreshed or not os.path.isfile(tvshow_path):
+            n.nfo(
+                "tvshow",
+                "{}/{}".format(
+                    media_folder, 
                     "{}".format(
                         twitch.channel
                     )
-                )
-            ),
-            False,
-            ytdlp2strm_config
-        )
-        ## -- END
-
-        ## -- BUILD CHANNEL NFO FILE
-        n.nfo(
-            "tvshow",
-            "{}/{}".format(
-                media_folder, 
-                "{}".format(
-                    twitch.channel
-                )
-            ),
-            {
-                "title" : twitch.channel_name,
-                "plot" : "",
-                "landscape" : twitch.images['landscape'],
-                "poster" : twitch.images['poster'],
-                "studio" : "Twitch"
-            }
-        ).make_nfo()
+                ),
+                {
+                    "title" : twitch.channel_name,
+                    "plot" : "",
+                    "landscape" : images['landscape'],
+                    "poster" : images['poster'],
+                    "studio" : "Twitch"
+                }
+            ).make_nfo()
         ## -- END 
         
         ## -- GET ON AIR STREAMING
-        for line in twitch.direct:
-            file_path = "{}/{}/{}.{}".format(
-                media_folder,  
-                sanitize(
-                    "{}".format(
-                        twitch_channel)
-                    ), 
-                sanitize(
-                    "!000-live-{}".format(
-                        twitch_channel
-                    )
-                ), 
-                "strm"
+        live_items = [item for item in twitch.direct if item.media_id]
+        for item in live_items:
+            write_live(
+                twitch_channel,
+                item.media_id,
+                item.title,
+                item.description,
+                item.thumbnail,
+                method,
+                jellyfin_notifier
             )
-            if line != "":
-                if not 'ERROR' in line:
-                    line = line.replace('"', '')
-                    video_id = str(line).rstrip().split(';')[0]
-                    video_name = str(line).rstrip().split(';')[1]
-                    description = str(line).rstrip().split(';')[2]
-                    if description == "NA":
-                        description = ""
-                    thumbnail = str(line).rstrip().split(';')[3]
-                    date = datetime.strptime(str(line).rstrip().split(';')[4], '%Y%m%d')
-                    upload_date = date.strftime('%Y-%m-%d')
-                    year = date.year
-                    try:
-                        video_name.pop(3)
-                    except:
-                        pass
-
-                    video_name = "{} [{}]".format(
-                        ' '.join(
-                            video_name
-                        ),
-                        video_id
-                    )
-
-                    file_content = "http://{}:{}/{}/{}/{}".format(
-                        ytdlp2strm_config['ytdlp2strm_host'], 
-                        ytdlp2strm_config['ytdlp2strm_port'], 
-                        source_platform, 
-                        method, "{}@{}".format(
-                            twitch_channel, 
-                            video_id
-                            )
-                        )
-
-                    data = {
-                        "video_id" : video_id, 
-                        "video_name" : video_name
-                    }
+        if not live_items:
+            log_text = ("The channel is not currently live")
+            l.log("twitch", log_text)
+            remove_live(twitch_channel)
+        ## -- END
 
-                    if not os.path.isfile(file_path):
-                        f.folders().write_file(
-                            file_path, 
-                            file_content
-                        )
-                    ## -- BUILD VIDEO NFO FILE
-                    n.nfo(
-                        "episode",
-                        "{}/{}".format(
-                            media_folder, 
-                            "{}".format(
-                                twitch.channel
-                            )
-                        ),
-                        {
-                            "item_name" : sanitize(
-                                "!000-live-{}".format(
-                                    twitch.channel
-                                )
-                            ),
-                            "title" : sanitize(f'!000-live-{video_name}'),
-                            "upload_date" : "",
-                            "year" : "",
-                            "plot" : description.replace('\n', ' <br/>\n '),
-                            "season" : "1",
-                            "episode" : "",
-                            "preview" : thumbnail
-                        }
-                    ).make_nfo()
-                    ## -- END 
-            else:
-                log_text = ("The channel is not currently live")
-                l.log("twitch", log_text)
+        ## -- GET VIDEOS TAB
+        # Listed oldest first (--playlist-reverse), written as yt-dlp prints them
+        for item in twitch.videos:
+            if item.media_id and item.upload_date:
+                video_id = item.media_id
+                video_name = item.title.split(" ")
+                description = item.description
+                thumbnail = item.thumbnail
+                date = datetime.strptime(item.upload_date, '%Y%m%d')
+                upload_date = date.strftime('%Y-%m-%d')
+                year = date.year
                 try:
-                    os.remove( file_path )
-                    os.remove( file_path.replace('.strm','.nfo'))
-                    os.remove( file_path.replace('.strm','.png'))
+                    video_name.pop(3)
                 except:
                     pass
-        ## -- END
 
-        ## -- GET VIDEOS TAB
-        # Reverse video list so oldest videos get lower episode numbers
-        reversed_videos = list(reversed(twitch.videos))
-        for line in reversed_videos:
-            if line != "":
-                if not 'ERROR' in line:
-                    line = line.replace('"','')
-                    video_id = str(line).rstrip().split(';')[0]
-                    video_name = str(line).rstrip().split(';')[1].split(" ")
-                    description = str(line).rstrip().split(';')[2]
-                    if description == "NA":
-                        description = ""
-                    thumbnail = str(line).rstrip().split(';')[3]
-                    date = datetime.strptime(str(line).rstrip().split(';')[4], '%Y%m%d')
-                    upload_date = date.strftime('%Y-%m-%d')
-                    year = date.year
-                    try:
-                        video_name.pop(3)
-                    except:
-                        pass
-
-                    video_name = ' '.join(
-                        video_name
-                    )
-                    video_name = re.sub(r'\d{4}-\d{2}-\d{2} \d{4}', '', video_name).strip()
-                    video_name = "{} [{}]".format(
-                        video_name,
+                video_name = ' '.join(
+                    video_name
+                )
+                video_name = re.sub(r'\d{4}-\d{2}-\d{2} \d{4}', '', video_name).strip()
+                video_name = "{} [{}]".format(
+                    video_name,
+                    video_id
+                )
+
+                file_content = "http://{}:{}/{}/{}/{}".format(
+                    ytdlp2strm_config['ytdlp2strm_host'], 
+                    ytdlp2strm_config['ytdlp2strm_port'], 
+                    source_platform,
+                    method, 
+                    "{}@{}".format(
+                        twitch_channel, 
                         video_id
                     )
+                )
 
-                    file_content = "http://{}:{}/{}/{}/{}".format(
-                        ytdlp2strm_config['ytdlp2strm_host'], 
-                        ytdlp2strm_config['ytdlp2strm_port'], 
-                        source_platform,
-                        method, 
-                        "{}@{}".format(
-                            twitch_channel, 
-                            video_id
-                        )
+                channel_folder = sanitize(
+                    "{}".format(
+                        twitch.channel
                     )
+                )
+                
+                # Create season folder based on video year
+                season_folder = f"Season {year}"
+                folder_full_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
+                
+                # Format title with episode number
+                use_mmdd = (episode_format.lower() == 'mmdd')
+                formatted_title = format_episode_title(video_name, folder_full_path, upload_date, use_mmdd)
+                
+                file_path = "{}/{}/{}/{}.{}".format(
+                    media_folder,
+                    channel_folder,
+                    season_folder,
+                    sanitize(formatted_title),
+                    "strm"
+                )
 
-                    channel_folder = sanitize(
+                folder_path = "{}/{}".format(
+                    media_folder,  
+                    sanitize(
                         "{}".format(
-                            twitch.channel
-                        )
-                    )
-                    
-                    # Create season folder based on video year
-                    season_folder = f"Season {year}"
-                    folder_full_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
-                    
-                    # Format title with episode number
-                    use_mmdd = (episode_format.lower() == 'mmdd')
-                    formatted_title = format_episode_title(video_name, folder_full_path, upload_date, use_mmdd)
-                    
-                    file_path = "{}/{}/{}/{}.{}".format(
-                        media_folder,
-                        channel_folder,
-                        season_folder,
-                        sanitize(formatted_title),
-                        "strm"
-                    )
-
-                    folder_path = "{}/{}".format(
-                        media_folder,  
-                        sanitize(
-                            "{}".format(
-                                twitch_channel
-                            )
+                            twitch_channel
                         )
                     )
+                )
 
-                    if video_id_exists_in_content(folder_path, video_id):
-                        l.log("twitch", f'Video {video_id} already exists')
-                        continue
+                if video_id_exists_in_content(folder_path, video_id):
+                    l.log("twitch", f'Video {video_id} already exists')
+                    continue
 
-                    data = {
-                        "video_id" : video_id, 
-                        "video_name" : video_name
-                    }
-                    
-                    # Create season folder if it doesn't exist (BEFORE creating NFO)
-                    season_folder_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
-                    if not os.path.exists(season_folder_path):
-                        os.makedirs(season_folder_path, exist_ok=True)
-
-                    ## -- BUILD VIDEO NFO FILE
-                    n.nfo(
-                        "episode",
-                        "{}/{}/{}".format(
-                            media_folder, 
-                            "{}".format(
-                                twitch.channel
-                            ),
-                            season_folder
+                data = {
+                    "video_id" : video_id, 
+                    "video_name" : video_name
+                }
+                
+                # Create season folder if it doesn't exist (BEFORE creating NFO)
+                season_folder_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
+                if not os.path.exists(season_folder_path):
+                    os.makedirs(season_folder_path, exist_ok=True)
+
+                ## -- BUILD VIDEO NFO FILE
+                n.nfo(
+                    "episode",
+                    "{}/{}/{}".format(
+                        media_folder, 
+                        "{}".format(
+                            twitch.channel
                         ),
-                        {
-                            "item_name" : sanitize(formatted_title),
-                            "title" : sanitize(formatted_title),
-                            "upload_date" : upload_date,
-                            "year" : year,
-                            "plot" : description.replace('\n', ' <br/>\n '),
-                            "season" : "1",
-                            "episode" : "",
-                            "preview" : thumbnail
-                        }
-                    ).make_nfo()
-                    ## -- END
-
-                    if not os.path.isfile(file_path):
-                        f.folders().write_file(
-                            file_path, 
-                            file_content
-                        )
-        
-        # Notify Jellyfin/Emby after processing all videos for this channel
-        jellyfin_notifier = JellyfinNotifier(config)
-        if jellyfin_notifier.enabled:
-            jellyfin_notifier.notify_new_content(f"{media_folder}/{sanitize(twitch.channel)}")
+                        season_folder
+                    ),
+                    {
+                        "item_name" : sanitize(formatted_title),
+                        "title" : sanitize(formatted_title),
+                        "upload_date" : upload_date,
+                        "year" : year,
+                        "plot" : description.replace('\n', ' <br/>\n '),
+                        "season" : "1",
+                        "episode" : "",
+                        "preview" : thumbnail
+                    }
+                ).make_nfo()
+                ## -- END
+
+                if not os.path.isfile(file_path):
+                    f.folders().write_file(
+                        file_path, 
+                        file_content
+                    )
+                    jellyfin_notifier.record(file_path)
         ## --END
     
+    metadata.save()
+    jellyfin_notifier.flush()
     return True 
 ## -- END
 
+## -- URL RESOLUTION
+# Resolved stream URLs, short lived (signed playlist URLs)
+resolved_urls = TTLCache(maxsize=500, ttl=5 * 60)
+# Page URL that worked for each ID, tried alone next time
+winning_pages = TTLCache(maxsize=2000, ttl=24 * 60 * 60)
+
+
+def page_candidates(channel, video_id):
+    """
+    Page URLs that may play channel@video_id, most likely first. The shape
+    of the ID tells which one: v<digits> is a VOD, plain digits may be a VOD
+    or the ID of the live stream, anything else is the live channel.
+    """
+    vod = f'https://www.twitch.tv/videos/{video_id.lstrip("v")}'
+    live = f'https://www.twitch.tv/{channel}'
+    if re.fullmatch(r'v?\d+', video_id):
+        return [vod, live]
+    return [live]
+
+
+def get_url_command(page_url):
+    # Stream URL of the best format and the master playlist it comes from
+    command = [
+        'yt-dlp',
+        '-f', 'best',
+        '--no-warnings',
+        '--print', '%(url)s',
+        '--print', '%(manifest_url)s',
+        page_url
+    ]
+    set_cookies_to_command(command)
+    return command
+
+
+def race(page_urls):
+    """
+    Run yt-dlp --get-url for every page URL at once. The first candidate
+    that answers wins once every candidate before it has failed (a live
+    channel must not win over the VOD asked for), the others are killed
+
+    Returns:
+        tuple: (page_url, output lines) or (None, None)
+    """
+    results = queue.Queue()
+    processes = []
+
+    def wait(index, process):
+        output = process.communicate()[0].decode('utf-8', 'replace').strip()
+        results.put((index, output if process.returncode == 0 and 'ERROR' not in output else ''))
+
+    for index, page_url in enumerate(page_urls):
+        process = w.worker(get_url_command(page_url)).pipe()
+        processes.append(process)
+        threading.Thread(target=wait, args=(index, process), daemon=True).start()
+
+    outputs = {}
+    try:
+        for _ in page_urls:
+            index, output = results.get()
+            outputs[index] = output
+            # First candidate in order whose predecessors all failed
+            for i, page_url in enumerate(page_urls):
+                if i not in outputs:
+                    break
+                if outputs[i]:
+                    return page_url, outputs[i].split('\n')
+        return None, None
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+
+
+def resolve(twitch_id):
+    """(page_url, stream_url, manifest_url) of channel@video_id, cached per ID."""
+    if twitch_id in resolved_urls:
+        return resolved_urls[twitch_id]
+
+    channel, video_id = twitch_id.split("@")[0], twitch_id.split("@")[1]
+    candidates = page_candidates(channel, video_id)
+    page_url, lines = None, None
+
+    winner = winning_pages.get(twitch_id)
+    if winner in candidates:
+        page_url, lines = race([winner])
+        candidates.remove(winner)
+    if not lines and candidates:
+        page_url, lines = race(candidates)
+
+    if not lines:
+        l.log("twitch", f"Unable to resolve {twitch_id}")
+        return None, None, None
+
+    stream_url = lines[0]
+    manifest_url = lines[1] if len(lines) > 1 and lines[1].startswith('http') else None
+    winning_pages[twitch_id] = page_url
+    resolved_urls[twitch_id] = (page_url, stream_url, manifest_url)
+    return page_url, stream_url, manifest_url
+
+
+def warm(twitch_id, mode):
+    """Prefetch of the next VOD: resolve and cache its URLs. Live channels change, nothing to warm."""
+    if '@' not in twitch_id:
+        abort(404)
+    _, stream_url, _ = resolve(twitch_id)
+    if not stream_url:
+        return Response('Unable to resolve', status=502)
+    return jsonify({'bytes': 0})
+
+
+def hls_policies():
+    """Variant selection policies from the plugin config (highest bandwidth by default)."""
+    policies = []
+    if config.get('hls_max_bandwidth'):
+        policies.append(hls.BandwidthCap(config['hls_max_bandwidth']))
+    if config.get('hls_max_height'):
+        policies.append(hls.ResolutionCap(config['hls_max_height']))
+    return policies
+
+
+def filter_master(content):
+    """
+    Master playlist with only the selected variant. Twitch describes every
+    variant with a TYPE=VIDEO rendition without URI, the one of the selected
+    variant is kept.
+    """
+    playlist = hls.MasterPlaylist.parse(content)
+    variant = hls.select_variant(playlist.variants, hls_policies())
+    if not variant:
+        return content
+    group = variant.attrs.get('VIDEO')
+    output = ['#EXTM3U']
+    output += [r.line for r in playlist.renditions if r.type == 'VIDEO' and r.group_id == group]
+    output += [variant.line, variant.uri]
+    return '\n'.join(output) + '\n'
+
+
+def master_playlist(manifest_url):
+    """(content, url) of the filtered master playlist, None on error."""
+    try:
+        response = plugin_client(config).get(manifest_url)
+        response.raise_for_status()
+    except Exception as e:
+        l.log("twitch", f"Unable to get the master playlist: {e}")
+        return None
+    response.encoding = 'utf-8'
+    return filter_master(response.text), response.url
+
+
+def fresh_master(twitch_id):
+    """Master playlist of twitch_id resolved again, the HLS proxy asks for it when the CDN URLs expire."""
+    resolved_urls.pop(twitch_id, None)
+    manifest_url = resolve(twitch_id)[2]
+    return master_playlist(manifest_url) if manifest_url else None
+
+
+def master_response(twitch_id, manifest_url):
+    """Filtered (and proxied when hls_proxy is set) master playlist, None on error."""
+    master = master_playlist(manifest_url)
+    if not master:
+        return None
+    content, url = master
+    if hls_proxy:
+        content = hls_proxy.rewrite_playlist(content, url, source=lambda: fresh_master(twitch_id))
+    flask_response = Response(content, mimetype='application/vnd.apple.mpegurl')
+    flask_response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    flask_response.headers['Access-Control-Allow-Origin'] = '*'
+    return flask_response
+## -- END
+
 ## --  REDIRECT VIDEO DATA 
 def direct(twitch_id, remote_addr): 
     current_time = time.time()
@@ -563,99 +778,27 @@ def direct(twitch_id, remote_addr):
         l.log("twitch", log_text)
         recent_requests[cache_key] = current_time
 
-    channel = twitch_id.split("@")[0]
-    video_id = twitch_id.split("@")[1]
-    command = [
-        'yt-dlp', 
-        '-f', 'best',
-        '--no-warnings',
-        f'https://www.twitch.tv/videos/{video_id}',
-        '--get-url'
-    ]
-    set_cookies_to_command(command)
-
-    twitch_url = w.worker(command).output()
-
-    if 'ERROR' in twitch_url or not twitch_url:
-        command_retry = [
-            'yt-dlp', 
-            '-f', 'best',
-            '--no-warnings',
-            f'https://www.twitch.tv/videos/{video_id.replace("v", "")}',
-            '--get-url'
-        ]
-        set_cookies_to_command(command_retry)
-        twitch_url = w.worker(command_retry).output()
-
-        if 'ERROR' in twitch_url or not twitch_url:
-            command_live = [
-                'yt-dlp', 
-                '-f', 'best',
-                '--no-warnings',
-                f'https://www.twitch.tv/{channel}',
-                '--get-url'
-            ]
-            set_cookies_to_command(command_live)
-            twitch_url = w.worker(command_live).output()
-
-    twitch_url = twitch_url.strip()
+    page_url, twitch_url, manifest_url = resolve(twitch_id)
+    if not twitch_url:
+        abort(404)
+    # Filtered master playlist only when there is something to filter or proxy
+    if manifest_url and (hls_policies() or hls_proxy):
+        flask_response = master_response(twitch_id, manifest_url)
+        if flask_response:
+            return flask_response
     return redirect(twitch_url, code=301)
 
 def bridge(twitch_id):
-    channel = twitch_id.split("@")[0]
-    video_id = twitch_id.split("@")[1]
-
-    turl = 'https://www.twitch.tv/videos/{}'.format(
-        video_id
-    )
-    command = [
-        'yt-dlp', 
-        '-f', 'best',
-        '--no-warnings',
-        turl,
-        '--get-url'
-    ]
-    set_cookies_to_command(command)
-    twitch_url = w.worker(command).output()
-
-    if 'ERROR' in twitch_url:
-
-        turl = 'https://www.twitch.tv/videos/{}'.format(
-            video_id.replace(
-                'v',
-                ''
-            )
-        )
-
-        command_retry = [
-            'yt-dlp', 
-            '-f', 'best',
-            '--no-warnings',
-            turl,
-            '--get-url'
-        ]
-        set_cookies_to_command(command_retry)
-        twitch_url = w.worker(command_retry).output()
-
-        if 'ERROR' in twitch_url:
-
-            turl = 'https://www.twitch.tv/{}'.format(
-                channel          
-            )
-
-            command_live = [
-                'yt-dlp', 
-                '-f', 'best',
-                '--no-warnings',
-                'https://www.twitch.tv/{}'.format(
-                    channel          
-                ),
-                '--get-url'
-            ]
-            set_cookies_to_command(command_live)
-            twitch_url = w.worker(command_live).output()
-
+    # The bridge reads the URL already resolved, yt-dlp doesn't ask Twitch again
+    page_url, twitch_url, manifest_url = resolve(twitch_id)
+    if not twitch_url:
+        abort(404)
 
+    # Live streams are served as a playlist, players fetch the segments themselves
+    if manifest_url and '/videos/' not in page_url:
+        flask_response = master_response(twitch_id, manifest_url)
+        if flask_response:
+            return flask_response
 
     def generate():
         startTime = time.time()
@@ -667,7 +810,7 @@ def bridge(twitch_id):
             '-f', 'best',
             '--no-warnings',
             '--restrict-filenames',
-            turl
+            twitch_url
         ]
 
         set_cookies_to_command(command)
@@ -675,30 +818,34 @@ def bridge(twitch_id):
         process = w.worker(command).pipe()
         try:
             while True:
-                # Get some data from ffmpeg
-                line = process.stdout.read(1024)
+                # Get some data from yt-dlp
+                chunk = process.stdout.read(1024)
+
+                # EOF, yt-dlp has finished (or failed)
+                if not chunk:
+                    break
 
                 # We buffer everything before outputting it
-                buffer.append(line)
+                buffer.append(chunk)
 
                 # Minimum buffer time, 3 seconds
                 if sentBurst is False and time.time() > startTime + 3 and len(buffer) > 0:
                     sentBurst = True
+                    l.log("twitch", f"Send initial burst of {len(buffer) - 2} chunks")
 
                     for i in range(0, len(buffer) - 2):
-                        log_text = ("Send initial burst #", i)
-                        l.log("twitch", log_text)
                         yield buffer.pop(0)
 
                 elif time.time() > startTime + 3 and len(buffer) > 0:
                     yield buffer.pop(0)
 
-                process.poll()
-                if isinstance(process.returncode, int):
-                    if process.returncode > 0:
-                        log_text = ('yt-dlp Error', process.returncode)
-                        l.log("twitch", log_text)
-                    break
+            # Send what is left in the buffer
+            while buffer:
+                yield buffer.pop(0)
+
+            process.wait()
+            if process.returncode:
+                l.log("twitch", f"yt-dlp Error {process.returncode}")
         finally:
             process.kill()
 
@@ -708,4 +855,28 @@ def bridge(twitch_id):
     ) 
 
 
-## -- END
\ No newline at end of file
+## -- END
+
+
+def proxy_playlist(token):
+    # Media playlists are fetched again on every request, live edges stay fresh
+    if not hls_proxy:
+        abort(404)
+    content = hls_proxy.playlist(token)
+    if content is None:
+        abort(404)
+    flask_response = Response(content, mimetype='application/vnd.apple.mpegurl')
+    flask_response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    flask_response.headers['Access-Control-Allow-Origin'] = '*'
+    return flask_response
+
+
+def proxy_segment(token):
+    if not hls_proxy:
+        abort(404)
+    data, content_type = hls_proxy.segment(token)
+    if data is None:
+        abort(404)
+    flask_response = Response(data, mimetype=content_type)
+    flask_response.headers['Access-Control-Allow-Origin'] = '*'
+    return flask_response
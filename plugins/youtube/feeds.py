@@ -0,0 +1,137 @@
+"""
+YouTube uploads feed fast path
+Checks the public feeds/videos.xml of every known channel before running yt-dlp
+"""
+
+import json
+import os
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from clases.log import log as l
+from clases.http_client import client
+
+FEED_URL = "https://www.youtube.com/feeds/videos.xml?channel_id={}"
+FEED_NS = {
+    'atom': 'http://www.w3.org/2005/Atom',
+    'yt': 'http://www.youtube.com/xml/schemas/2015'
+}
+
+
+def parse_feed(xml_text):
+    """
+    Parse an uploads feed
+
+    Returns:
+        list: (video_id, published datetime or None) tuples, newest first
+    """
+    root = ET.fromstring(xml_text)
+    entries = []
+    for entry in root.findall('atom:entry', FEED_NS):
+        video_id = entry.findtext('yt:videoId', default='', namespaces=FEED_NS)
+        if not video_id:
+            continue
+        published = entry.findtext('atom:published', default='', namespaces=FEED_NS)
+        try:
+            published = datetime.fromisoformat(published)
+        except ValueError:
+            published = None
+        entries.append((video_id, published))
+    return entries
+
+
+class FeedChecker:
+    def __init__(self, state_file, workers=8, timeout=10, proxy_url=""):
+        """
+        Args:
+            state_file (str): JSON file holding channel_id, seen video IDs and
+                last sync time for every channel of the channel list
+            workers (int): Concurrent feed requests
+            timeout (int): Timeout in seconds for each feed request
+            proxy_url (str): Optional proxy for the feed requests
+        """
+        self.state_file = state_file
+        self.workers = workers
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.state = self.load()
+
+        self.session = client(proxy_url)
+
+    def load(self):
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as file:
+                    return json.load(file)
+            except (ValueError, OSError) as e:
+                l.log("youtube", f"Unable to read feed state {self.state_file}: {e}")
+        return {}
+
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.state, indent=4)
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as file:
+                file.write(data)
+        except OSError as e:
+            l.log("youtube", f"Unable to write feed state {self.state_file}: {e}")
+
+    def fetch(self, channel_id):
+        response = self.session.get(FEED_URL.format(channel_id), timeout=self.timeout)
+        response.raise_for_status()
+        return parse_feed(response.content)
+
+    def has_updates(self, channel):
+        """
+        True when the channel must go through the full yt-dlp listing: no
+        resolved channel_id yet, feed error, or unseen uploads newer than the
+        last sync.
+        """
+        with self.lock:
+            known = self.state.get(channel)
+        if not known or not known.get('channel_id'):
+            return True
+
+        try:
+            entries = self.fetch(known['channel_id'])
+        except Exception as e:
+            l.log("youtube", f"Feed error for {channel}: {e}")
+            return True
+
+        seen = set(known.get('seen', []))
+        last_sync = known.get('last_sync')
+        last_sync = datetime.fromisoformat(last_sync) if last_sync else None
+
+        for video_id, published in entries:
+            if video_id in seen:
+                continue
+            if last_sync is None or published is None or published > last_sync:
+                return True
+
+        # Nothing new, keep the feed IDs so old entries never count as new
+        with self.lock:
+            known['seen'] = list(seen.union(video_id for video_id, _ in entries))
+        return False
+
+    def channels_with_updates(self, channels):
+        """Check all channel feeds concurrently, return the channels to list with yt-dlp."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self.has_updates, channels))
+        self.save()
+        return [channel for channel, updated in zip(channels, results) if updated]
+
+    def remember(self, channel, channel_id, video_ids):
+        """Record the resolved channel_id and listed videos after a full listing."""
+        if not channel_id:
+            return
+        with self.lock:
+            known = self.state.setdefault(channel, {})
+            if known.get('channel_id') != channel_id:
+                known['seen'] = []
+            known['channel_id'] = channel_id
+            # Feeds only carry the last 15 uploads, no need to grow forever
+            known['seen'] = (list(video_ids) + [
+                v for v in known.get('seen', []) if v not in video_ids
+            ])[:100]
+            known['last_sync'] = datetime.now(timezone.utc).isoformat()
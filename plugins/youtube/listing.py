@@ -0,0 +1,139 @@
+"""
+YouTube listing engine
+One yt-dlp listing command per source, parsed into compact records and cached
+so a source listed as both video and audio is only extracted once.
+"""
+
+from cachetools import TTLCache
+from clases.worker import worker as w
+from clases.media import MediaItem
+
+CHANNEL = 'channel'
+PLAYLIST = 'playlist'
+SEARCH = 'search'
+
+
+class Source:
+    """What to list: a channel URL, a playlist URL or a search keyword."""
+    __slots__ = ('kind', 'target', 'channel_id', 'uploader_id')
+
+    def __init__(self, kind, target, channel_id=None, uploader_id=None):
+        self.kind = kind
+        self.target = target
+        # Playlists and other sources without a real owner override these
+        self.channel_id = channel_id
+        self.uploader_id = uploader_id
+
+
+def parse_source(entry):
+    """
+    Entry of channel_list.json -> (Source, audio). extractaudio- lists it as
+    audio, then keyword- is a search, list- a playlist (ID or URL) and
+    anything else a channel.
+    """
+    audio = entry.startswith('extractaudio-')
+    if audio:
+        entry = entry[len('extractaudio-'):]
+
+    if entry.startswith('keyword-'):
+        return Source(SEARCH, entry[len('keyword-'):]), audio
+
+    if entry.startswith('list-'):
+        url = entry[len('list-'):]
+        if 'www.youtube' not in url:
+            url = f'https://www.youtube.com/playlist?list={url}'
+        return Source(PLAYLIST, url), audio
+
+    # Avoid double https://
+    if not entry.startswith('http') and 'www.youtube' not in entry:
+        entry = f'https://www.youtube.com/{entry}'
+    return Source(CHANNEL, entry), audio
+
+
+def item_from_info(data, source):
+    return MediaItem(
+        'youtube',
+        data.get('id'),
+        title=data.get('title'),
+        upload_date=data.get('upload_date'),
+        thumbnail=data.get('thumbnail'),
+        description=data.get('description'),
+        channel_id=source.channel_id or data.get('channel_id'),
+        uploader=source.uploader_id or data.get('uploader_id')
+    )
+
+
+class ListingEngine:
+    def __init__(self, videos_limit, days_dateafter, ttl=300):
+        """
+        Args:
+            videos_limit (str|int): Max entries per source (--playlist-end)
+            days_dateafter (str|int): Only channel uploads newer than this
+            ttl (int): Seconds a finished listing stays cached
+        """
+        self.videos_limit = str(videos_limit)
+        self.days_dateafter = str(days_dateafter)
+        self.cache = TTLCache(maxsize=128, ttl=ttl)
+
+    def cache_key(self, source):
+        return (source.kind, source.target, self.videos_limit, self.days_dateafter)
+
+    def build_command(self, source):
+        command = [
+            'yt-dlp',
+            '--compat-options', 'no-youtube-channel-redirect',
+            '--compat-options', 'no-youtube-unavailable-videos',
+        ]
+
+        if source.kind == CHANNEL:
+            command += ['--dateafter', f"today-{self.days_dateafter}days"]
+
+        command += [
+            '--playlist-end', self.videos_limit,
+            '--no-warning',
+            # Oldest first, so records can be consumed while yt-dlp is still running
+            '--playlist-reverse',
+            '--dump-json'
+        ]
+
+        if source.kind == CHANNEL:
+            target = source.target
+            if not '/streams' in target:
+                target = f'{target}/videos'
+            command.append(target)
+        elif source.kind == SEARCH:
+            command.append(f'ytsearch{self.videos_limit}:["{source.target}"]')
+        else:
+            command.append(source.target)
+
+        return command
+
+    def list(self, source, prepare=None, audio=False):
+        """
+        Yield MediaItems for a source as yt-dlp outputs them
+
+        Args:
+            source (Source): Source descriptor
+            prepare (callable): Adds cookies/language/proxy args to the command
+            audio (bool): Yield the audio variant of each record
+        """
+        key = self.cache_key(source)
+        records = self.cache.get(key)
+
+        if records is None:
+            command = self.build_command(source)
+            if prepare:
+                prepare(command)
+
+            records = []
+            for data in w.worker(command).stream_json():
+                record = item_from_info(data, source)
+                records.append(record)
+                yield record.as_audio() if audio else record
+
+            # Only complete listings are cached
+            self.cache[key] = tuple(records)
+            return
+
+        for record in records:
+            yield record.as_audio() if audio else record
@@ -1,6 +1,6 @@
 from __main__ import app
-from plugins.youtube.youtube import direct, bridge, download
-from flask import request, Response  # Importa request y Response desde Flask
+from plugins.youtube.youtube import direct, bridge, download, proxy_playlist, proxy_segment, stream, stream_metrics, warm
+from flask import request, Response, jsonify  # Importa request y Response desde Flask
 
 ### YOUTUBE ZONE
 #Redirect to best pre-merget format youtube url
@@ -15,10 +15,37 @@ def youtube_direct(youtube_id):
         return response
     return direct(youtube_id, request.remote_addr)
 
+#Stable URL, proxied to the current upstream file and re-resolved when it expires
+@app.route("/youtube/stream/<youtube_id>")
+def youtube_stream(youtube_id):
+    return stream(youtube_id, request.headers.get('Range'))
+
+#Prefetch of the next item, ?mode=resolve|download
+@app.route("/youtube/warm/<youtube_id>")
+def youtube_warm(youtube_id):
+    return warm(youtube_id, request.args.get('mode', 'resolve'))
+
+@app.route("/youtube/stream_metrics")
+def youtube_stream_metrics():
+    return jsonify(stream_metrics())
+
+#HLS proxy mode (hls_proxy in config), playlists and segments served by ytdlp2STRM
+@app.route("/youtube/proxy/playlist/<token>")
+def youtube_proxy_playlist(token):
+    return proxy_playlist(token)
+
+@app.route("/youtube/proxy/segment/<token>")
+def youtube_proxy_segment(token):
+    return proxy_segment(token)
+
 #Redirect to best pre-merget format youtube url
 @app.route("/youtube/bridge/<youtube_id>")
 def youtube_bridge(youtube_id):
-    return bridge(youtube_id)
+    return bridge(
+        youtube_id,
+        request.headers.get('Range'),
+        request.args.get('t', 0, type=float)
+    )
 
 #Keep URL from v0 version
 @app.route("/youtube/redirect/<youtube_id>")
@@ -29,4 +56,4 @@ def youtube_redirect(youtube_id):
 #Download video and semd data throught http (serve video duration info, disk usage **clean_old_videos fucntion save your money)
 @app.route("/youtube/download/<youtube_id>")
 def youtube_download(youtube_id):
-    return download(youtube_id)
+    return download(youtube_id, request.headers.get('Range'))
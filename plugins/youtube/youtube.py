@@ -3,20 +3,29 @@ import json
 import time
 import platform
 import subprocess
-import requests
+import threading
 import html
 import re
 from datetime import datetime
 from cachetools import TTLCache
 from utils.episode_numbering import format_episode_title
 from utils.sanitize import sanitize
-from flask import stream_with_context, Response, send_file, redirect, abort, request
+from utils import hls
+from utils.mp4 import FragmentIndex
+from flask import stream_with_context, Response, send_file, redirect, abort, jsonify
 from clases.config import config as c
 from clases.worker import worker as w
 from clases.folders import folders as f
 from clases.nfo import nfo as n
 from clases.log import log as l
-from clases.jellyfin_notifier.jellyfin_notifier import JellyfinNotifier
+from clases.jellyfin_notifier import get_notifier
+from clases.http_client import plugin_client
+from clases.hls_proxy import HlsProxy, SegmentCache
+from clases.resolver import StreamResolver
+from clases.downloads import DownloadManager
+from clases.media_cache import media_cache
+from plugins.youtube.feeds import FeedChecker
+from plugins.youtube import listing
 
 recent_requests = TTLCache(maxsize=200, ttl=30)
 video_info_cache = TTLCache(maxsize=1000, ttl=60 * 60)  # 1 hour cache for original language probing
@@ -70,6 +79,39 @@ else:
     proxy = False
     proxy_url = ""
 
+# Check uploads feeds before listing channels with yt-dlp
+feed_fast_path = str(config.get('feed_fast_path', 'False')).lower() == 'true'
+feed_state_file = config.get('feed_state_file', './plugins/youtube/feed_state.json')
+
+listing_engine = listing.ListingEngine(videos_limit, days_dateafter)
+
+downloads = DownloadManager()
+
+# Seek indexes of the fragmented MP4 downloads, by (youtube_id, inode)
+fragment_indexes = TTLCache(maxsize=64, ttl=60 * 60)
+fragment_indexes_lock = threading.Lock()
+
+# Stable /youtube/stream/<id> URLs, re-resolved when googlevideo URLs expire
+stream_resolver = StreamResolver(
+    'youtube',
+    lambda youtube_id, refresh: resolve_stream_url(youtube_id, refresh),
+    proxy_url=proxy_url if proxy else ""
+)
+
+# Serve HLS playlists and segments through ytdlp2STRM instead of googlevideo
+hls_proxy_enabled = str(config.get('hls_proxy', 'False')).lower() == 'true'
+hls_proxy = None
+if hls_proxy_enabled:
+    hls_proxy = HlsProxy(
+        f'http://{host}:{port}/youtube/proxy',
+        SegmentCache(
+            int(config.get('hls_cache_memory_mb', 64)) * 1024 * 1024,
+            int(config.get('hls_cache_disk_mb', 512)) * 1024 * 1024,
+            config.get('hls_cache_dir', './temp/hls_cache')
+        ),
+        proxy_url=proxy_url if proxy else ""
+    )
+
 ## -- END
 
 
@@ -134,14 +176,14 @@ def fmt_best_av(orig_lang):
     return "bestvideo*+bestaudio[language^=en]/bestvideo*+bestaudio/best"
 
 
-def fetch_info_json_for_video(youtube_id):
+def fetch_info_json_for_video(youtube_id, refresh=False):
     """
     Lightweight info probe to learn original language for format preference.
     youtube_id may be raw ID or full URL.
-    Cached for performance.
+    Cached for performance, refresh=True probes again (expired format URLs).
     """
     cache_key = youtube_id
-    if cache_key in video_info_cache:
+    if not refresh and cache_key in video_info_cache:
         return video_info_cache[cache_key]
 
     url = youtube_id
@@ -171,6 +213,60 @@ def fetch_info_json_for_video(youtube_id):
         return None
 
 
+# Single-file format kinds
+FORMAT_AV = 'av'
+FORMAT_VIDEO = 'video'
+FORMAT_AUDIO = 'audio'
+
+
+def pick_format(info, kind=FORMAT_AV):
+    """
+    Best single-file format of a probe: progressive A/V, video-only, or
+    audio-only (original language, then English).
+    HLS/DASH manifests are skipped, they can't be proxied as one file.
+    """
+    if not isinstance(info, dict):
+        return None
+    orig = get_original_audio_lang(info)
+
+    best = None
+    best_key = None
+    for fmt in info.get('formats', []):
+        if not fmt.get('url') or fmt.get('protocol') not in ('https', 'http'):
+            continue
+        has_video = fmt.get('vcodec') not in (None, 'none')
+        has_audio = fmt.get('acodec') not in (None, 'none')
+        if kind == FORMAT_AUDIO:
+            if has_video or not has_audio:
+                continue
+            language = _normalize_lang(fmt.get('language'))
+            key = (
+                bool(orig) and language == orig,
+                language == 'en',
+                fmt.get('abr') or 0
+            )
+        else:
+            if not has_video or has_audio != (kind == FORMAT_AV):
+                continue
+            key = (fmt.get('height') or 0, fmt.get('tbr') or 0)
+        if best_key is None or key > best_key:
+            best = fmt
+            best_key = key
+
+    return best
+
+
+def pick_stream_url(info, audio=False):
+    fmt = pick_format(info, FORMAT_AUDIO if audio else FORMAT_AV)
+    return fmt['url'] if fmt else None
+
+
+def resolve_stream_url(youtube_id, refresh=False):
+    raw_id = youtube_id.split('-audio')[0]
+    info = fetch_info_json_for_video(raw_id, refresh)
+    return pick_stream_url(info, '-audio' in youtube_id)
+
+
 class Youtube:
     def __init__(self, channel=None):
         self.channel = channel
@@ -181,285 +277,37 @@ class Youtube:
         self.channel_landscape = None
 
     def get_results(self):
-        if 'extractaudio-' in self.channel:
-            islist = False
-            self.channel_url = self.channel.replace(
-                'extractaudio-',
-                ''
-            )
-            if 'list-' in self.channel:
-                islist = True
-                self.channel_url = self.channel.replace(
-                    'list-',
-                    ''
-                )
-                if not 'www.youtube' in self.channel_url:
-                    self.channel_url = f'https://www.youtube.com/playlist?list={self.channel_url}'
-            else:
-                # Normalize URL - avoid double https://
-                if self.channel_url.startswith('http'):
-                    # Already a full URL, use as-is
-                    pass
-                elif not 'www.youtube' in self.channel_url:
-                    self.channel_url = f'https://www.youtube.com/{self.channel_url}'
-
-            self.channel_name = self.get_channel_name()
-            self.channel_description = self.get_channel_description() if not islist else f'Playlist {self.channel_name}'
-            thumbs = self.get_channel_images()
-            self.channel_poster = thumbs['poster']
-            self.channel_landscape = thumbs['landscape']
-
-            return self.get_channel_audios() if not islist else self.get_list_audios()
-
-        elif 'keyword' in self.channel:
-            return self.get_keyword_videos()
-
-        elif 'list' in self.channel:
-            self.channel_url = self.channel.replace(
-                'list-',
-                ''
-            )
-            if not 'www.youtube' in self.channel_url:
-                self.channel_url = f'https://www.youtube.com/playlist?list={self.channel_url}'
+        source, audio = listing.parse_source(self.channel)
+        if source.kind == listing.SEARCH:
+            return self.get_videos(source, audio=audio)
 
-            self.channel_name = self.get_channel_name()
+        self.channel_url = source.target
+        self.channel_name = self.get_channel_name()
+        if source.kind == listing.PLAYLIST:
             self.channel_description = f'Playlist {self.channel_name}'
-            thumbs = self.get_channel_images()
-            self.channel_poster = thumbs['poster']
-            self.channel_landscape = thumbs['landscape']
-            return self.get_list_videos()
-
+            source = self.playlist_source()
         else:
-            # Normalize URL - avoid double https://
-            if self.channel.startswith('http'):
-                # Already a full URL, use as-is
-                self.channel_url = self.channel
-            elif not 'www.youtube' in self.channel:
-                self.channel_url = f'https://www.youtube.com/{self.channel}'
-            else:
-                self.channel_url = self.channel
-
-            self.channel_name = self.get_channel_name()
             self.channel_description = self.get_channel_description()
-            thumbs = self.get_channel_images()
-            self.channel_poster = thumbs['poster']
-            self.channel_landscape = thumbs['landscape']
-            return self.get_channel_videos()
-
-    def get_list_videos(self):
-        command = [
-            'yt-dlp',
-            '--compat-options', 'no-youtube-channel-redirect',
-            '--compat-options', 'no-youtube-unavailable-videos',
-            '--playlist-start', '1',
-            '--playlist-end', str(videos_limit),
-            '--no-warning',
-            '--dump-json',
-            self.channel_url
-        ]
-        self.set_cookies(command)
-        self.set_language(command)
-        result = w.worker(command).output()
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-
-                video = {
-                    'id': data.get('id'),
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': self.channel_url.split('list=')[1],
-                    'uploader_id': sanitize(self.channel_name)
-                }
-                videos.append(video)
-
-        return videos
-
-    def get_keyword_videos(self):
-        keyword = self.channel.split('-')[1]
-        command = [
-            'yt-dlp',
-            '-f', 'best', 'ytsearch:["{}"]'.format(keyword),
-            '--compat-options', 'no-youtube-channel-redirect',
-            '--compat-options', 'no-youtube-unavailable-videos',
-            '--playlist-start', '1',
-            '--playlist-end', videos_limit,
-            '--no-warning',
-            '--dump-json'
-        ]
-        self.set_cookies(command)
-        self.set_language(command)
-
-        if config['days_dateafter'] == "0":
-            command.pop(8)
-            command.pop(8)
-
-        result = w.worker(command).output()
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-
-                video = {
-                    'id': data.get('id'),
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': data.get('channel_id'),
-                    'uploader_id': data.get('uploader_id')
-                }
-                videos.append(video)
-
-        return videos
-
-    def get_keyword_audios(self):
-        keyword = self.channel.split('-')[1]
-        command = [
-            'yt-dlp',
-            '-f', 'best', 'ytsearch10:["{}"]'.format(keyword),
-            '--compat-options', 'no-youtube-channel-redirect',
-            '--compat-options', 'no-youtube-unavailable-videos',
-            '--playlist-start', '1',
-            '--playlist-end', videos_limit,
-            '--no-warning',
-            '--dump-json'
-        ]
-        self.set_cookies(command)
-        self.set_language(command)
+        thumbs = self.get_channel_images()
+        self.channel_poster = thumbs['poster']
+        self.channel_landscape = thumbs['landscape']
+        return self.get_videos(source, audio=audio)
+
+    def playlist_source(self):
+        # Playlist videos are grouped under the playlist, not under each uploader
+        return listing.Source(
+            listing.PLAYLIST,
+            self.channel_url,
+            channel_id=self.channel_url.split('list=')[1],
+            uploader_id=sanitize(self.channel_name)
+        )
 
-        if config['days_dateafter'] == "0":
-            command.pop(8)
-            command.pop(8)
-
-        result = w.worker(command).output()
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-
-                video = {
-                    'id': f"{data.get('id')}-audio",
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': data.get('channel_id'),
-                    'uploader_id': data.get('uploader_id')
-                }
-                videos.append(video)
-
-        return videos
-
-    def get_channel_audios(self):
-        cu = self.channel
-
-        if not '/streams' in self.channel:
-            cu = f'{self.channel_url}/videos'
-
-        command = [
-            'yt-dlp',
-            '--compat-options', 'no-youtube-channel-redirect',
-            '--compat-options', 'no-youtube-unavailable-videos',
-            '--dateafter', f"today-{days_dateafter}days",
-            '--playlist-start', '1',
-            '--playlist-end', str(videos_limit),
-            '--no-warning',
-            '--dump-json',
-            f'{cu}'
-        ]
-        self.set_cookies(command)
-        self.set_language(command)
+    def get_videos(self, source, audio=False):
+        return listing_engine.list(source, self.prepare_listing, audio)
 
-        result = w.worker(command).output()
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-                video = {
-                    'id': f"{data.get('id')}-audio",
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': data.get('channel_id'),
-                    'uploader_id': data.get('uploader_id')
-                }
-                videos.append(video)
-
-        return videos
-
-    def get_list_audios(self):
-        command = [
-            'yt-dlp',
-            '--compat-options', 'no-youtube-channel-redirect',
-            '--compat-options', 'no-youtube-unavailable-videos',
-            '--playlist-start', '1',
-            '--playlist-end', str(videos_limit),
-            '--no-warning',
-            '--dump-json',
-            self.channel_url
-        ]
-        self.set_cookies(command)
-        self.set_language(command)
-        result = w.worker(command).output()
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-
-                video = {
-                    'id': f"{data.get('id')}-audio",
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': self.channel_url.split('list=')[1],
-                    'uploader_id': sanitize(self.channel_name)
-                }
-                videos.append(video)
-
-        return videos
-
-    def get_channel_videos(self):
-        cu = self.channel
-
-        if not '/streams' in self.channel:
-            cu = f'{self.channel}/videos'
-
-        command = [
-            'yt-dlp',
-            '--compat-options', 'no-youtube-channel-redirect',
-            '--compat-options', 'no-youtube-unavailable-videos',
-            '--dateafter', f"today-{days_dateafter}days",
-            '--playlist-start', '1',
-            '--playlist-end', str(videos_limit),
-            '--no-warning',
-            '--dump-json',
-            f'{cu}'
-        ]
+    def prepare_listing(self, command):
         self.set_cookies(command)
         self.set_language(command)
-        result = w.worker(command).output()
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-                video = {
-                    'id': data.get('id'),
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': data.get('channel_id'),
-                    'uploader_id': data.get('uploader_id')
-                }
-                videos.append(video)
-
-        return videos
 
     def get_channel_name(self):
         # get channel or playlist name
@@ -690,106 +538,22 @@ class Youtube:
             command.extend(['--extractor-args', ';'.join(extractor_args)])
 
 
-def filter_and_modify_bandwidth(m3u8_content, original_lang=None):
-    lines = m3u8_content.splitlines()
-
-    highest_bandwidth = 0
-    best_video_info = None
-    best_video_url = None
-
-    best_audio_line = None
-    best_audio_score = -10**9
-    fallback_audio_line = None
-
-    original_lang = _normalize_lang(original_lang)
-
-    def parse_attrs(ext_line: str) -> dict:
-        attrs = {}
-        try:
-            raw = ext_line.split(":", 1)[1]
-        except Exception:
-            return attrs
-
-        # Split on commas that are NOT inside quotes
-        parts = re.split(r',(?=(?:[^"]*"[^"]*")*[^"]*$)', raw)
-        for p in parts:
-            if "=" in p:
-                k, v = p.split("=", 1)
-                attrs[k.strip().upper()] = v.strip().strip('"')
-        return attrs
-
-    for i in range(len(lines)):
-        line = lines[i]
-
-        if line.startswith("#EXT-X-STREAM-INF:"):
-            info = line
-            url = lines[i + 1]
-            try:
-                bandwidth = int(info.split("BANDWIDTH=")[1].split(",")[0])
-            except Exception:
-                bandwidth = 0
-
-            if bandwidth > highest_bandwidth:
-                highest_bandwidth = bandwidth
-                best_video_info = info.replace(f"BANDWIDTH={bandwidth}", "BANDWIDTH=279001") if bandwidth else info
-                best_video_url = url
-
-        if line.startswith("#EXT-X-MEDIA:"):
-            # Audio renditions live here in master playlists
-            if "URI=" not in line:
-                continue
-
-            attrs = parse_attrs(line)
-
-            # Keep only AUDIO (some manifests may omit TYPE)
-            if attrs.get("TYPE", "").upper() not in ("AUDIO", ""):
-                continue
-
-            # Always have a fallback audio line in case preferred isn't present
-            fallback_audio_line = fallback_audio_line or line
-
-            langv = (attrs.get("LANGUAGE", "") or "").lower()
-            namev = (attrs.get("NAME", "") or "").lower()
-
-            # Scoring: prefer ORIGINAL, then English, then best available
-            score = 0
+def hls_policies():
+    """Variant selection policies from the plugin config (highest bandwidth by default)."""
+    policies = []
+    if config.get('hls_codec_preference'):
+        policies.append(hls.CodecPreference(config['hls_codec_preference']))
+    if config.get('hls_max_height'):
+        policies.append(hls.ResolutionCap(config['hls_max_height']))
+    return policies
 
-            # 1) Original language first
-            if original_lang and langv.startswith(original_lang):
-                score += 400
 
-            # 2) English next
-            if langv.startswith("en"):
-                score += 200
-            if "english" in namev:
-                score += 200
-
-            # Tie-breakers
-            if (attrs.get("DEFAULT", "") or "").upper() == "YES":
-                score += 40
-            if (attrs.get("AUTOSELECT", "") or "").upper() == "YES":
-                score += 10
-
-            # Keep the old heuristic as a minor tie-breaker
-            if "234" in line or attrs.get("GROUP-ID", "") == "234":
-                score += 3
-
-            if score > best_audio_score:
-                best_audio_score = score
-                best_audio_line = line
-
-    # Create the final M3U8 content
-    final_m3u8 = "#EXTM3U\n#EXT-X-INDEPENDENT-SEGMENTS\n"
-
-    if best_audio_line:
-        final_m3u8 += f"{best_audio_line}\n"
-    elif fallback_audio_line:
-        final_m3u8 += f"{fallback_audio_line}\n"
-
-    if best_video_info and best_video_url:
-        final_m3u8 += f"{best_video_info}\n{best_video_url}\n"
-
-    return final_m3u8
+def filter_and_modify_bandwidth(m3u8_content, original_lang=None):
+    return hls.rewrite_master(
+        m3u8_content,
+        hls_policies(),
+        hls.AudioLanguageScore(_normalize_lang(original_lang))
+    )
 
 
 def clean_text(text):
@@ -813,8 +577,27 @@ def video_id_exists_in_content(media_folder, video_id):
     return False
 
 
+def is_feed_channel(youtube_channel):
+    """Only channel entries have an uploads feed keyed by channel_id."""
+    return listing.parse_source(youtube_channel)[0].kind == listing.CHANNEL
+
+
 def to_strm(method):
+    # One library notification for the whole run, only if strm files were written
+    jellyfin_notifier = get_notifier(config)
+    feeds = None
+    pending = channels
+    if feed_fast_path:
+        feeds = FeedChecker(feed_state_file, proxy_url=proxy_url if proxy else "")
+        pending = feeds.channels_with_updates(
+            [youtube_channel for youtube_channel in channels if is_feed_channel(youtube_channel)]
+        ) + [youtube_channel for youtube_channel in channels if not is_feed_channel(youtube_channel)]
+
     for youtube_channel in channels:
+        if youtube_channel not in pending:
+            l.log("youtube", f'No new uploads in feed for {youtube_channel}, skipping')
+            continue
+
         yt = Youtube(youtube_channel)
         log_text = (" --------------- ")
         l.log("youtube", log_text)
@@ -838,192 +621,217 @@ def to_strm(method):
         log_text = (channel_description)
         l.log("youtube", log_text)
 
-        if videos:
-            log_text = (f'Videos detected: {len(videos)}')
-            l.log("youtube", log_text)
-            # Reverse video list so oldest videos get lower episode numbers
-            videos.reverse()
-            channel_nfo = False
-            channel_folder_created = False
+        # Videos arrive oldest first (--playlist-reverse) while yt-dlp is still
+        # extracting, so folder and NFO work overlaps with the listing
+        first_video = None
+        listed_ids = []
+        channel_nfo = False
+        channel_folder_created = False
 
-            # Get channel_id from first video to create channel folder and NFO
-            first_video = videos[0]
-            channel_id = first_video['channel_id']
-            youtube_channel_folder = first_video['uploader_id'].replace('/user/', '@').replace('/streams', '')
+        for video in videos:
+            listed_ids.append(video.media_id)
 
-            # Create channel folder
-            channel_folder = sanitize(
-                "{} [{}]".format(
-                    youtube_channel_folder,
-                    channel_id
-                )
-            )
-            f.folders().make_clean_folder(
-                "{}/{}".format(media_folder, channel_folder),
-                False,
-                ytdlp2strm_config
-            )
+            if first_video is None:
+                first_video = video
 
-            # Create channel NFO with correct images
-            n.nfo(
-                "tvshow",
-                "{}/{}".format(media_folder, channel_folder),
-                {
-                    "title": channel_name,
-                    "plot": channel_description.replace('\n', ' <br/>'),
-                    "landscape": yt.channel_landscape,
-                    "poster": yt.channel_poster,
-                    "studio": "Youtube"
-                }
-            ).make_nfo()
-            channel_nfo = True
-            channel_folder_created = True
-
-            for video in videos:
-                video_id = video['id']
-                channel_id = video['channel_id']
-                video_name = video['title']
-                thumbnail = video['thumbnail']
-                description = video['description']
-                date = datetime.strptime(video['upload_date'], '%Y%m%d')
-                upload_date = date.strftime('%Y-%m-%d')
-                year = date.year
-                youtube_channel = video['uploader_id']
-                youtube_channel_folder = youtube_channel.replace('/user/', '@').replace('/streams', '')
-                file_content = f'http://{host}:{port}/{source_platform}/bridge/{video_id}'
-                # Original line - file_content = f'http://{host}:{port}/{source_platform}/{method}/{video_id}'
+                # Get channel_id from first video to create channel folder and NFO
+                channel_id = first_video.channel_id
+                youtube_channel_folder = first_video.uploader.replace('/user/', '@').replace('/streams', '')
 
+                # Create channel folder
                 channel_folder = sanitize(
                     "{} [{}]".format(
                         youtube_channel_folder,
                         channel_id
                     )
                 )
+                f.folders().make_clean_folder(
+                    "{}/{}".format(media_folder, channel_folder),
+                    False,
+                    ytdlp2strm_config
+                )
 
-                # Create season folder based on video year
-                season_folder = f"Season {year}"
-                folder_full_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
-
-                # Format title with episode number
-                use_mmdd = (episode_format.lower() == 'mmdd')
-                formatted_title = format_episode_title(video_name, folder_full_path, upload_date, use_mmdd)
+                # Create channel NFO with correct images
+                n.nfo(
+                    "tvshow",
+                    "{}/{}".format(media_folder, channel_folder),
+                    {
+                        "title": channel_name,
+                        "plot": channel_description.replace('\n', ' <br/>'),
+                        "landscape": yt.channel_landscape,
+                        "poster": yt.channel_poster,
+                        "studio": "Youtube"
+                    }
+                ).make_nfo()
+                channel_nfo = True
+                channel_folder_created = True
+
+            video_id = video.id
+            channel_id = video.channel_id
+            video_name = video.title
+            thumbnail = video.thumbnail
+            description = video.description
+            date = datetime.strptime(video.upload_date, '%Y%m%d')
+            upload_date = date.strftime('%Y-%m-%d')
+            year = date.year
+            youtube_channel = video.uploader
+            youtube_channel_folder = youtube_channel.replace('/user/', '@').replace('/streams', '')
+            # stream keeps a stable local URL, every other mode is served by bridge
+            strm_method = 'stream' if method == 'stream' else 'bridge'
+            file_content = f'http://{host}:{port}/{source_platform}/{strm_method}/{video_id}'
+            # Original line - file_content = f'http://{host}:{port}/{source_platform}/{method}/{video_id}'
 
-                file_path = "{}/{}/{}/{}.{}".format(
-                    media_folder,
-                    channel_folder,
-                    season_folder,
-                    sanitize(formatted_title),
-                    "strm"
+            channel_folder = sanitize(
+                "{} [{}]".format(
+                    youtube_channel_folder,
+                    channel_id
                 )
+            )
 
-                folder_path = "{}/{}".format(
-                    media_folder,
-                    sanitize(
-                        "{} [{}]".format(
-                            youtube_channel_folder,
-                            channel_id
-                        )
-                    )
-                )
+            # Create season folder based on video year
+            season_folder = f"Season {year}"
+            folder_full_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
+
+            # Format title with episode number
+            use_mmdd = (episode_format.lower() == 'mmdd')
+            formatted_title = format_episode_title(video_name, folder_full_path, upload_date, use_mmdd)
+
+            safe_title = sanitize(formatted_title)
+            file_path = "{}/{}/{}/{}.{}".format(
+                media_folder,
+                channel_folder,
+                season_folder,
+                safe_title,
+                "strm"
+            )
 
-                if video_id_exists_in_content(folder_path, video_id):
-                    l.log("youtube", f'Video {video_id} already exists')
-                    continue
+            folder_path = "{}/{}".format(
+                media_folder,
+                channel_folder
+            )
 
-                if not channel_folder_created:
-                    f.folders().make_clean_folder(
-                        "{}/{}".format(
-                            media_folder,
-                            sanitize(
-                                "{} [{}]".format(
-                                    youtube_channel_folder,
-                                    channel_id
-                                )
-                            )
-                        ),
-                        False,
-                        ytdlp2strm_config
-                    )
-                    channel_folder_created = True
-
-                # Create season folder if it doesn't exist
-                season_folder_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
-                if not os.path.exists(season_folder_path):
-                    os.makedirs(season_folder_path, exist_ok=True)
-
-                if channel_url is None:
-                    channel_url = f'https://www.youtube.com/channel/{channel_id}'
-                    channel = Youtube(channel_url)
-                    images = channel.get_channel_images()
-                    channel.channel_url = channel_url
-                    channel_name = channel.get_channel_name()
-                    channel_description = channel.get_channel_description()
-                    channel_landscape = images['landscape']
-                    channel_poster = images['poster']
-                else:
-                    channel_landscape = yt.channel_landscape
-                    channel_poster = yt.channel_poster
-
-                ## -- BUILD CHANNEL NFO FILE
-                if not channel_nfo:
-                    n.nfo(
-                        "tvshow",
-                        "{}/{}".format(
-                            media_folder,
-                            "{} [{}]".format(
-                                youtube_channel,
-                                channel_id
-                            )
-                        ),
-                        {
-                            "title": channel_name,
-                            "plot": channel_description.replace('\n', ' <br/>'),
-                            "landscape": channel_landscape,
-                            "poster": channel_poster,
-                            "studio": "Youtube"
-                        }
-                    ).make_nfo()
-                    channel_nfo = True
-                ## -- END
-
-                ## -- BUILD VIDEO NFO FILE
+            if video_id_exists_in_content(folder_path, video_id):
+                l.log("youtube", f'Video {video_id} already exists')
+                continue
+
+            if not channel_folder_created:
+                f.folders().make_clean_folder(
+                    folder_path,
+                    False,
+                    ytdlp2strm_config
+                )
+                channel_folder_created = True
+
+            # Create season folder if it doesn't exist
+            season_folder_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
+            if not os.path.exists(season_folder_path):
+                os.makedirs(season_folder_path, exist_ok=True)
+
+            if channel_url is None:
+                channel_url = f'https://www.youtube.com/channel/{channel_id}'
+                channel = Youtube(channel_url)
+                images = channel.get_channel_images()
+                channel.channel_url = channel_url
+                channel_name = channel.get_channel_name()
+                channel_description = channel.get_channel_description()
+                channel_landscape = images['landscape']
+                channel_poster = images['poster']
+            else:
+                channel_landscape = yt.channel_landscape
+                channel_poster = yt.channel_poster
+
+            ## -- BUILD CHANNEL NFO FILE
+            if not channel_nfo:
                 n.nfo(
-                    "episode",
-                    "{}/{}/{}".format(
+                    "tvshow",
+                    "{}/{}".format(
                         media_folder,
                         "{} [{}]".format(
                             youtube_channel,
                             channel_id
-                        ),
-                        season_folder
+                        )
                     ),
                     {
-                        "item_name": sanitize(formatted_title),
-                        "title": sanitize(formatted_title),
-                        "upload_date": upload_date,
-                        "year": year,
-                        "plot": description.replace('\n', ' <br/>\n '),
-                        "season": "1",
-                        "episode": "",
-                        "preview": thumbnail
+                        "title": channel_name,
+                        "plot": channel_description.replace('\n', ' <br/>'),
+                        "landscape": channel_landscape,
+                        "poster": channel_poster,
+                        "studio": "Youtube"
                     }
                 ).make_nfo()
-                ## -- END
+                channel_nfo = True
+            ## -- END
 
-                if not os.path.isfile(file_path):
-                    f.folders().write_file(
-                        file_path,
-                        file_content
-                    )
+            ## -- BUILD VIDEO NFO FILE
+            n.nfo(
+                "episode",
+                "{}/{}/{}".format(
+                    media_folder,
+                    "{} [{}]".format(
+                        youtube_channel,
+                        channel_id
+                    ),
+                    season_folder
+                ),
+                {
+                    "item_name": safe_title,
+                    "title": safe_title,
+                    "upload_date": upload_date,
+                    "year": year,
+                    "plot": description.replace('\n', ' <br/>\n '),
+                    "season": "1",
+                    "episode": "",
+                    "preview": thumbnail
+                }
+            ).make_nfo()
+            ## -- END
+
+            if not os.path.isfile(file_path):
+                f.folders().write_file(
+                    file_path,
+                    file_content
+                )
+                jellyfin_notifier.record(file_path)
 
-            # Notify Jellyfin/Emby after processing all videos for this channel
-            jellyfin_notifier = JellyfinNotifier(config)
-            if jellyfin_notifier.enabled:
-                jellyfin_notifier.notify_new_content(f"{media_folder}/{channel_folder}")
+        if first_video:
+            log_text = (f'Videos detected: {len(listed_ids)}')
+            l.log("youtube", log_text)
+
+            # youtube_channel is reused for the uploader inside the loop
+            if feeds and is_feed_channel(yt.channel):
+                feeds.remember(
+                    yt.channel,
+                    first_video.channel_id,
+                    listed_ids
+                )
         else:
             log_text = (" no videos detected...")
             l.log("youtube", log_text)
 
+    if feeds:
+        feeds.save()
+
+    jellyfin_notifier.flush()
+
+
+def fresh_master(youtube_id):
+    """
+    (content, url) of the filtered master playlist of youtube_id from a new
+    probe, None on error. The HLS proxy asks for it when googlevideo URLs expire
+    """
+    info = fetch_info_json_for_video(youtube_id, True) or {}
+    m3u8_url = next(
+        (fmt['manifest_url'] for fmt in info.get('formats', []) if fmt.get('manifest_url')),
+        None
+    )
+    if not m3u8_url:
+        return None
+    response = plugin_client(config).get(m3u8_url)
+    if response.status_code != 200:
+        return None
+    response.encoding = 'utf-8'
+    return filter_and_modify_bandwidth(response.text, get_original_audio_lang(info)), response.url
+
 
 def direct(youtube_id, remote_addr):
     current_time = time.time()
@@ -1036,28 +844,22 @@ def direct(youtube_id, remote_addr):
         recent_requests[cache_key] = current_time
 
     if '-audio' not in youtube_id:
-        command = [
-            'yt-dlp',
-            '-j',
-            '--no-warnings',
-            '--extractor-args', 'youtube:player-client=default,web_safari',
-            f'https://www.youtube.com/watch?v={youtube_id}'
-        ]
-        Youtube().set_cookies(command)
-        Youtube().set_proxy(command)
-        full_info_json_str = w.worker(command).output()
-        m3u8_url = None
-        original_lang = None
-        try:
-            full_info_json = json.loads(full_info_json_str)
+        # Same probe and cache as /stream and the prefetch engine: a prefetched
+        # video doesn't run yt-dlp again. A cached manifest URL that expired
+        # is probed once more
+        response = None
+        for refresh in (False, True):
+            full_info_json = fetch_info_json_for_video(youtube_id, refresh) or {}
             original_lang = get_original_audio_lang(full_info_json)
-
-            for fmt in full_info_json.get("formats", []):
-                if "manifest_url" in fmt.keys():
-                    m3u8_url = fmt["manifest_url"]
-                    break
-        except Exception:
-            pass
+            m3u8_url = next(
+                (fmt['manifest_url'] for fmt in full_info_json.get('formats', []) if fmt.get('manifest_url')),
+                None
+            )
+            if not m3u8_url:
+                break
+            response = plugin_client(config).get(m3u8_url)
+            if response.status_code == 200:
+                break
 
         if not m3u8_url:
             log_text = (
@@ -1068,24 +870,29 @@ def direct(youtube_id, remote_addr):
                 'that serves the highest quality for this video'
             )
             l.log("youtube", log_text)
-            command = [
-                'yt-dlp',
-                '-f', fmt_best_single(original_lang),
-                '--get-url',
-                '--no-warnings',
-                f'https://www.youtube.com/watch?v={youtube_id}'
-            ]
-            Youtube().set_cookies(command)
-            Youtube().set_proxy(command)
-            sd_url = w.worker(command).output()
+            sd_url = pick_stream_url(full_info_json)
+            if not sd_url:
+                command = [
+                    'yt-dlp',
+                    '-f', fmt_best_single(original_lang),
+                    '--get-url',
+                    '--no-warnings',
+                    f'https://www.youtube.com/watch?v={youtube_id}'
+                ]
+                Youtube().set_cookies(command)
+                Youtube().set_proxy(command)
+                sd_url = w.worker(command).output()
             return redirect(sd_url.strip(), 301)
         else:
-            response = requests.get(m3u8_url)
             if response.status_code == 200:
                 # Ensure UTF-8 encoding
                 response.encoding = 'utf-8'
                 m3u8_content = response.text
                 filtered_content = filter_and_modify_bandwidth(m3u8_content, original_lang)
+                if hls_proxy:
+                    filtered_content = hls_proxy.rewrite_playlist(
+                        filtered_content, response.url, source=lambda: fresh_master(youtube_id)
+                    )
 
                 # Create Response with headers optimized for VLC and media players
                 flask_response = Response(filtered_content, mimetype='application/vnd.apple.mpegurl')
@@ -1103,26 +910,214 @@ def direct(youtube_id, remote_addr):
     else:
         s_youtube_id = youtube_id.split('-audio')[0]
         info = fetch_info_json_for_video(s_youtube_id) or {}
-        orig = get_original_audio_lang(info)
-        command = [
-            'yt-dlp',
-            '-f', fmt_best_audio(orig),
-            '--get-url',
-            '--no-warnings',
-            f'https://www.youtube.com/watch?v={s_youtube_id}'
-        ]
-        Youtube().set_cookies(command)
-        Youtube().set_proxy(command)
-        audio_url = w.worker(command).output()
-        return redirect(audio_url, 301)
+        audio_url = pick_stream_url(info, audio=True)
+        if not audio_url:
+            orig = get_original_audio_lang(info)
+            command = [
+                'yt-dlp',
+                '-f', fmt_best_audio(orig),
+                '--get-url',
+                '--no-warnings',
+                f'https://www.youtube.com/watch?v={s_youtube_id}'
+            ]
+            Youtube().set_cookies(command)
+            Youtube().set_proxy(command)
+            audio_url = w.worker(command).output()
+        return redirect(audio_url.strip(), 301)
 
     return "Manifest URL not found or failed to redirect.", 404
 
 
-def bridge(youtube_id):
+def proxy_playlist(token):
+    if not hls_proxy:
+        abort(404)
+    content = hls_proxy.playlist(token)
+    if content is None:
+        abort(404)
+    flask_response = Response(content, mimetype='application/vnd.apple.mpegurl')
+    flask_response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    flask_response.headers['Access-Control-Allow-Origin'] = '*'
+    return flask_response
+
+
+def proxy_segment(token):
+    if not hls_proxy:
+        abort(404)
+    data, content_type = hls_proxy.segment(token)
+    if data is None:
+        abort(404)
+    flask_response = Response(data, mimetype=content_type)
+    flask_response.headers['Access-Control-Allow-Origin'] = '*'
+    return flask_response
+
+
+def stream(youtube_id, range_header=None):
+    upstream = stream_resolver.open(youtube_id, range_header)
+    if upstream is None:
+        abort(404)
+
+    headers = {
+        k: upstream.headers[k]
+        for k in ('Content-Length', 'Content-Range', 'Accept-Ranges', 'Last-Modified')
+        if k in upstream.headers
+    }
+    headers['Accept-Ranges'] = 'bytes'
+
+    return Response(
+        stream_with_context(
+            stream_resolver.iter_content(youtube_id, upstream, range_header)
+        ),
+        status=upstream.status_code,
+        headers=headers,
+        mimetype=upstream.headers.get('Content-Type', 'video/mp4')
+    )
+
+
+def stream_metrics():
+    return stream_resolver.stats()
+
+
+def fmp4_command(video_url, audio_url, start=0):
+    """
+    ffmpeg command muxing a video-only and an audio-only URL into fragmented
+    MP4 on stdout. Every keyframe starts a fragment, so players can start and
+    seek without a moov atom at the end.
+    """
+    command = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '2'
+    ]
+    if start:
+        command += ['-ss', str(start)]
+    command += ['-i', video_url]
+    if start:
+        command += ['-ss', str(start)]
+    command += [
+        '-i', audio_url,
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c', 'copy',
+        '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+        '-f', 'mp4',
+        'pipe:1'
+    ]
+    return command
+
+
+def remux_fmp4(video_url, audio_url, start=0):
+    command = fmp4_command(video_url, audio_url, start)
+
+    def generate():
+        process = w.worker(command).pipe()
+        try:
+            while True:
+                chunk = process.stdout.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            process.kill()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="video/mp4",
+        headers={'Accept-Ranges': 'none'}
+    )
+
+
+def seek_fmp4(youtube_id, seconds, video_url, audio_url):
+    """
+    ?t=<seconds> on a merged video: the init segment of its fragmented MP4
+    download followed by the fragments from the seek index. A download that
+    doesn't reach that far yet gets a new remux starting there.
+
+    Only reached through ?t=, which players don't add on their own. Range
+    requests are not mapped to fragments: the total size is unknown while
+    the file is written, so a byte offset can't be turned into a time.
+    """
+    job = downloads.get(youtube_id, 'video')
+    complete = job is None or job.done
+    file = None
+    if job is not None:
+        file = job.open()
+    else:
+        path = media_cache.path(youtube_id, 'video')
+        if path:
+            try:
+                file = open(path, 'rb')
+            except FileNotFoundError:
+                file = None
+    if file is None:
+        return remux_fmp4(video_url, audio_url, seconds)
+
+    stat = os.fstat(file.fileno())
+    with fragment_indexes_lock:
+        # The inode tells a new download of the same video apart
+        key = (youtube_id, stat.st_ino)
+        index = fragment_indexes.get(key)
+        if index is None:
+            index = fragment_indexes[key] = FragmentIndex()
+        index.update(file, stat.st_size)
+        offset = index.offset_for(seconds, complete)
+        init_end = index.init_end
+    if offset is None:
+        file.close()
+        return remux_fmp4(video_url, audio_url, seconds)
+
+    def generate():
+        with file:
+            file.seek(0)
+            yield file.read(init_end)
+            if not complete:
+                yield from job.read(offset)
+                return
+            file.seek(offset)
+            while True:
+                chunk = file.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="video/mp4",
+        headers={'Accept-Ranges': 'none'}
+    )
+
+
+def bridge(youtube_id, range_header=None, start=0):
+    """
+    Serve a video through ytdlp2STRM
+
+    Single files with a known size (audio items, and progressive A/V when
+    it is not worse than the separate video) are proxied with Range
+    support (206) by the stream resolver. Separate video and audio are
+    muxed once into a fragmented MP4 in ./temp, shared with the download
+    mode: byte ranges are served from it while it is written, a range past
+    the written bytes waits for the remux. ?t=<seconds> (opt-in, added to
+    the URL by the client) starts at the fragment its seek index points to.
+    SponsorBlock and videos without single-file formats still go through
+    yt-dlp.
+    """
     raw_id = youtube_id.split('-audio')[0]
     s_youtube_id = f'https://www.youtube.com/watch?v={raw_id}'
 
+    if not config.get("sponsorblock"):
+        info = fetch_info_json_for_video(raw_id) or {}
+        if '-audio' in youtube_id:
+            if pick_format(info, FORMAT_AUDIO):
+                return stream(youtube_id, range_header)
+        else:
+            av_fmt = pick_format(info, FORMAT_AV)
+            video_fmt = pick_format(info, FORMAT_VIDEO)
+            audio_fmt = pick_format(info, FORMAT_AUDIO)
+            merged = video_fmt and audio_fmt
+            if av_fmt and not (merged and (video_fmt.get('height') or 0) > (av_fmt.get('height') or 0)):
+                return stream(youtube_id, range_header)
+            if merged:
+                if start:
+                    return seek_fmp4(raw_id, start, video_fmt['url'], audio_fmt['url'])
+                return download(youtube_id, range_header)
+
     def generate():
         startTime = time.time()
         buffer = []
@@ -1163,6 +1158,10 @@ def bridge(youtube_id):
                     yield buffer.pop(0)
 
                 process.poll()
+
+            # Send what is left in the buffer
+            while buffer:
+                yield buffer.pop(0)
         finally:
             process.kill()
 
@@ -1172,7 +1171,93 @@ def bridge(youtube_id):
     )
 
 
-def download(youtube_id):
+def download_command(youtube_id, info):
+    """
+    Command writing the media to stdout and the extension of the result,
+    both from the probe so the output path is known before it starts.
+
+    Returns:
+        tuple: (command, ext, mimetype) or (None, None, None)
+    """
+    raw_id = youtube_id.split('-audio')[0]
+
+    if '-audio' in youtube_id:
+        fmt = pick_format(info, FORMAT_AUDIO)
+        if not fmt:
+            return None, None, None
+        command = ['yt-dlp', '--no-warnings', '-f', fmt['format_id'], '-o', '-',
+                   f'https://www.youtube.com/watch?v={raw_id}']
+        Youtube().set_cookies(command)
+        Youtube().set_proxy(command)
+        # m4a is an mp4 container, and "m4a" files are treated as leftovers by clean_old_videos
+        ext = 'mp4' if fmt.get('ext') in (None, 'm4a') else fmt['ext']
+        return command, ext, f'audio/{ext}'
+
+    video_fmt = pick_format(info, FORMAT_VIDEO)
+    audio_fmt = pick_format(info, FORMAT_AUDIO)
+    if not (video_fmt and audio_fmt):
+        return None, None, None
+    return fmp4_command(video_fmt['url'], audio_fmt['url']), 'mp4', 'video/mp4'
+
+
+def start_download(youtube_id, info):
+    """Start the download of youtube_id into ./temp, None when only yt-dlp can get it."""
+    raw_id = youtube_id.split('-audio')[0]
+    variant = 'audio' if '-audio' in youtube_id else 'video'
+    command, ext, mimetype = download_command(youtube_id, info)
+    if not command:
+        return None
+    return downloads.start(
+        raw_id,
+        variant,
+        command,
+        os.path.join(os.getcwd(), 'temp', f'youtube_{youtube_id}.{ext}'),
+        mimetype
+    )
+
+
+def expected_size(youtube_id, info):
+    """Bytes of the formats a download of youtube_id would get, 0 when the probe doesn't say."""
+    kinds = [FORMAT_AUDIO] if '-audio' in youtube_id else [FORMAT_VIDEO, FORMAT_AUDIO]
+    size = 0
+    for kind in kinds:
+        fmt = pick_format(info, kind) or {}
+        size += int(fmt.get('filesize') or fmt.get('filesize_approx') or 0)
+    return size
+
+
+def warm(youtube_id, mode):
+    """
+    Prefetch of the next item. resolve probes the video and resolves the
+    stream URL, download also starts the download into ./temp. Neither
+    reads media for the caller, the response is sent right away.
+    """
+    raw_id = youtube_id.split('-audio')[0]
+    variant = 'audio' if '-audio' in youtube_id else 'video'
+
+    if mode == 'download' and (downloads.get(raw_id, variant) or media_cache.path(raw_id, variant)):
+        return jsonify({'bytes': 0}), 202
+
+    info = fetch_info_json_for_video(raw_id)
+    if not info:
+        abort(404)
+
+    if mode != 'download':
+        if pick_stream_url(info, '-audio' in youtube_id):
+            stream_resolver.current(youtube_id)
+        return jsonify({'bytes': 0})
+
+    # SponsorBlock downloads go through yt-dlp when they are played
+    if config.get("sponsorblock") or not start_download(youtube_id, info):
+        abort(404)
+    return jsonify({'bytes': expected_size(youtube_id, info)}), 202
+
+
+def download(youtube_id, range_header=None):
+    """
+    Download to ./temp while serving it. The first request starts the
+    download, every request (first included) reads the file as it grows.
+    """
     raw_id = youtube_id.split('-audio')[0]
     video_url = f'https://www.youtube.com/watch?v={raw_id}'
     current_dir = os.getcwd()
@@ -1180,7 +1265,24 @@ def download(youtube_id):
     # Ruta hacia la carpeta 'temp' dentro del directorio actual
     temp_dir = os.path.join(current_dir, 'temp')
 
+    variant = 'audio' if '-audio' in youtube_id else 'video'
+
+    job = downloads.get(raw_id, variant)
+    if job:
+        return downloads.serve(job, range_header)
+
+    existing_file = media_cache.path(raw_id, variant)
+    if existing_file:
+        return send_file(existing_file, conditional=True)
+
     info = fetch_info_json_for_video(raw_id) or {}
+
+    # SponsorBlock needs the whole file to cut the segments
+    if not config.get("sponsorblock"):
+        job = start_download(youtube_id, info)
+        if job:
+            return downloads.serve(job, range_header)
+
     orig = get_original_audio_lang(info)
 
     if '-audio' in youtube_id:
@@ -1192,7 +1294,12 @@ def download(youtube_id):
         else:
             fmt = "bv*+ba[language^=en]/bv*+ba/best"
 
-    command = ['yt-dlp', '-f', fmt, '-o', os.path.join(temp_dir, '%(title)s.%(ext)s')]
+    command = [
+        'yt-dlp', '-f', fmt,
+        '-o', os.path.join(temp_dir, f'youtube_{youtube_id}.%(ext)s'),
+        # Final path of the file, no need for a second yt-dlp to guess it
+        '--print', 'after_move:filepath', '--no-simulate', '--no-warnings'
+    ]
 
     if config.get("sponsorblock"):
         command += ['--sponsorblock-remove', config['sponsorblock_cats']]
@@ -1203,13 +1310,9 @@ def download(youtube_id):
     Youtube().set_language(command)
     Youtube().set_proxy(command)
 
-    w.worker(command).call()
+    filename = w.worker(command).output().strip().splitlines()
+    if not filename or not os.path.exists(filename[-1]):
+        abort(404)
 
-    filename_command = ['yt-dlp', '--print', 'filename', '--restrict-filenames', video_url]
-    Youtube().set_cookies(filename_command)
-    Youtube().set_language(filename_command)
-    filename = w.worker(filename_command).output()
-
-    return send_file(
-        os.path.join(temp_dir, filename)
-    )
+    media_cache.put(raw_id, filename[-1], variant)
+    return send_file(filename[-1], conditional=True)
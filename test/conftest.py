@@ -0,0 +1,123 @@
+"""
+Shared fixtures
+The tests run from a temporary working directory, so ytdlp2strm.log, ./temp
+and the configs copied from the examples never touch the repository.
+"""
+
+import importlib
+import os
+import shutil
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'test', 'fixtures')
+
+# Manual scripts, they run ffmpeg on import
+collect_ignore = ['ffmpeg_test']
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# clases.log wraps sys.stdout on import. The wrapper would close the capture
+# stream of pytest when collected, detach it and give pytest its stream back
+_stdout = sys.stdout
+import clases.log.log  # noqa: E402,F401
+if sys.stdout is not _stdout:
+    sys.stdout.detach()
+    sys.stdout = _stdout
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def fixture_path():
+    """Path of a file under test/fixtures."""
+    return lambda *parts: os.path.join(FIXTURES, *parts)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # respond(handler) of the server, set by stub_server
+    respond = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.respond(self)
+
+    def do_POST(self):
+        self.respond(self)
+
+    def body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def send(self, status, body=b'', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_server():
+    """
+    stub_server(respond) starts a local HTTP server calling respond(handler)
+    for every GET and POST (handler.send(status, body, headers) answers) and
+    returns its base URL. Every server is stopped after the test.
+    """
+    servers = []
+
+    def start(respond):
+        handler = type('Handler', (StubHandler,), {'respond': staticmethod(respond)})
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(scope='session')
+def plugin(tmp_path_factory):
+    """
+    plugin(name) imports plugins/<name>/<name>.py from a folder holding copies
+    of the example configs, the module reads them on import.
+    """
+    sandbox = tmp_path_factory.mktemp('plugins')
+    os.makedirs(sandbox / 'config', exist_ok=True)
+    shutil.copy(os.path.join(ROOT, 'config', 'config.example.json'), sandbox / 'config')
+
+    def load(name):
+        module_name = f'plugins.{name}.{name}'
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        folder = sandbox / 'plugins' / name
+        os.makedirs(folder, exist_ok=True)
+        for file_name in os.listdir(os.path.join(ROOT, 'plugins', name)):
+            if file_name.endswith('.example.json'):
+                shutil.copy(os.path.join(ROOT, 'plugins', name, file_name), folder)
+        cwd = os.getcwd()
+        os.chdir(sandbox)
+        try:
+            return importlib.import_module(module_name)
+        finally:
+            os.chdir(cwd)
+
+    return load
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+from plugins.crunchyroll.catalog import Catalog, DAY
+
+SEASON = ('GYVNXMVP6', '1', 'One Piece')
+LINES = [(False, '1', 'Romance Dawn'), (False, '2', 'Zoro'), (True, '1', 'Recap')]
+
+
+def age(catalog, series_id, season_id, checked=0, changed=0):
+    season = catalog.data[series_id]['seasons'][season_id]
+    season['checked'] -= checked * DAY
+    season['changed'] -= changed * DAY
+
+
+def test_update_and_fingerprint(workdir):
+    catalog = Catalog(str(workdir / 'catalog.json'))
+    assert catalog.update('series', SEASON, LINES)
+    assert not catalog.update('series', SEASON, list(LINES))
+    assert catalog.update('series', SEASON, LINES + [(False, '3', 'Nami')])
+    assert catalog.seasons('series') == [SEASON]
+    assert catalog.stored_episodes('series', SEASON[0])[-1] == (False, '3', 'Nami')
+
+
+def test_empty_season_is_stored(workdir):
+    catalog = Catalog(str(workdir / 'catalog.json'))
+    assert catalog.update('series', SEASON, [])
+    assert catalog.cached_episodes('series', SEASON[0], last=False) == []
+    assert catalog.stored_episodes('series', 'unknown') == []
+
+
+def test_when_a_season_is_listed_again(workdir):
+    catalog = Catalog(str(workdir / 'catalog.json'), recheck_days=7, complete_after_days=30)
+    assert catalog.cached_episodes('series', SEASON[0], last=False) is None
+    catalog.update('series', SEASON, LINES)
+
+    # Older seasons are complete, the last one only after it stops changing
+    assert catalog.cached_episodes('series', SEASON[0], last=False) == LINES
+    assert catalog.cached_episodes('series', SEASON[0], last=True) is None
+    age(catalog, 'series', SEASON[0], changed=31)
+    assert catalog.cached_episodes('series', SEASON[0], last=True) == LINES
+
+    # Every recheck_days it is listed again, an unchanged listing keeps its age
+    age(catalog, 'series', SEASON[0], checked=8)
+    assert catalog.cached_episodes('series', SEASON[0], last=False) is None
+    assert not catalog.update('series', SEASON, LINES)
+    assert catalog.cached_episodes('series', SEASON[0], last=True) == LINES
+
+
+def test_saved_and_loaded(workdir):
+    path = str(workdir / 'catalog.json')
+    catalog = Catalog(path)
+    catalog.update('series', SEASON, LINES)
+    catalog.set_written('series', {'b.strm', 'a.strm'})
+    catalog.save()
+
+    loaded = Catalog(path)
+    assert loaded.cached_episodes('series', SEASON[0], last=False) == LINES
+    assert loaded.written('series') == {'a.strm', 'b.strm'}
+
+
+def test_unreadable_file_starts_empty(workdir):
+    (workdir / 'catalog.json').write_text('{broken', encoding='utf-8')
+    assert Catalog(str(workdir / 'catalog.json')).data == {}
+
+
+def test_deleted_strm_is_written_again(plugin, workdir, monkeypatch):
+    crunchyroll = plugin('crunchyroll')
+    episodes = [
+        SimpleNamespace(season=1, episode=number, title=title, media_id=f'E{number}', season_id=SEASON[0], season_name='One Piece')
+        for number, title in [(1, 'Romance Dawn'), (2, 'Zoro')]
+    ]
+
+    class Series:
+        def __init__(self, channel):
+            self.channel_folder = 'One Piece'
+            self.videos = episodes
+
+        def get_series_id(self):
+            return 'GRMG8ZQZR'
+
+    monkeypatch.setattr(crunchyroll, 'Crunchyroll', Series)
+    monkeypatch.setattr(crunchyroll, 'channels', ['https://www.crunchyroll.com/series/GRMG8ZQZR/one-piece'])
+    monkeypatch.setattr(crunchyroll, 'media_folder', str(workdir / 'media'))
+    monkeypatch.setattr(crunchyroll, 'catalog', Catalog(str(workdir / 'catalog.json')))
+    monkeypatch.setattr(crunchyroll, 'jellyfin_preload_last_episode', False)
+
+    crunchyroll.to_strm('direct')
+    season = workdir / 'media' / 'One Piece' / 'S01 - One Piece'
+    assert sorted(path.name for path in season.iterdir()) == ['S01E01 - Romance Dawn.strm', 'S01E02 - Zoro.strm']
+
+    # Listed as written in the catalog, but no longer on disk
+    (season / 'S01E02 - Zoro.strm').unlink()
+    crunchyroll.to_strm('direct')
+    assert (season / 'S01E02 - Zoro.strm').read_text().endswith('/crunchyroll/direct/GRMG8ZQZR_E2')
@@ -0,0 +1,169 @@
+import sys
+import time
+import pytest
+from plugins.crunchyroll import parser
+from plugins.crunchyroll.parser import (
+    SeasonList, output_files, parse_episode_line, parse_progress, parse_season_line, read_lines, run_lines
+)
+
+# Prints a fixture, reads the selection answer and then hangs as
+# multi-downloader-nx does while it waits for more input
+PRINTER = (
+    "import sys, time\n"
+    "sys.stdout.write(open(sys.argv[1], encoding='utf-8').read()); sys.stdout.flush()\n"
+    "sys.stdin.read()\n"
+    "time.sleep(float(sys.argv[2]))\n"
+)
+
+
+@pytest.fixture
+def fixture_lines(fixture_path):
+    def read(name):
+        with open(fixture_path('crunchyroll', name), encoding='utf-8') as file:
+            return file.read().splitlines()
+    return read
+
+
+@pytest.fixture
+def printer(fixture_path):
+    return lambda name, hang=0: [sys.executable, '-c', PRINTER, fixture_path('crunchyroll', name), str(hang)]
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('[S:GRMG8ZQZR] One Piece (Season: 14)', ('GRMG8ZQZR', '14', 'One Piece')),
+    ('  [S:GYMGXDXQR] One Piece Specials  ', ('GYMGXDXQR', '1', 'One Piece Specials')),
+    ('[S:G6NQ5DWZ6] One Piece: Egghead (Season: 2) [Dub]', ('G6NQ5DWZ6', '2', 'One Piece: Egghead')),
+    ('[Z:GRMG8ZQZR] One Piece (Seasons: 4)', None),
+    ('[S1] [2000-03-04] Recap', None),
+    ('[S:broken', None),
+    ('', None),
+])
+def test_parse_season_line(line, expected):
+    assert parse_season_line(line) == expected
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('[E1] [2021-10-10] Series - Season 14 - Title', (False, '1', 'Title')),
+    ('[S1] [2000-03-04] One Piece - Season 1 - Recap: Adventure', (True, '1', 'Recap: Adventure')),
+    # Dashes inside the title are kept
+    ('[E4] [1999-12-08] One Piece - Season 1 - Shanks - Part 1', (False, '4', 'Shanks - Part 1')),
+    ('[E5] [1999-12-15] Untitled Episode', (False, '5', 'Untitled Episode')),
+    ('[E6] Title without date', (False, '6', 'Title without date')),
+    ('[S:GYVNXMVP6] One Piece (Season: 1)', None),
+    ('  - Versions: ja-JP', None),
+    ('[INFO] Episodes selected: none', None),
+    ('[ERROR] Request failed: 401 Unauthorized', None),
+    ('[SUCCESS] Done', None),
+    ('[E7', None),
+])
+def test_parse_episode_line(line, expected):
+    assert parse_episode_line(line) == expected
+
+
+def test_season_listing(fixture_lines):
+    season_list = SeasonList()
+    lines = fixture_lines('series.txt')
+    stop = next(i for i, line in enumerate(lines) if season_list(line))
+    # The list ends at the first line after it, the rest is not read
+    assert lines[stop] == '[INFO] Total seasons: 4'
+    assert season_list.seasons == [
+        ('GYVNXMVP6', '1', 'One Piece'),
+        ('GR75253JY', '2', 'One Piece'),
+        ('G6NQ5DWZ6', '2', 'One Piece: Egghead'),
+        ('GYMGXDXQR', '1', 'One Piece Specials'),
+    ]
+
+
+def test_no_seasons_never_completes(fixture_lines):
+    season_list = SeasonList()
+    assert not any(season_list(line) for line in fixture_lines('auth_error.txt'))
+    assert season_list.seasons == []
+
+
+def test_episode_listing(fixture_lines):
+    episodes = [episode for episode in map(parse_episode_line, fixture_lines('season.txt')) if episode]
+    assert [(special, number) for special, number, _ in episodes] == [
+        (False, '1'), (False, '2'), (False, '3'), (True, '1'), (False, '4'), (False, '5'), (False, '6.5')
+    ]
+    assert episodes[0][2] == "I'm Luffy! The Man Who's Gonna Be King of the Pirates!"
+    assert episodes[4][2] == "Luffy's Past! Enter Red-Haired Shanks - Part 1"
+    assert episodes[6][2] == 'One Piece'
+    assert not any(map(parse_episode_line, fixture_lines('season_empty.txt')))
+
+
+def test_download_progress_and_files(fixture_lines):
+    lines = fixture_lines('download.txt')
+    progress = [value for value in map(parse_progress, lines) if value is not None]
+    assert progress == [3.0, 24.9, 50.1, 100.0, 100.0]
+    files = [path for line in lines for path in output_files(line, '/app/temp/GYVNXMVP6_E2')]
+    assert files == ['/app/temp/GYVNXMVP6_E2.ts', '/app/temp/GYVNXMVP6_E2.ja-JP.ts', '/app/temp/GYVNXMVP6_E2.mkv']
+    # Other episodes and other extensions are not ours
+    assert output_files('Writing "/app/temp/GYVNXMVP6_E20.ts" and /app/temp/GYVNXMVP6_E2.srt', '/app/temp/GYVNXMVP6_E2') == []
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('[INFO] 12 of 389 parts [3%] then [45.5 %]', 45.5),
+    ('150%', 100.0),
+    ('no progress', None),
+])
+def test_parse_progress(line, expected):
+    assert parse_progress(line) == expected
+
+
+def test_read_lines_stops_once_complete(printer):
+    season_list = SeasonList()
+    started = time.time()
+    lines = list(read_lines(printer('series.txt', hang=30), season_list))
+    # Stopped at the end of the list, without waiting for the process to exit
+    assert time.time() - started < 10
+    assert lines[-1] == '[INFO] Total seasons: 4'
+    assert len(season_list.seasons) == 4
+
+
+def test_read_lines_idle_timeout(printer):
+    started = time.time()
+    lines = list(read_lines(printer('auth_error.txt', hang=30), idle_timeout=1))
+    assert time.time() - started < 10
+    assert lines[-1] == '[ERROR] Authentication required, run --auth'
+
+
+def test_read_lines_until_exit(printer, fixture_lines):
+    assert list(read_lines(printer('season.txt'))) == fixture_lines('season.txt')
+
+
+def test_run_lines(printer, fixture_lines):
+    lines = []
+    assert run_lines(printer('download.txt'), lines.append, idle_timeout=10) == 0
+    assert lines == fixture_lines('download.txt')
+    assert run_lines([sys.executable, '-c', 'import sys; print("[ERROR] failed"); sys.exit(3)'], lines.append, 10) == 3
+    assert run_lines(printer('download.txt', hang=30), lambda line: None, idle_timeout=1) is None
+
+
+@pytest.fixture
+def crunchyroll(plugin, printer, monkeypatch):
+    """Crunchyroll plugin whose listings print a fixture instead of running multi-downloader-nx."""
+    module = plugin('crunchyroll')
+    fixtures = {}
+
+    def fake_read_lines(command, complete=None, idle_timeout=1):
+        season_id = command[command.index('-s') + 1] if '-s' in command else None
+        return parser.read_lines(printer(fixtures[season_id]), complete, idle_timeout)
+
+    monkeypatch.setattr(module, 'read_lines', fake_read_lines)
+    monkeypatch.setattr(module, 'fixtures', fixtures, raising=False)
+    return module
+
+
+def test_season_episodes_contract(crunchyroll):
+    listing = crunchyroll.Crunchyroll.__new__(crunchyroll.Crunchyroll)
+    crunchyroll.fixtures.update({
+        None: 'series.txt',
+        'GYVNXMVP6': 'season.txt',
+        'GYMGXDXQR': 'season_empty.txt',
+        'GR75253JY': 'auth_error.txt',
+    })
+    assert [season[0] for season in listing.get_seasons('GRMG8ZQZR')] == ['GYVNXMVP6', 'GR75253JY', 'G6NQ5DWZ6', 'GYMGXDXQR']
+    assert len(listing.get_season_episodes('GRMG8ZQZR', 'GYVNXMVP6')) == 7
+    # An empty season is [], a rejected session is a failed listing
+    assert listing.get_season_episodes('GRMG8ZQZR', 'GYMGXDXQR') == []
+    assert listing.get_season_episodes('GRMG8ZQZR', 'GR75253JY') is None
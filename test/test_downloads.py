@@ -0,0 +1,98 @@
+import sys
+import pytest
+from flask import Flask
+from clases.downloads import DownloadManager
+from clases.downloads.downloads import parse_range
+from clases.media_cache import media_cache, COMPLETE, PARTIAL
+
+# Writes 1000 bytes, then waits for ./go before writing 1000 more
+WRITER = (
+    "import os, sys, time\n"
+    "sys.stdout.buffer.write(b'a' * 1000); sys.stdout.buffer.flush()\n"
+    "while not os.path.exists('go'): time.sleep(0.01)\n"
+    "sys.stdout.buffer.write(b'b' * 1000)\n"
+)
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def body(response):
+    response.direct_passthrough = False
+    return response.get_data()
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, None)),
+    ('bytes=-', (0, None)),
+    ('bytes=5-9,20-30', (5, 9)),
+    ('bytes=a-b', None),
+    ('items=0-1', None),
+    (None, None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header) == expected
+
+
+def test_partial_file_is_served_while_it_grows(app, workdir):
+    manager = DownloadManager()
+    job = manager.start('video1', 'video', [sys.executable, '-c', WRITER], str(workdir / 'video1.mp4'))
+    assert manager.start('video1', 'video', ['false'], 'other') is job
+    assert job.wait_for(999, timeout=10)
+    assert media_cache.get('video1', 'video', state=PARTIAL)['path'] == job.part_path
+
+    with app.test_request_context():
+        response = manager.serve(job, 'bytes=100-')
+        assert response.status_code == 206
+        # Only the bytes written so far, the total is not known yet
+        assert response.headers['Content-Range'] == 'bytes 100-999/*'
+        assert body(response) == b'a' * 900
+
+        whole = job.read()
+        assert next(whole) == b'a' * 1000
+        (workdir / 'go').touch()
+        assert b''.join(whole) == b'b' * 1000
+
+    job.thread.join(timeout=10)
+    assert job.done and not job.failed
+    assert not (workdir / 'video1.mp4.part').exists()
+    assert media_cache.get('video1', 'video')['state'] == COMPLETE
+
+    with app.test_request_context(headers={'Range': 'bytes=1990-'}):
+        response = manager.serve(job, 'bytes=1990-')
+        # send_file answers the Range with the total size now known
+        assert response.status_code == 206
+        assert response.headers['Content-Range'] == 'bytes 1990-1999/2000'
+        assert body(response) == b'b' * 10
+        # Finished downloads are served from media_cache from now on
+        assert manager.get('video1', 'video') is None
+
+
+def test_failed_download_is_a_502_and_retried(app, workdir):
+    manager = DownloadManager()
+    job = manager.start('video2', '', [sys.executable, '-c', 'import sys; sys.exit(1)'], str(workdir / 'video2.mp4'))
+    with app.test_request_context():
+        response = manager.serve(job)
+    assert response.status_code == 502
+    assert job.failed
+    assert media_cache.get('video2', state=None) is None
+    assert manager.get('video2') is None
+    retry = manager.start('video2', '', [sys.executable, '-c', ''], str(workdir / 'video2.mp4'))
+    assert retry is not job
+    retry.thread.join(timeout=10)
+
+
+def test_final_rename_failing_is_a_failed_download(app, workdir):
+    manager = DownloadManager()
+    # A folder in the way of the final file
+    (workdir / 'video3.mp4').mkdir()
+    job = manager.start('video3', '', [sys.executable, '-c', 'import sys; sys.stdout.write("x" * 10)'], str(workdir / 'video3.mp4'))
+    job.thread.join(timeout=10)
+    assert job.done and job.failed
+    assert not (workdir / 'video3.mp4.part').exists()
+    assert media_cache.get('video3', state=None) is None
+    with app.test_request_context():
+        assert manager.serve(job).status_code == 502
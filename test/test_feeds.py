@@ -0,0 +1,128 @@
+import json
+from datetime import datetime, timezone
+import pytest
+from plugins.youtube import feeds
+from plugins.youtube.feeds import FeedChecker, parse_feed
+from plugins.youtube.listing import parse_source, CHANNEL, PLAYLIST, SEARCH
+
+
+@pytest.fixture
+def feed_server(stub_server, fixture_path, monkeypatch):
+    """Stub of feeds/videos.xml: channel_id -> (status, body), counts the requests."""
+    with open(fixture_path('youtube', 'feed.xml'), encoding='utf-8') as file:
+        feed = file.read()
+    answers = {'UCabc': (200, feed), 'UCbroken': (200, '<feed'), 'UCgone': (404, '')}
+    requests = []
+
+    def respond(handler):
+        channel_id = handler.path.split('channel_id=')[-1]
+        requests.append(channel_id)
+        status, body = answers.get(channel_id, (404, ''))
+        handler.send(status, body, {'Content-Type': 'application/atom+xml'})
+
+    base_url = stub_server(respond)
+    monkeypatch.setattr(feeds, 'FEED_URL', base_url + '/feeds/videos.xml?channel_id={}')
+    return requests
+
+
+def test_parse_feed(fixture_path):
+    with open(fixture_path('youtube', 'feed.xml'), 'rb') as file:
+        entries = parse_feed(file.read())
+    assert [video_id for video_id, _ in entries] == ['vid3', 'vid2', 'vid1']
+    assert entries[0][1] == datetime(2026, 3, 3, 10, 0, tzinfo=timezone.utc)
+    assert entries[2][1] is None
+
+
+def test_unknown_channel_is_listed_without_a_request(feed_server):
+    checker = FeedChecker('feeds.json')
+    assert checker.has_updates('@new') is True
+    assert feed_server == []
+
+
+def test_nothing_new_after_a_full_listing(feed_server):
+    checker = FeedChecker('feeds.json')
+    checker.remember('@abc', 'UCabc', ['vid3', 'vid2', 'vid1'])
+    assert checker.channels_with_updates(['@abc']) == []
+    assert feed_server == ['UCabc']
+    with open('feeds.json', encoding='utf-8') as file:
+        assert json.load(file)['@abc']['channel_id'] == 'UCabc'
+
+
+def test_new_upload_after_the_last_sync(feed_server):
+    checker = FeedChecker('feeds.json')
+    checker.state['@abc'] = {
+        'channel_id': 'UCabc',
+        'seen': ['vid2', 'vid1'],
+        'last_sync': '2026-02-15T00:00:00+00:00'
+    }
+    assert checker.has_updates('@abc') is True
+
+
+def test_unseen_uploads_older_than_the_last_sync_are_remembered(feed_server):
+    checker = FeedChecker('feeds.json')
+    checker.state['@abc'] = {
+        'channel_id': 'UCabc',
+        'seen': ['vid1'],
+        'last_sync': '2026-04-01T00:00:00+00:00'
+    }
+    assert checker.has_updates('@abc') is False
+    assert set(checker.state['@abc']['seen']) == {'vid1', 'vid2', 'vid3'}
+
+
+def test_entry_without_date_counts_as_new(feed_server):
+    checker = FeedChecker('feeds.json')
+    checker.state['@abc'] = {
+        'channel_id': 'UCabc',
+        'seen': ['vid3', 'vid2'],
+        'last_sync': '2026-04-01T00:00:00+00:00'
+    }
+    assert checker.has_updates('@abc') is True
+
+
+def test_feed_errors_fall_back_to_the_listing(feed_server):
+    checker = FeedChecker('feeds.json')
+    for channel, channel_id in (('@gone', 'UCgone'), ('@broken', 'UCbroken')):
+        checker.remember(channel, channel_id, ['vid1'])
+    assert checker.channels_with_updates(['@gone', '@broken']) == ['@gone', '@broken']
+
+
+def test_remember_resets_seen_when_the_channel_id_changes():
+    checker = FeedChecker('feeds.json')
+    checker.remember('@abc', 'UCold', ['a', 'b'])
+    checker.remember('@abc', 'UCabc', ['c'])
+    assert checker.state['@abc']['seen'] == ['c']
+    checker.remember('@abc', 'UCabc', ['d', 'c'])
+    assert checker.state['@abc']['seen'] == ['d', 'c']
+
+
+def test_remember_keeps_the_last_100_ids():
+    checker = FeedChecker('feeds.json')
+    checker.remember('@abc', 'UCabc', [f'old{i}' for i in range(90)])
+    checker.remember('@abc', 'UCabc', [f'new{i}' for i in range(20)])
+    seen = checker.state['@abc']['seen']
+    assert len(seen) == 100
+    assert seen[:20] == [f'new{i}' for i in range(20)]
+
+
+@pytest.mark.parametrize('entry, expected', [
+    ('https://www.youtube.com/@leagueoflegends', (CHANNEL, 'https://www.youtube.com/@leagueoflegends', False)),
+    # Channel names holding "list" or "keyword" are still channels
+    ('@playlistlive', (CHANNEL, 'https://www.youtube.com/@playlistlive', False)),
+    ('https://www.youtube.com/@keywordstudios', (CHANNEL, 'https://www.youtube.com/@keywordstudios', False)),
+    ('list-PLbZIPy20', (PLAYLIST, 'https://www.youtube.com/playlist?list=PLbZIPy20', False)),
+    ('keyword-kase o', (SEARCH, 'kase o', False)),
+    ('keyword-lo-fi beats', (SEARCH, 'lo-fi beats', False)),
+    ('extractaudio-https://www.youtube.com/@luisitocomunica', (CHANNEL, 'https://www.youtube.com/@luisitocomunica', True)),
+    ('extractaudio-list-PLbZIPy20', (PLAYLIST, 'https://www.youtube.com/playlist?list=PLbZIPy20', True)),
+])
+def test_parse_source(entry, expected):
+    source, audio = parse_source(entry)
+    assert (source.kind, source.target, audio) == expected
+
+
+def test_only_channels_use_the_feed(plugin):
+    youtube = plugin('youtube')
+    assert youtube.is_feed_channel('@playlistlive')
+    assert youtube.is_feed_channel('extractaudio-https://www.youtube.com/@luisitocomunica')
+    assert not youtube.is_feed_channel('list-PLbZIPy20')
+    assert not youtube.is_feed_channel('keyword-kase o')
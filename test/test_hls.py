@@ -0,0 +1,146 @@
+import random
+import pytest
+from utils import hls
+
+
+@pytest.fixture
+def master(fixture_path):
+    with open(fixture_path('hls', 'youtube_master.m3u8'), encoding='utf-8') as file:
+        return file.read()
+
+
+def selected(output):
+    """(STREAM-INF line, URI, audio MEDIA line) of a rewritten master playlist."""
+    lines = output.splitlines()
+    assert lines[:2] == ['#EXTM3U', '#EXT-X-INDEPENDENT-SEGMENTS']
+    infos = [i for i, line in enumerate(lines) if line.startswith(hls.STREAM_INF)]
+    audio = [line for line in lines if line.startswith(hls.MEDIA)]
+    assert len(infos) <= 1 and len(audio) <= 1
+    info = lines[infos[0]] if infos else None
+    uri = lines[infos[0] + 1] if infos else None
+    return info, uri, audio[0] if audio else None
+
+
+def test_highest_bandwidth_and_english_audio(master):
+    info, uri, audio = selected(hls.rewrite_master(master))
+    assert uri.endswith('/itag/401/file/index.m3u8')
+    assert 'BANDWIDTH=279001' in info and 'RESOLUTION=3840x2160' in info
+    assert 'LANGUAGE="en"' in audio
+
+
+def test_original_language_first(master):
+    # An English track also named "English" outscores the original (as before the rewriter)
+    master = master.replace('NAME="English",DEFAULT=YES', 'NAME="Inglés",DEFAULT=YES')
+    _, _, audio = selected(hls.rewrite_master(master, audio_scorer=hls.AudioLanguageScore('es')))
+    assert 'LANGUAGE="es-419"' in audio
+
+
+def test_bandwidth_kept_without_override(master):
+    info, _, _ = selected(hls.rewrite_master(master, bandwidth_override=None))
+    assert 'BANDWIDTH=12000000' in info
+
+
+@pytest.mark.parametrize('policies, itag', [
+    ([hls.ResolutionCap(1080)], '248'),
+    ([hls.ResolutionCap(1080), hls.CodecPreference('avc1')], '137'),
+    ([hls.CodecPreference('hev1,vp09')], '248'),
+    ([hls.BandwidthCap(2000000)], '136'),
+    ([hls.ResolutionCap(240)], '134'),
+    ([hls.BandwidthCap(1)], '401'),
+])
+def test_policies(master, policies, itag):
+    _, uri, _ = selected(hls.rewrite_master(master, policies))
+    assert f'/itag/{itag}/' in uri
+
+
+def test_parse_bytes_lines_with_crlf(master):
+    lines = [line.encode('utf-8') + b'\r\n' for line in master.splitlines()]
+    playlist = hls.MasterPlaylist.parse(iter(lines))
+    assert len(playlist.variants) == 5
+    # The subtitles rendition is not an audio track
+    assert len(playlist.audio_renditions()) == 3
+
+
+def test_quoted_commas_in_attributes():
+    attrs = hls.parse_attributes('#EXT-X-STREAM-INF:BANDWIDTH=10,CODECS="avc1.64001f,mp4a.40.2",RESOLUTION=1x2')
+    assert attrs == {'BANDWIDTH': '10', 'CODECS': 'avc1.64001f,mp4a.40.2', 'RESOLUTION': '1x2'}
+
+
+def test_empty_playlist():
+    assert hls.rewrite_master('') == '#EXTM3U\n#EXT-X-INDEPENDENT-SEGMENTS\n'
+
+
+## -- FUZZ CORPUS
+# Seeded, every run checks the same playlists
+
+FRAGMENTS = [
+    '#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-INDEPENDENT-SEGMENTS', '', ' ',
+    '#EXT-X-STREAM-INF:', '#EXT-X-STREAM-INF:BANDWIDTH=', '#EXT-X-STREAM-INF:BANDWIDTH=abc',
+    '#EXT-X-STREAM-INF:RESOLUTION=x,CODECS="',
+    '#EXT-X-MEDIA:', '#EXT-X-MEDIA:TYPE=AUDIO', '#EXT-X-MEDIA:URI="',
+    '#EXT-X-MEDIA:TYPE=AUDIO,URI="a.m3u8",LANGUAGE=,NAME=""',
+    '#EXT-X-MEDIA:TYPE=VIDEO,URI="v.m3u8"',
+    '#EXTINF:4.0,', 'segment.ts', 'https://host/path?q=1,2', '#', 'BANDWIDTH=5',
+    '\ufeff#EXTM3U', '日本語.m3u8', '#EXT-X-STREAM-INF:BANDWIDTH=99999999999999999999',
+]
+
+
+def random_variant(rng, index):
+    attrs = [f'BANDWIDTH={rng.choice((0, 1, 500000, 500000, 2500000, rng.randint(1, 10 ** 8)))}']
+    if rng.random() < 0.7:
+        attrs.append(f'RESOLUTION={rng.choice((256, 640, 1280, 1920, 3840))}x{rng.choice((144, 360, 720, 1080, 2160))}')
+    if rng.random() < 0.7:
+        attrs.append(f'CODECS="{rng.choice(("avc1.4d401f", "vp09.00.40.08", "av01.0.08M.08"))},mp4a.40.2"')
+    rng.shuffle(attrs)
+    return [hls.STREAM_INF + ','.join(attrs), f'variant{index}.m3u8']
+
+
+def random_audio(rng, index):
+    attrs = [f'URI="audio{index}.m3u8"', f'GROUP-ID="{rng.choice(("233", "234", "aac"))}"']
+    if rng.random() < 0.8:
+        attrs.append(f'TYPE={rng.choice(("AUDIO", "audio", "SUBTITLES"))}')
+    if rng.random() < 0.8:
+        attrs.append(f'LANGUAGE="{rng.choice(("en", "en-US", "ja", "es-419", ""))}"')
+    if rng.random() < 0.5:
+        attrs.append(f'NAME="{rng.choice(("English", "Original, Japanese", "Español"))}"')
+    if rng.random() < 0.5:
+        attrs.append(f'DEFAULT={rng.choice(("YES", "NO"))}')
+    rng.shuffle(attrs)
+    return [hls.MEDIA + ','.join(attrs)]
+
+
+def fuzz_playlists(count=400, seed=31):
+    rng = random.Random(seed)
+    for _ in range(count):
+        lines = ['#EXTM3U']
+        for index in range(rng.randint(0, 12)):
+            kind = rng.random()
+            if kind < 0.4:
+                lines += random_variant(rng, index)
+            elif kind < 0.6:
+                lines += random_audio(rng, index)
+            else:
+                lines.append(rng.choice(FRAGMENTS))
+        yield '\n'.join(lines)
+
+
+def test_fuzz_never_fails_and_picks_from_the_input():
+    for content in fuzz_playlists():
+        for policies in ((), (hls.ResolutionCap(720),), (hls.BandwidthCap(1000000), hls.CodecPreference('vp09'))):
+            info, uri, audio = selected(hls.rewrite_master(content, policies))
+            source = content.splitlines()
+            if uri is not None:
+                assert uri in source
+            if audio is not None:
+                assert audio in source
+
+
+def test_fuzz_default_pick_is_the_first_highest_bandwidth():
+    for content in fuzz_playlists():
+        playlist = hls.MasterPlaylist.parse(content)
+        _, uri, _ = selected(hls.rewrite_master(content))
+        if not playlist.variants:
+            assert uri is None
+            continue
+        best = max(v.bandwidth for v in playlist.variants)
+        assert uri == next(v.uri for v in playlist.variants if v.bandwidth == best)
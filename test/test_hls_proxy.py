@@ -0,0 +1,142 @@
+import pytest
+import requests
+from clases.hls_proxy import HlsProxy, SegmentCache
+from clases.hls_proxy.hls_proxy import stable_key
+
+
+class Origin:
+    """
+    Stub CDN: URLs carry /sig/s<generation>/, URLs of an older generation are
+    answered with 403 as an expired googlevideo URL would.
+    """
+
+    def __init__(self):
+        self.generation = 1
+        self.requests = []
+
+    @property
+    def sig(self):
+        return f'sig/s{self.generation}'
+
+    def respond(self, handler):
+        self.requests.append(handler.path)
+        if f'/{self.sig}/' not in handler.path:
+            handler.send(403)
+        elif handler.path.startswith('/master/'):
+            handler.send(200, f'#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\n/media/{self.sig}/file/m.m3u8\n',
+                         {'Content-Type': 'application/vnd.apple.mpegurl'})
+        elif handler.path.endswith('m.m3u8'):
+            handler.send(200, '#EXTM3U\n'
+                              f'#EXT-X-MAP:URI="/v/id/x/{self.sig}/file/init.mp4"\n'
+                              f'#EXTINF:2,\n/v/id/x/{self.sig}/sq/1/file/seg.m4s\n'
+                              f'#EXTINF:2,\n/v/id/x/{self.sig}/sq/2/file/seg.ts\n',
+                         {'Content-Type': 'application/vnd.apple.mpegurl'})
+        else:
+            content_type = 'video/mp2t' if handler.path.endswith('.ts') else 'video/mp4'
+            handler.send(200, handler.path, {'Content-Type': content_type})
+
+
+@pytest.fixture
+def origin(stub_server):
+    origin = Origin()
+    origin.base_url = stub_server(origin.respond)
+    return origin
+
+
+@pytest.fixture
+def proxy(origin):
+    proxy = HlsProxy('http://local/proxy', SegmentCache(1024 * 1024))
+
+    def source():
+        url = f'{origin.base_url}/master/{origin.sig}/index.m3u8'
+        return requests.get(url).text, url
+
+    content, url = source()
+    master = proxy.rewrite_playlist(content, url, source=source)
+    proxy.master_token = master.strip().splitlines()[-1].rsplit('/', 1)[1]
+    return proxy
+
+
+def tokens(playlist):
+    return [line.rsplit('/', 1)[1].rstrip('"') for line in playlist.splitlines() if '/proxy/segment/' in line]
+
+
+@pytest.mark.parametrize('url, key', [
+    ('https://rr1---sn-a.googlevideo.com/videoplayback/id/abc.1/itag/137/expire/1700000000/ei/XyZ/sig/AOq/sq/5/file/seg.ts',
+     '/videoplayback/id/abc.1/itag/137/sq/5/file/seg.ts'),
+    ('https://cdn.example/path/seg1.ts?Expires=1&Signature=x&Key-Pair-Id=y&quality=hd',
+     '/path/seg1.ts?quality=hd'),
+    ('https://cdn.example/a/b.ts', '/a/b.ts'),
+])
+def test_stable_key(url, key):
+    assert stable_key(url) == key
+
+
+def test_resigned_url_keeps_its_token():
+    proxy = HlsProxy('http://local/proxy', SegmentCache(1024))
+    first = proxy.register('https://rr1.googlevideo.com/videoplayback/id/a/sig/one/sq/1/file/seg.ts')
+    second = proxy.register('https://rr9.googlevideo.com/videoplayback/id/a/sig/two/sq/1/file/seg.ts')
+    assert first == second
+    assert proxy.resolve(first).endswith('/sig/two/sq/1/file/seg.ts')
+
+
+def test_segments_are_cached_with_their_content_type(proxy, origin):
+    init, fragment, ts = tokens(proxy.playlist(proxy.master_token))
+    assert proxy.segment(init) == (f'/v/id/x/{origin.sig}/file/init.mp4'.encode(), 'video/mp4')
+    assert proxy.segment(ts)[1] == 'video/mp2t'
+    requested = len(origin.requests)
+    assert proxy.segment(init)[1] == 'video/mp4'
+    assert len(origin.requests) == requested
+    assert proxy.cache.stats()['hits'] == 1
+
+
+def test_expired_urls_are_mapped_again(proxy, origin):
+    init, fragment, _ = tokens(proxy.playlist(proxy.master_token))
+    assert proxy.segment(fragment)[0].endswith(b'/sig/s1/sq/1/file/seg.m4s')
+
+    # Every signed URL expires: the segment, its media playlist and the
+    # master playlist get 403, the master is resolved again through source()
+    origin.generation = 2
+    data, content_type = proxy.segment(init)
+    assert data == b'/v/id/x/sig/s2/file/init.mp4'
+    assert content_type == 'video/mp4'
+    assert origin.requests[-5:] == [
+        '/v/id/x/sig/s1/file/init.mp4',
+        '/media/sig/s1/file/m.m3u8',
+        '/master/sig/s2/index.m3u8',
+        '/media/sig/s2/file/m.m3u8',
+        '/v/id/x/sig/s2/file/init.mp4',
+    ]
+
+    # The fragment cached under the old signature is still served
+    assert proxy.segment(fragment)[0].endswith(b'/sig/s1/sq/1/file/seg.m4s')
+
+
+def test_unknown_token_and_failed_source(proxy, origin):
+    assert proxy.segment('unknown') == (None, None)
+    init = tokens(proxy.playlist(proxy.master_token))[0]
+    proxy.sources[proxy.parents[proxy.parents[init]]] = lambda: None
+    origin.generation = 3
+    assert proxy.segment(init) == (None, None)
+
+
+def test_cache_spills_to_disk_and_evicts(tmp_path):
+    cache = SegmentCache(10, 20, str(tmp_path / 'segments'))
+    cache.put('a', b'12345678', 'video/mp4')
+    cache.put('b', b'abcdefgh')
+    assert cache.get('a') == (b'12345678', 'video/mp4')
+    assert cache.get('b') == (b'abcdefgh', 'video/mp2t')
+    assert cache.stats()['disk_items'] == 1
+
+    for key in 'cdef':
+        cache.put(key, key.encode() * 8)
+    stats = cache.stats()
+    assert stats['memory_bytes'] <= 10 and stats['disk_bytes'] <= 20
+    assert cache.get('a') is None
+    assert cache.get('f') == (b'f' * 8, 'video/mp2t')
+
+
+def test_cache_skips_segments_larger_than_memory():
+    cache = SegmentCache(4)
+    cache.put('big', b'12345')
+    assert cache.get('big') is None
@@ -0,0 +1,85 @@
+import threading
+import time
+import pytest
+import requests
+from clases.http_client import HttpClient, HostBusy
+
+
+class Origin:
+    """Sends the headers and half the body of /stream, the rest once finish is set. /slow waits before answering."""
+
+    def __init__(self):
+        self.finish = threading.Event()
+        self.answer = threading.Event()
+
+    def respond(self, handler):
+        if handler.path == '/slow':
+            self.answer.wait(10)
+            handler.send(200, b'ok')
+            return
+        handler.send_response(200)
+        handler.send_header('Content-Length', '8')
+        handler.end_headers()
+        handler.wfile.write(b'1234')
+        handler.wfile.flush()
+        self.finish.wait(10)
+        handler.wfile.write(b'5678')
+
+
+@pytest.fixture
+def origin(stub_server):
+    origin = Origin()
+    origin.base_url = stub_server(origin.respond)
+    yield origin
+    origin.finish.set()
+    origin.answer.set()
+
+
+def test_streams_do_not_use_the_request_slots(origin):
+    http = HttpClient(host_limit=8, slot_timeout=1)
+    # One more open body than host_limit, as a 9th viewer would have
+    responses = [http.get(f'{origin.base_url}/stream', stream=True) for _ in range(9)]
+    assert all(response.raw.read(4) == b'1234' for response in responses)
+    # Short requests to the same host still get through
+    origin.answer.set()
+    assert http.get(f'{origin.base_url}/slow').content == b'ok'
+
+    origin.finish.set()
+    assert [response.raw.read() for response in responses] == [b'5678'] * 9
+
+
+def test_stream_limit_raises_instead_of_blocking(origin):
+    http = HttpClient(stream_limit=2, slot_timeout=0.2)
+    first = http.get(f'{origin.base_url}/stream', stream=True)
+    second = http.get(f'{origin.base_url}/stream', stream=True)
+    started = time.time()
+    with pytest.raises(requests.RequestException) as error:
+        http.get(f'{origin.base_url}/stream', stream=True)
+    assert isinstance(error.value, HostBusy)
+    assert time.time() - started < 5
+
+    # Closing a body frees its slot
+    first.close()
+    third = http.get(f'{origin.base_url}/stream', stream=True)
+    second.close()
+    third.close()
+
+
+def test_request_slots_time_out(origin):
+    http = HttpClient(host_limit=1, slot_timeout=0.2)
+    waiting = threading.Thread(target=http.get, args=(f'{origin.base_url}/slow',), daemon=True)
+    waiting.start()
+    time.sleep(0.1)
+    with pytest.raises(HostBusy):
+        http.get(f'{origin.base_url}/slow')
+    origin.answer.set()
+    waiting.join(10)
+    assert http.get(f'{origin.base_url}/slow').content == b'ok'
+
+
+def test_body_read_to_the_end_frees_the_slot(origin):
+    origin.finish.set()
+    http = HttpClient(stream_limit=1, slot_timeout=0.2)
+    for _ in range(3):
+        response = http.get(f'{origin.base_url}/stream', stream=True)
+        assert b''.join(response.iter_content(2)) == b'12345678'
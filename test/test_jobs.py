@@ -0,0 +1,154 @@
+import threading
+import pytest
+from clases.downloads import Job, DownloadQueue, queue_stats, QUEUED, RUNNING, DONE, FAILED
+
+
+class Runner:
+    """run() of a queue: every call waits for release() and returns what results gives."""
+
+    def __init__(self, workdir, results=None):
+        self.workdir = workdir
+        self.results = list(results or [])
+        self.calls = []
+        self.gate = threading.Event()
+        self.started = threading.Semaphore(0)
+
+    def release(self):
+        self.gate.set()
+
+    def __call__(self, job):
+        self.calls.append(job)
+        self.started.release()
+        assert self.gate.wait(10)
+        result = self.results.pop(0) if self.results else 'ok'
+        if isinstance(result, Exception):
+            raise result
+        if result is None:
+            return None
+        path = self.workdir / f'{job.job_id}.mkv'
+        path.write_bytes(result.encode())
+        return str(path)
+
+
+def started(runner, count=1):
+    return all(runner.started.acquire(timeout=10) for _ in range(count))
+
+
+def test_one_job_per_id(workdir):
+    runner = Runner(workdir)
+    downloads = DownloadQueue('test-dedupe', runner, workers=2)
+    job = downloads.submit('E1')
+    assert downloads.submit('E1') is job
+    assert started(runner)
+    assert job.state == RUNNING
+    runner.release()
+    assert job.wait(timeout=10)
+    assert (job.state, job.progress, job.attempts) == (DONE, 100.0, 1)
+    assert len(runner.calls) == 1
+
+    # Done and its file is there: the same job, nothing downloaded again
+    assert downloads.submit('E1') is job
+    (workdir / 'E1.mkv').unlink()
+    again = downloads.submit('E1')
+    assert again is not job
+    assert again.wait(timeout=10) and again.state == DONE
+
+
+def test_full_queue_refuses(workdir):
+    runner = Runner(workdir)
+    downloads = DownloadQueue('test-full', runner, workers=1, max_queued=1)
+    running = downloads.submit('E1')
+    assert started(runner)
+    queued = downloads.submit('E2')
+    assert queued.state == QUEUED
+    assert downloads.submit('E3') is None
+
+    stats = downloads.stats()
+    assert (stats['running'], stats['queued']) == (1, 1)
+    assert [job['id'] for job in stats['jobs']] == ['E1', 'E2']
+    assert queue_stats()['test-full'] == stats
+
+    runner.release()
+    assert running.wait(timeout=10) and queued.wait(timeout=10)
+    assert downloads.submit('E3') is not None
+
+
+def test_retries_get_the_same_job(workdir):
+    runner = Runner(workdir, [None, RuntimeError('connection reset'), 'ok'])
+    runner.release()
+    downloads = DownloadQueue('test-retries', runner, workers=1, retries=2)
+    job = downloads.submit('E1')
+    assert job.wait(timeout=10)
+    assert (job.state, job.attempts) == (DONE, 3)
+    # run() resumes with the same job, it can find its partial files
+    assert runner.calls == [job, job, job]
+
+
+def test_failed_after_the_last_retry(workdir):
+    runner = Runner(workdir, [None, None, 'ok'])
+    downloads = DownloadQueue('test-failed', runner, workers=1, retries=1)
+    job = downloads.submit('E1')
+    assert started(runner)
+    job.update(partial_path='E1.ts')
+    runner.release()
+    assert job.wait(timeout=10)
+    assert (job.state, job.attempts, job.partial_path) == (FAILED, 2, None)
+    assert job.as_dict() == {'id': 'E1', 'state': FAILED, 'progress': 0.0, 'attempts': 2, 'partial': False}
+
+    # A failed job is not reused
+    retry = downloads.submit('E1')
+    assert retry is not job
+    assert retry.wait(timeout=10) and retry.state == DONE
+
+
+def test_finished_jobs_are_pruned(workdir):
+    runner = Runner(workdir)
+    runner.release()
+    downloads = DownloadQueue('test-prune', runner, workers=1, keep_finished=2)
+    for index in range(5):
+        assert downloads.submit(f'E{index}').wait(timeout=10)
+    downloads.submit('E5').wait(timeout=10)
+    assert sorted(downloads.jobs) == ['E3', 'E4', 'E5']
+
+
+def test_wait_until_ready():
+    job = Job('E1')
+    assert not job.wait(timeout=0.05)
+    threading.Timer(0.05, job.update, kwargs={'partial_path': 'E1.ts'}).start()
+    assert job.wait(lambda job: job.partial_path, timeout=10)
+    assert job.state == QUEUED
+
+
+def test_read_partial_while_written(workdir):
+    job = Job('E1')
+    job.update(state=RUNNING)
+    path = workdir / 'E1.ts'
+    writer = path.open('wb')
+    writer.write(b'a' * 1000)
+    writer.flush()
+
+    reader = job.read_partial(str(path))
+    assert next(reader) == b'a' * 1000
+
+    def finish():
+        writer.write(b'b' * 1000)
+        writer.close()
+        job.update(state=DONE, path=str(path))
+
+    threading.Timer(0.1, finish).start()
+    assert b''.join(reader) == b'b' * 1000
+
+
+@pytest.mark.parametrize('state, final, expected', [
+    # Muxed and removed before the player opened it: the final file
+    (DONE, b'final', b'final'),
+    (FAILED, None, b''),
+    (DONE, None, b''),
+])
+def test_read_partial_of_a_missing_file(workdir, state, final, expected):
+    job = Job('E1')
+    path = workdir / 'E1.mkv'
+    if final is not None:
+        path.write_bytes(final)
+    job.update(state=state, path=str(path))
+    assert b''.join(job.read_partial(str(workdir / 'E1.ts'))) == expected
@@ -0,0 +1,86 @@
+import tracemalloc
+from clases.media import MediaItem, Series
+from clases.media.media import COMPRESS_DESCRIPTION_OVER
+
+
+def make_item(index, description='A short description'):
+    # Every video has its own description string, as when parsed from yt-dlp
+    description = f'{description} {index}'
+    return MediaItem(
+        'youtube', f'video{index:05d}',
+        title=f'Video {index}',
+        upload_date='20260101',
+        thumbnail=f'https://i.ytimg.com/vi/video{index:05d}/hqdefault.jpg',
+        description=description,
+        channel_id='UCchannel',
+        uploader='Channel'
+    )
+
+
+def make_dict(index, description='A short description'):
+    description = f'{description} {index}'
+    return {
+        'platform': 'youtube',
+        'media_id': f'video{index:05d}',
+        'title': f'Video {index}',
+        'upload_date': '20260101',
+        'thumbnail': f'https://i.ytimg.com/vi/video{index:05d}/hqdefault.jpg',
+        'description': description,
+        'channel_id': 'UCchannel',
+        'uploader': 'Channel'
+    }
+
+
+def allocated(build, count=5000, **kwargs):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        records = [build(index, **kwargs) for index in range(count)]
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    assert len(records) == count
+    return size
+
+
+def test_no_instance_dict():
+    item = make_item(1)
+    assert not hasattr(item, '__dict__')
+    assert not hasattr(Series('youtube', 'UCchannel'), '__dict__')
+
+
+def test_long_description_is_compressed_until_read():
+    description = 'Line of a long description\n' * 50
+    item = MediaItem('youtube', 'a', description=description)
+    assert len(description) > COMPRESS_DESCRIPTION_OVER
+    assert isinstance(item._description, bytes)
+    assert item.description == description
+
+    short = make_item(2)
+    assert short._description == 'A short description 2'
+
+
+def test_repeated_strings_are_interned():
+    channel = ''.join(['UC', 'channel'])
+    first = MediaItem('youtube', 'a', channel_id=channel)
+    second = MediaItem('youtube', 'b', channel_id=''.join(['UC', 'channel']))
+    assert first.channel_id is second.channel_id
+
+
+def test_audio_copy():
+    item = make_item(7)
+    audio = item.as_audio()
+    assert audio.id == 'video00007-audio'
+    assert item.id == 'video00007'
+    assert audio.description == item.description
+    assert audio.title == item.title
+
+
+def test_memory_against_dicts():
+    # Same fields as the dicts the plugins used before
+    assert allocated(make_item) < allocated(make_dict)
+
+
+def test_memory_with_long_descriptions():
+    description = 'Subscribe and follow the links below. ' * 40
+    assert allocated(make_item, description=description) < allocated(make_dict, description=description) / 2
@@ -0,0 +1,119 @@
+import io
+import struct
+from utils.mp4 import FragmentIndex, iter_boxes, parse_moof, parse_moov, read_box_header
+
+
+## -- FRAGMENTED MP4 BUILDER
+# Only the boxes the index reads, enough to stand in for what ffmpeg writes
+# with -movflags frag_keyframe+empty_moov
+
+def box(box_type, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type, version, payload):
+    return box(box_type, bytes([version, 0, 0, 0]) + payload)
+
+
+def trak(track_id, timescale, handler):
+    tkhd = full_box(b'tkhd', 0, struct.pack('>III', 0, 0, track_id) + b'\0' * 68)
+    mdhd = full_box(b'mdhd', 0, struct.pack('>IIII', 0, 0, timescale, 0) + b'\0' * 4)
+    hdlr = full_box(b'hdlr', 0, b'\0' * 4 + handler + b'\0' * 12 + b'h\0')
+    return box(b'trak', tkhd + box(b'mdia', mdhd + hdlr))
+
+
+def moof(sequence, times, tfdt_version=1):
+    trafs = b''
+    for track_id, decode_time in times:
+        packed = struct.pack('>Q' if tfdt_version == 1 else '>I', decode_time)
+        trafs += box(b'traf', full_box(b'tfhd', 0, struct.pack('>I', track_id)) + full_box(b'tfdt', tfdt_version, packed))
+    return box(b'moof', full_box(b'mfhd', 0, struct.pack('>I', sequence)) + trafs)
+
+
+def build(fragments=10, seconds=2, tfdt_version=1):
+    """ftyp, moov (audio track first, video second) and one moof/mdat pair per fragment."""
+    init = box(b'ftyp', b'isom\0\0\0\0') + box(b'moov', trak(2, 48000, b'soun') + trak(1, 90000, b'vide'))
+    data = init
+    offsets = []
+    for index in range(fragments):
+        offsets.append(len(data))
+        times = [(2, index * seconds * 48000), (1, index * seconds * 90000)]
+        data += moof(index + 1, times, tfdt_version) + box(b'mdat', bytes([index]) * 1000)
+    return data, len(init), offsets
+
+
+## -- TESTS
+
+def test_box_headers():
+    data = box(b'free', b'1234') + struct.pack('>I4sQ', 1, b'mdat', 24) + b'x' * 8
+    assert read_box_header(data, 0) == (12, b'free', 8)
+    assert read_box_header(data, 12) == (24, b'mdat', 16)
+    assert read_box_header(data, 30) is None
+    assert [box_type for box_type, _, _ in iter_boxes(data)] == [b'free', b'mdat']
+    # An incomplete last box is not yielded
+    assert [box_type for box_type, _, _ in iter_boxes(data[:-1])] == [b'free']
+
+
+def test_parse_moov_and_moof():
+    data, init_end, offsets = build(fragments=2)
+    moov = next((start, end) for box_type, start, end in iter_boxes(data) if box_type == b'moov')
+    assert parse_moov(data, *moov) == {2: (48000, b'soun'), 1: (90000, b'vide')}
+    second = next((start, end) for box_type, start, end in iter_boxes(data, offsets[1]) if box_type == b'moof')
+    assert parse_moof(data, *second) == {2: 96000, 1: 180000}
+
+
+def test_index_of_a_complete_file():
+    data, init_end, offsets = build()
+    index = FragmentIndex()
+    assert index.update(io.BytesIO(data), len(data)) == 10
+    assert index.init_end == init_end
+    # The video track is the reference even when it is not the first one
+    assert index.reference_track() == 1
+    assert index.fragments == [(i * 2.0, offset) for i, offset in enumerate(offsets)]
+    assert index.duration == 18.0
+
+
+def test_offsets():
+    data, _, offsets = build()
+    index = FragmentIndex()
+    index.update(io.BytesIO(data), len(data))
+    assert index.offset_for(0) == offsets[0]
+    assert index.offset_for(5.9) == offsets[2]
+    assert index.offset_for(6) == offsets[3]
+    # Past the last fragment start: unknown while growing, the last one when complete
+    assert index.offset_for(19) is None
+    assert index.offset_for(19, complete=True) == offsets[9]
+
+
+def test_growing_file_is_indexed_incrementally():
+    data, _, offsets = build()
+    file = io.BytesIO(data)
+    index = FragmentIndex()
+    # A size in the middle of the fifth fragment only indexes the first four
+    assert index.update(file, offsets[4] + 100) == 4
+    assert index.position == offsets[4]
+    assert index.offset_for(6) == offsets[3]
+    # Where the fourth fragment ends is not known yet
+    assert index.offset_for(7) is None
+    assert index.update(file, len(data)) == 10
+    assert index.offset_for(9) == offsets[4]
+
+
+def test_32_bit_decode_times():
+    data, _, offsets = build(fragments=3, tfdt_version=0)
+    index = FragmentIndex()
+    index.update(io.BytesIO(data), len(data))
+    assert index.offset_for(3) == offsets[1]
+    assert index.offset_for(4.5, complete=True) == offsets[2]
+
+
+def test_init_segment_and_fragments_are_a_valid_file():
+    data, init_end, offsets = build()
+    index = FragmentIndex()
+    index.update(io.BytesIO(data), len(data))
+    start = index.offset_for(10)
+    seeked = data[:index.init_end] + data[start:]
+
+    again = FragmentIndex()
+    assert again.update(io.BytesIO(seeked), len(seeked)) == 5
+    assert again.fragments[0] == (10.0, init_end)
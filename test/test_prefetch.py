@@ -0,0 +1,243 @@
+import json
+import time
+import pytest
+from flask import Flask
+from clases.downloads import Job
+from clases.prefetch import PrefetchEngine, Policy, BandwidthBudget, JellyfinSessions, webhook_authorized
+from clases.prefetch.prefetch import BYTES, DOWNLOAD, OFF, warm_url
+
+
+class Server:
+    """Media server adapter of a three episode season whose strm files point to url."""
+
+    def __init__(self, url):
+        self.url = url
+        self.episodes = ['e1', 'e2', 'e3']
+
+    def playing(self):
+        return [{'Id': 'e1'}]
+
+    def next_item(self, item):
+        index = self.episodes.index(item['Id'])
+        return {'Id': self.episodes[index + 1]} if index < len(self.episodes) - 1 else None
+
+    def item_path(self, item_id):
+        return f'{self.url}/youtube/stream/{item_id}'
+
+
+class Plugin:
+    """Stub plugin endpoint answering status with body or size bytes, 400 (not retried by the client) until set."""
+
+    def __init__(self):
+        self.status = 400
+        self.size = 1024
+        self.body = None
+        self.requests = []
+
+    def respond(self, handler):
+        self.requests.append((handler.path, handler.headers.get('Range')))
+        handler.send(self.status, self.body if self.body is not None else b'x' * self.size)
+
+
+@pytest.fixture
+def plugin_server(stub_server):
+    plugin = Plugin()
+    plugin.url = stub_server(plugin.respond)
+    return plugin
+
+
+def engine_for(plugin, policy=None, **kwargs):
+    return PrefetchEngine(Server(plugin.url), default_policy=policy or Policy(), poll_interval=0, **kwargs)
+
+
+def test_item_marked_only_after_a_successful_warm(plugin_server):
+    engine = engine_for(plugin_server)
+    engine.warm({'Id': 'e1'})
+    # Only the warm route, the strm URL itself is not opened
+    assert plugin_server.requests == [('/youtube/warm/e2?mode=resolve', None)]
+    # The plugin failed: neither the playing item nor the next one are handled
+    assert 'e1' not in engine.playing and 'e2' not in engine.done
+    assert not engine.pending
+
+    plugin_server.status = 200
+    engine.warm({'Id': 'e1'})
+    assert 'e1' in engine.playing and 'e2' in engine.done
+
+    # Already warmed, not requested again
+    engine.playing.clear()
+    engine.warm({'Id': 'e1'})
+    assert len(plugin_server.requests) == 2
+
+
+def test_last_episode_has_nothing_to_warm(plugin_server):
+    engine = engine_for(plugin_server)
+    engine.warm({'Id': 'e3'})
+    assert 'e3' in engine.playing
+    assert plugin_server.requests == []
+
+
+def test_bytes_policy_spends_the_budget(plugin_server):
+    plugin_server.status = 200
+    plugin_server.size = 300 * 1024
+    engine = engine_for(plugin_server, Policy(BYTES, max_bytes=64 * 1024), budget_bytes_per_hour=100 * 1024)
+    assert engine.prefetch(f'{plugin_server.url}/youtube/stream/e2')
+    assert 64 * 1024 <= engine.budget.used < 300 * 1024
+    assert engine.prefetch(f'{plugin_server.url}/youtube/stream/e3')
+    assert engine.budget.remaining() == 0
+    # Budget spent: nothing is requested and the item stays pending
+    assert not engine.prefetch(f'{plugin_server.url}/youtube/stream/e1')
+    assert len(plugin_server.requests) == 2
+
+
+def test_download_policy_returns_once_queued(plugin_server):
+    plugin_server.status = 202
+    plugin_server.body = json.dumps({'bytes': 5000})
+    engine = engine_for(plugin_server, Policy(DOWNLOAD), budget_bytes_per_hour=100 * 1024)
+    assert engine.prefetch(f'{plugin_server.url}/crunchyroll/download/G1_E2')
+    assert plugin_server.requests == [('/crunchyroll/warm/G1_E2?mode=download', None)]
+    assert engine.budget.used == 5000
+
+
+def test_plugin_without_a_warm_route(plugin_server):
+    plugin_server.status = 404
+    engine = engine_for(plugin_server)
+    assert engine.prefetch(f'{plugin_server.url}/twitch/direct/channel')
+    assert engine.budget.used == 0
+
+
+def test_warm_url():
+    assert warm_url('http://host:5005/youtube/stream/abc-audio', 'resolve') == 'http://host:5005/youtube/warm/abc-audio?mode=resolve'
+    assert warm_url('http://host/crunchyroll/stream/video/G1_E2', 'download') == 'http://host/crunchyroll/warm/G1_E2?mode=download'
+    assert warm_url('http://host/youtube', 'resolve') is None
+
+
+def test_policy_off_and_urls_without_a_plugin(plugin_server):
+    engine = engine_for(plugin_server, Policy(OFF))
+    assert engine.prefetch(f'{plugin_server.url}/twitch/stream/e2')
+    assert engine.policy_for('http://host/') == (None, None)
+    assert plugin_server.requests == []
+
+
+@pytest.mark.parametrize('config, expected', [
+    ({'prefetch_policy': 'BYTES', 'prefetch_mb': '2'}, (BYTES, 2 * 1024 * 1024)),
+    ({'prefetch_policy': 'unknown', 'prefetch_mb': 'x'}, ('resolve', 8 * 1024 * 1024)),
+    ({}, ('resolve', 8 * 1024 * 1024)),
+])
+def test_policy_from_config(config, expected):
+    policy = Policy.from_config(config)
+    assert (policy.mode, policy.max_bytes) == expected
+
+
+def test_budget_window_rolls():
+    budget = BandwidthBudget(100)
+    budget.consume(80)
+    assert budget.remaining() == 20
+    budget.window_start -= 3600
+    assert budget.remaining() == 100
+    assert BandwidthBudget(0).remaining() == float('inf')
+
+
+def test_webhook_events(plugin_server):
+    plugin_server.status = 200
+    engine = engine_for(plugin_server)
+    assert not engine.on_webhook({'NotificationType': 'ItemAdded', 'ItemId': 'e1'})
+    assert not engine.on_webhook({'NotificationType': 'PlaybackStart', 'ItemType': 'Movie', 'ItemId': 'e1'})
+    assert engine.on_webhook({'NotificationType': 'PlaybackStart', 'ItemId': 'e1'})
+
+    deadline = time.time() + 10
+    while 'e2' not in engine.done and time.time() < deadline:
+        time.sleep(0.01)
+    assert 'e2' in engine.done
+    # Webhooks arriving: polling falls back to its longest interval
+    assert engine.next_interval(60, 1) == engine.max_poll_interval
+
+
+@pytest.mark.parametrize('secret, given, expected', [
+    ('s3cret', 's3cret', True),
+    ('s3cret', 'other', False),
+    ('s3cret', None, False),
+    ('', '', False),
+    (None, None, False),
+])
+def test_webhook_authorized(secret, given, expected):
+    assert webhook_authorized({'ytdlp2strm_prefetch_webhook_secret': secret}, given) is expected
+
+
+def test_jellyfin_sessions(stub_server):
+    requests = []
+
+    def respond(handler):
+        requests.append(handler.path)
+        path = handler.path.split('?')[0]
+        if handler.headers.get('X-Emby-Token') != 'key':
+            handler.send(401)
+        elif path == '/Sessions':
+            body = [{'NowPlayingItem': {'Id': 'e1', 'Type': 'Episode', 'SeriesId': 's', 'SeasonId': 'season'}},
+                    {'NowPlayingItem': {'Id': 'm1', 'Type': 'Movie'}}, {}]
+        elif path == '/Shows/s/Episodes':
+            body = {'Items': [{'Id': 'e1'}, {'Id': 'e2'}]}
+        elif path == '/Users/user/Items/e2':
+            body = {'MediaSources': [{'Path': 'http://host/youtube/stream/e2'}]}
+        else:
+            handler.send(404)
+            return
+        handler.send(200, json.dumps(body), {'Content-Type': 'application/json'})
+
+    sessions = JellyfinSessions(stub_server(respond) + '/', 'key', 'user')
+    playing = sessions.playing()
+    assert [item['Id'] for item in playing] == ['e1']
+    assert sessions.next_item(playing[0]) == {'Id': 'e2'}
+    assert sessions.next_item({'Id': 'e2', 'SeriesId': 's', 'SeasonId': 'season'}) is None
+    # The season is listed once
+    assert sum(path.startswith('/Shows/') for path in requests) == 1
+    assert sessions.item_path('e2') == 'http://host/youtube/stream/e2'
+
+
+# Merged format only: playing it means a full ffmpeg remux into ./temp
+MERGED = {'formats': [
+    {'format_id': '137', 'url': 'https://v/137', 'protocol': 'https', 'vcodec': 'avc1', 'acodec': 'none', 'height': 1080, 'filesize': 7000},
+    {'format_id': '140', 'url': 'https://v/140', 'protocol': 'https', 'vcodec': 'none', 'acodec': 'mp4a', 'filesize_approx': 3000},
+]}
+
+
+@pytest.fixture
+def youtube(plugin, monkeypatch):
+    """YouTube plugin probing MERGED and recording the downloads it starts."""
+    module = plugin('youtube')
+    module.started = []
+    monkeypatch.setattr(module, 'fetch_info_json_for_video', lambda youtube_id, refresh=False: MERGED)
+    monkeypatch.setattr(module.downloads, 'start', lambda *args: module.started.append(args) or object())
+    monkeypatch.setattr(module.downloads, 'get', lambda media_id, variant='': None)
+    monkeypatch.setattr(module.media_cache, 'path', lambda *args, **kwargs: None)
+    return module
+
+
+def test_youtube_resolve_does_not_download(youtube):
+    with Flask(__name__).test_request_context():
+        response = youtube.warm('abc', 'resolve')
+    assert response.get_json() == {'bytes': 0}
+    assert youtube.started == []
+
+
+def test_youtube_download_starts_it_and_answers(youtube):
+    with Flask(__name__).test_request_context():
+        response, status = youtube.warm('abc', 'download')
+    assert (status, response.get_json()) == (202, {'bytes': 10000})
+    assert [(media_id, variant) for media_id, variant, *_ in youtube.started] == [('abc', 'video')]
+
+
+def test_crunchyroll_download_is_queued_not_waited(plugin, monkeypatch):
+    crunchyroll = plugin('crunchyroll')
+    submitted = []
+    # A job that never runs: waiting for it would hang the warm
+    monkeypatch.setattr(crunchyroll.download_queue, 'submit', lambda crunchyroll_id: submitted.append(crunchyroll_id) or Job(crunchyroll_id))
+    monkeypatch.setattr(crunchyroll.media_cache, 'path', lambda *args, **kwargs: None)
+    with Flask(__name__).test_request_context():
+        response, status = crunchyroll.warm('G1_E2', 'download')
+        assert crunchyroll.warm('G1_E2', 'resolve').get_json() == {'bytes': 0}
+    assert status == 202
+    assert submitted == ['G1_E2']
+
+    monkeypatch.setattr(crunchyroll.download_queue, 'submit', lambda crunchyroll_id: None)
+    with Flask(__name__).test_request_context():
+        assert crunchyroll.warm('G1_E3', 'download').status_code == 503
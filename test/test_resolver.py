@@ -0,0 +1,184 @@
+import time
+import pytest
+from clases.resolver import StreamResolver, url_expiry, parse_byte_range, parse_content_range, response_range
+
+
+class Origin:
+    """
+    Stub media server: URLs carry /s<generation>/, older generations get 403.
+    The next `drops` responses announce their full length and close the
+    connection halfway through the body.
+    """
+
+    def __init__(self, size=300 * 1024):
+        self.data = bytes(index % 251 for index in range(size))
+        self.generation = 1
+        self.drops = 0
+        self.ignore_range = False
+        self.requests = []
+
+    def respond(self, handler):
+        range_header = handler.headers.get('Range')
+        self.requests.append((handler.path, range_header))
+        if f'/s{self.generation}/' not in handler.path:
+            handler.send(403)
+            return
+
+        size = len(self.data)
+        requested = None if self.ignore_range else parse_byte_range(range_header)
+        if requested is None:
+            status, start, end = 200, 0, size - 1
+        elif requested[0] is None:
+            status, start, end = 206, size - requested[1], size - 1
+        else:
+            status, start, end = 206, requested[0], min(size - 1, requested[1] if requested[1] is not None else size - 1)
+        body = self.data[start:end + 1]
+
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'video/mp4')
+        handler.send_header('Content-Length', str(len(body)))
+        if status == 206:
+            handler.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        handler.end_headers()
+        if self.drops:
+            self.drops -= 1
+            body = body[:len(body) // 2]
+            handler.close_connection = True
+        handler.wfile.write(body)
+        handler.wfile.flush()
+
+
+@pytest.fixture
+def origin(stub_server):
+    origin = Origin()
+    origin.base_url = stub_server(origin.respond)
+    return origin
+
+
+@pytest.fixture
+def resolver(origin):
+    resolutions = []
+
+    def resolve(media_id, refresh):
+        resolutions.append(refresh)
+        return f'{origin.base_url}/v/s{origin.generation}/{media_id}.mp4'
+
+    resolver = StreamResolver('test', resolve)
+    resolver.resolutions = resolutions
+    return resolver
+
+
+def stream(resolver, range_header=None):
+    response = resolver.open('video', range_header)
+    return response, b''.join(resolver.iter_content('video', response, range_header, chunk_size=8192))
+
+
+def test_whole_file_without_drops(resolver, origin):
+    response, data = stream(resolver)
+    assert response.status_code == 200
+    assert data == origin.data
+    assert resolver.stats()['resumed_streams'] == 0
+
+
+def test_dropped_connection_is_resumed(resolver, origin):
+    origin.drops = 2
+    response, data = stream(resolver)
+    assert data == origin.data
+    assert resolver.stats()['resumed_streams'] == 2
+    size = len(origin.data)
+    # Content-Length of the 200 gives the end of every resumed range
+    assert [header for _, header in origin.requests] == [
+        None, f'bytes={size // 2}-{size - 1}', f'bytes={size // 2 + size // 4}-{size - 1}'
+    ]
+
+
+def test_resume_stays_inside_the_range(resolver, origin):
+    origin.drops = 1
+    response, data = stream(resolver, 'bytes=1000-100999')
+    assert response.status_code == 206
+    assert data == origin.data[1000:101000]
+    assert origin.requests[-1][1] == 'bytes=51000-100999'
+
+
+def test_suffix_range_resumes_from_the_served_offset(resolver, origin):
+    origin.drops = 1
+    size = len(origin.data)
+    _, data = stream(resolver, 'bytes=-10000')
+    assert data == origin.data[-10000:]
+    assert origin.requests[-1][1] == f'bytes={size - 5000}-{size - 1}'
+
+
+def test_expired_url_mid_transfer(resolver, origin):
+    origin.drops = 1
+    response = resolver.open('video')
+    chunks = resolver.iter_content('video', response, chunk_size=8192)
+    data = next(chunks)
+    # The signature expires while the first half is being sent
+    origin.generation = 2
+    data += b''.join(chunks)
+    assert data == origin.data
+    assert resolver.resolutions == [False, True]
+    assert resolver.stats()['expired_responses'] == 1
+    assert origin.requests[-1][0].startswith('/v/s2/')
+
+
+def test_upstream_ignoring_the_range_is_not_duplicated(resolver, origin):
+    origin.drops = 1
+    response = resolver.open('video', 'bytes=0-')
+    origin.ignore_range = True
+    data = b''.join(resolver.iter_content('video', response, 'bytes=0-'))
+    # The half that arrived, never the start of the file again
+    assert data == origin.data[:len(origin.data) // 2]
+
+
+def test_failed_resolution(origin):
+    resolver = StreamResolver('test', lambda media_id, refresh: None)
+    assert resolver.open('video') is None
+    assert resolver.stats()['failures'] == 1
+
+
+def test_url_expiry():
+    assert url_expiry('https://r1.googlevideo.com/videoplayback?expire=1700000000&id=1', 60) == 1700000000
+    assert url_expiry('https://r1.googlevideo.com/videoplayback/expire/1700000001/id/1', 60) == 1700000001
+    assert abs(url_expiry('https://cdn.example/file.mp4', 60) - (time.time() + 60)) < 5
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, None)),
+    ('bytes=-500', (None, 500)),
+    ('bytes= 5-9, 20-30', (5, 9)),
+    ('bytes=x-1', None),
+    ('items=0-1', None),
+    ('', None),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header) == expected
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes 0-99/1000', (0, 99)),
+    ('bytes 100-199/*', (100, 199)),
+    ('bytes */1000', None),
+    (None, None),
+])
+def test_parse_content_range(header, expected):
+    assert parse_content_range(header) == expected
+
+
+class Response:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+@pytest.mark.parametrize('response, range_header, expected', [
+    (Response(206, {'Content-Range': 'bytes 900-999/1000'}), 'bytes=-100', (900, 999)),
+    (Response(206, {}), 'bytes=10-20', (10, 20)),
+    (Response(206, {}), 'bytes=-100', (None, None)),
+    (Response(200, {'Content-Length': '1000'}), 'bytes=10-20', (0, 999)),
+    (Response(200, {}), None, (0, None)),
+    (None, None, (None, None)),
+])
+def test_response_range(response, range_header, expected):
+    assert response_range(response, range_header) == expected
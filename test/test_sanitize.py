@@ -0,0 +1,89 @@
+import random
+import re
+import timeit
+import unicodedata
+import pytest
+from utils.sanitize import sanitize, sanitize_many, sanitize_path
+
+
+def reference_sanitize(filename, max_length=255):
+    """sanitize() before the single translate pass and the memo, results must not change."""
+    if not filename:
+        return "unnamed"
+    filename = unicodedata.normalize('NFC', filename)
+    for char, replacement in zip('<>:"/\\|?*', '＜＞：＂／＼｜？＊'):
+        filename = filename.replace(char, replacement)
+    filename = ''.join(char for char in filename if ord(char) >= 32 and not (127 <= ord(char) <= 159))
+    filename = filename.strip('. ')
+    filename = re.sub(r'\s+', ' ', filename)
+    if not filename:
+        return "unnamed"
+    if len(filename.encode('utf-8')) > max_length:
+        encoded = filename.encode('utf-8')[:max_length]
+        for i in range(0, 5):
+            try:
+                filename = encoded[:len(encoded) - i].decode('utf-8')
+                break
+            except UnicodeDecodeError:
+                continue
+    filename = filename.strip('. ')
+    return filename if filename else "unnamed"
+
+
+ALPHABET = (
+    'abcXYZ019 -_.,'
+    '<>:"/\\|?*'
+    '\x00\x07\x1f\x7f\x85\x9f\t\n\r\u3000'
+    'ñçüé日本語한국어中文'
+    'e\u0301a\u030a'
+    '😀🎬'
+)
+
+
+def fuzz_corpus(count=3000, seed=2026):
+    rng = random.Random(seed)
+    for _ in range(count):
+        length = rng.choice((0, 1, 3, 10, 40, 90, 300))
+        yield ''.join(rng.choice(ALPHABET) for _ in range(length))
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('', 'unnamed'),
+    ('...', 'unnamed'),
+    ('  My: Video / Part 1?  ', 'My： Video ／ Part 1？'),
+    ('a\x00b\x1fc\x7fd\x9fe', 'abcde'),
+    ('tabs\tand\nnew  lines', 'tabsandnew lines'),
+    ('日本語のタイトル', '日本語のタイトル'),
+    ('cafe\u0301', 'café'),
+    ('trailing dot.', 'trailing dot'),
+])
+def test_known_names(name, expected):
+    assert sanitize(name) == expected
+
+
+def test_truncates_without_splitting_characters():
+    name = '日' * 100
+    result = sanitize(name, max_length=200)
+    assert len(result.encode('utf-8')) <= 200
+    assert result == '日' * 66
+
+
+def test_same_results_as_the_reference():
+    for name in fuzz_corpus():
+        for max_length in (255, 20):
+            assert sanitize(name, max_length) == reference_sanitize(name, max_length), repr(name)
+
+
+def test_sanitize_many_and_path():
+    assert sanitize_many(['a:b', '', 'c']) == ['a：b', 'unnamed', 'c']
+    assert sanitize_path('/media/Show: One/S01?') == '/media/Show： One/S01？'
+    assert sanitize_path('C:\\Shows\\a|b') == 'C:\\Shows\\a｜b'
+
+
+def test_faster_than_the_reference():
+    # Titles repeat for every file of a video (strm, nfo, images), the memo
+    # answers those, and a cold run is still a single pass
+    names = list(fuzz_corpus(500))
+    reference = timeit.timeit(lambda: [reference_sanitize(n) for n in names], number=5)
+    current = timeit.timeit(lambda: [sanitize(n) for n in names], number=5)
+    assert current < reference
@@ -0,0 +1,84 @@
+import sys
+import pytest
+from clases.worker import worker as w
+
+# Adversarial yt-dlp --print '%(.{...})j' output, one entry per line
+CORPUS = [
+    b'{"id": "v1", "title": "Plain", "description": "", "thumbnail": "https://t/1.jpg", "upload_date": "20260101"}',
+    b'',
+    b'   ',
+    b'WARNING: [twitch:vod] Unable to download JSON metadata',
+    b'{"id": "v2", "title": "Semicolons; and \\"quotes\\"\\nnew line", "description": "a;b;c"}',
+    b'{"id": "v3", "title": null, "description": null, "thumbnail": null, "upload_date": null}',
+    '{"id": "v4", "title": "日本語 🎬 ñ"}'.encode('utf-8'),
+    b'{"id": "v5", "title": "Bad \xff\xfe bytes"}',
+    b'{"id": "v6", "title": "Trailing garbage"} extra',
+    b'{"id": "v7", "title": "Truncated',
+    b'["not", "an", "object"]',
+    b'42',
+    b'null',
+    b'NaN',
+    b'"string"',
+    b'{"id": 8, "title": 123, "upload_date": 20260102}',
+    b'{}',
+    b'{"id": "v9", "title": "CRLF"}\r',
+    b'\xef\xbb\xbf{"id": "v10", "title": "BOM"}',
+    b'{"id": "v11", "title": "' + b'x' * (2 * 1024 * 1024) + b'"}',
+    b'{"id": "v12", "title": "nul \\u0000 inside", "description": "\\u0000"}',
+    # Raw control characters are not valid inside JSON strings
+    b'{"id": "v14", "title": "raw \x00 nul"}',
+    b'{"id": "v13", "title": "Last line without newline"}',
+]
+
+
+@pytest.fixture
+def twitch(plugin):
+    return plugin('twitch')
+
+
+@pytest.fixture
+def corpus(workdir):
+    path = workdir / 'corpus.jsonl'
+    path.write_bytes(b'\n'.join(CORPUS))
+    return [sys.executable, '-c', f'import sys; sys.stdout.buffer.write(open({str(path)!r}, "rb").read())']
+
+
+def test_stream_json_only_yields_objects(corpus):
+    entries = list(w.worker(corpus).stream_json())
+    assert all(isinstance(entry, dict) for entry in entries)
+    assert [entry.get('id') for entry in entries] == [
+        'v1', 'v2', 'v3', 'v4', 'v5', 8, None, 'v9', 'v11', 'v12', 'v13'
+    ]
+    assert entries[1]['title'] == 'Semicolons; and "quotes"\nnew line'
+    assert entries[3]['title'] == '日本語 🎬 ñ'
+    # Invalid UTF-8 is replaced, not fatal
+    assert entries[4]['title'] == 'Bad �� bytes'
+    assert len(entries[8]['title']) == 2 * 1024 * 1024
+
+
+def test_items_from_the_corpus(twitch, corpus):
+    items = [twitch.item_from_info(data, 'channel') for data in w.worker(corpus).stream_json()]
+    for item in items:
+        for field in ('media_id', 'title', 'description', 'thumbnail', 'upload_date'):
+            value = item.description if field == 'description' else getattr(item, field)
+            assert isinstance(value, str), (item, field)
+        assert item.channel_id == item.uploader == 'channel'
+    by_id = {item.id: item for item in items}
+    assert by_id['v1'].upload_date == '20260101'
+    assert by_id['v3'].title == '' and by_id['v3'].thumbnail == ''
+    assert by_id['8'].title == '123' and by_id['8'].upload_date == '20260102'
+    assert by_id[''].title == ''
+    assert by_id['v12'].description == '\x00'
+    assert 'v14' not in by_id
+
+
+def test_missing_and_null_fields(twitch):
+    item = twitch.item_from_info({'id': 'v1', 'title': None}, 'channel')
+    assert (item.id, item.title, item.description, item.thumbnail, item.upload_date) == ('v1', '', '', '', '')
+
+
+def test_listing_fields_are_one_json_object(twitch):
+    # yt-dlp prints the dict of these fields as one JSON line
+    assert twitch.LISTING_FIELDS.startswith('%(.{') and twitch.LISTING_FIELDS.endswith('})j')
+    fields = twitch.LISTING_FIELDS[4:-3].split(',')
+    assert fields == ['id', 'title', 'description', 'thumbnail', 'upload_date']
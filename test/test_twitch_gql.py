@@ -0,0 +1,111 @@
+import json
+import pytest
+from clases.http_client import HttpClient, client
+
+
+@pytest.fixture
+def gql(plugin):
+    plugin('twitch')
+    from plugins.twitch import gql
+    return gql
+
+
+def answers(operations):
+    """GQL answers of a batch: offline channels except live_*, broken_* shells have no user."""
+    result = []
+    for operation in operations:
+        variables = operation['variables']
+        if operation['operationName'] == 'ChannelShell':
+            login = variables['login']
+            user = None if login.startswith('broken_') else {
+                'displayName': login.title(),
+                'profileImageURL': f'https://cdn/{login}-70x70.png',
+                'bannerImageURL': None
+            }
+            result.append({'data': {'userOrError': user}})
+        else:
+            login = variables['channelLogin']
+            stream = {'id': 42} if login.startswith('live_') else None
+            result.append({'data': {'user': {'stream': stream}}})
+    return result
+
+
+class Gql:
+    """Stub GQL endpoint, logins starting with fail_ fail their whole batch, short_ get a short answer."""
+
+    def __init__(self):
+        self.batches = []
+
+    def respond(self, handler):
+        operations = json.loads(handler.body())
+        logins = [op['variables'].get('login') for op in operations if op['operationName'] == 'ChannelShell']
+        self.batches.append(logins)
+        if handler.headers.get('Client-Id') is None:
+            handler.send(401)
+        elif any(login.startswith('fail_') for login in logins):
+            handler.send(500, 'Service error')
+        elif any(login.startswith('short_') for login in logins):
+            handler.send(200, json.dumps(answers(operations)[:-1]))
+        else:
+            handler.send(200, json.dumps(answers(operations)), {'Content-Type': 'application/json'})
+
+
+@pytest.fixture
+def server(gql, stub_server, monkeypatch):
+    server = Gql()
+    monkeypatch.setattr(gql, 'GQL_URL', stub_server(server.respond) + '/gql')
+    return server
+
+
+def test_every_channel_in_batches(gql, server):
+    logins = [f'channel{i}' for i in range(38)] + ['live_one', 'broken_one']
+    info = gql.channels_info(logins, client())
+    per_request = gql.MAX_OPERATIONS // 2
+    assert [len(batch) for batch in server.batches] == [per_request, per_request, 40 - 2 * per_request]
+    assert sum(server.batches, []) == logins
+    assert set(info) == set(logins)
+    assert info['channel0'] == {
+        'name': 'Channel0',
+        'poster': 'https://cdn/channel0-300x300.png',
+        'landscape': '',
+        'live': False,
+        'stream_id': ''
+    }
+    assert info['live_one']['live'] is True
+    assert info['live_one']['stream_id'] == '42'
+    assert info['broken_one']['name'] == '' and info['broken_one']['live'] is False
+
+
+def test_failed_batches_are_missing(gql, server):
+    per_request = gql.MAX_OPERATIONS // 2
+    logins = [f'channel{i}' for i in range(per_request)] + ['fail_a'] + [f'other{i}' for i in range(per_request - 1)] + ['short_b']
+    info = gql.channels_info(logins, client())
+    assert len(server.batches) == 3
+    # The second batch failed and the third answer was short: only the first one is kept
+    assert set(info) == set(logins[:per_request])
+
+
+def test_no_channels_no_requests(gql, server):
+    assert gql.channels_info([], client()) == {}
+    assert server.batches == []
+
+
+def test_unreachable_server(gql, monkeypatch):
+    monkeypatch.setattr(gql, 'GQL_URL', 'http://127.0.0.1:9/gql')
+    assert gql.channels_info(['channel'], HttpClient(retries=0)) == {}
+
+
+@pytest.mark.parametrize('shell, use_live, expected', [
+    (None, None, {'name': '', 'poster': '', 'landscape': '', 'live': None, 'stream_id': ''}),
+    ({'data': None}, {'data': {'user': None}}, {'name': '', 'poster': '', 'landscape': '', 'live': None, 'stream_id': ''}),
+    # Live status from the shell when UseLive has no user
+    ({'data': {'userOrError': {'displayName': 'A', 'stream': {'id': '7'}}}}, {'data': {}},
+     {'name': 'A', 'poster': '', 'landscape': '', 'live': True, 'stream_id': '7'}),
+    ({'data': {'userOrError': {'displayName': 'A', 'stream': None}}}, None,
+     {'name': 'A', 'poster': '', 'landscape': '', 'live': False, 'stream_id': ''}),
+    # UseLive wins over the shell
+    ({'data': {'userOrError': {'stream': {'id': '7'}}}}, {'data': {'user': {'stream': None}}},
+     {'name': '', 'poster': '', 'landscape': '', 'live': False, 'stream_id': ''}),
+])
+def test_parse_channel(gql, shell, use_live, expected):
+    assert gql.parse_channel(shell, use_live) == expected
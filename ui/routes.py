@@ -4,6 +4,9 @@ from flask_socketio import SocketIO
 import json
 import logging
 from clases.worker import worker as w
+from clases.media_cache import media_cache
+from clases.downloads import queue_stats
+from clases import prefetch
 from ui.ui import Ui
 _ui = Ui()
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
@@ -20,9 +23,22 @@ def index():
         plugins=_ui.plugins,
         crons=crons,
         last_executions=last_executions,
-        next_executions=next_executions
+        next_executions=next_executions,
+        cache_stats=media_cache.stats(),
+        download_queues=queue_stats()
     )
 
+# Webhook de Jellyfin (plugin Webhook, eventos PlaybackStart y PlaybackProgress)
+@app.route('/prefetch/webhook', methods=['POST'])
+def prefetch_webhook():
+    # Secreto compartido en la cabecera X-Webhook-Secret o en ?secret=
+    secret = request.headers.get('X-Webhook-Secret') or request.args.get('secret')
+    if not prefetch.webhook_authorized(_ui.general_settings, secret):
+        return jsonify({'error': 'forbidden'}), 403
+    payload = request.get_json(force=True, silent=True) or {}
+    used = prefetch.on_webhook(payload)
+    return jsonify({'accepted': used}), 202 if used else 200
+
 # Ruta para las opciones generales
 @app.route('/general', methods=['GET', 'POST'])
 def general_settings():
@@ -1,7 +1,7 @@
 """
 Utils package for ytdlp2STRM
 """
-from .sanitize import sanitize, sanitize_path
+from .sanitize import sanitize, sanitize_many, sanitize_path
 from .episode_numbering import format_episode_title
 
-__all__ = ['sanitize', 'sanitize_path', 'format_episode_title']
+__all__ = ['sanitize', 'sanitize_many', 'sanitize_path', 'format_episode_title']
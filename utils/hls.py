@@ -0,0 +1,270 @@
+"""
+HLS master playlist parser and rewriter.
+Parses #EXT-X-STREAM-INF variants and #EXT-X-MEDIA renditions in one pass and
+writes back a master playlist with a single selected variant and audio track.
+"""
+import re
+
+# KEY=VALUE pairs, quoted values may contain commas
+_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+_BANDWIDTH_RE = re.compile(r'(?<![A-Z-])BANDWIDTH=\d+')
+_BANDWIDTH_VALUE_RE = re.compile(r'(?<![A-Z-])BANDWIDTH=(\d+)')
+
+STREAM_INF = '#EXT-X-STREAM-INF:'
+MEDIA = '#EXT-X-MEDIA:'
+
+
+def parse_attributes(line):
+    """Return the attribute list of a tag line as a dict with upper-case keys."""
+    try:
+        raw = line.split(':', 1)[1]
+    except IndexError:
+        return {}
+    return {
+        key.upper(): value.strip('"')
+        for key, value in _ATTR_RE.findall(raw)
+    }
+
+
+def _int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class Variant:
+    """
+    A #EXT-X-STREAM-INF entry. Only BANDWIDTH is read up front, the rest of
+    the attributes are parsed when a policy asks for them.
+    """
+    __slots__ = ('line', 'uri', 'bandwidth', '_attrs')
+
+    def __init__(self, line, uri):
+        self.line = line
+        self.uri = uri
+        match = _BANDWIDTH_VALUE_RE.search(line)
+        self.bandwidth = int(match.group(1)) if match else 0
+        self._attrs = None
+
+    @property
+    def attrs(self):
+        if self._attrs is None:
+            self._attrs = parse_attributes(self.line)
+        return self._attrs
+
+    @property
+    def height(self):
+        return _int(self.attrs.get('RESOLUTION', '').partition('x')[2])
+
+    @property
+    def codecs(self):
+        return [c.strip().lower() for c in self.attrs.get('CODECS', '').split(',') if c.strip()]
+
+
+class Rendition:
+    __slots__ = ('line', 'attrs', 'type', 'uri', 'language', 'name', 'group_id', 'default', 'autoselect')
+
+    def __init__(self, line):
+        self.line = line
+        self.attrs = parse_attributes(line)
+        self.type = self.attrs.get('TYPE', '').upper()
+        self.uri = self.attrs.get('URI')
+        self.language = (self.attrs.get('LANGUAGE', '') or '').lower()
+        self.name = (self.attrs.get('NAME', '') or '').lower()
+        self.group_id = self.attrs.get('GROUP-ID', '')
+        self.default = (self.attrs.get('DEFAULT', '') or '').upper() == 'YES'
+        self.autoselect = (self.attrs.get('AUTOSELECT', '') or '').upper() == 'YES'
+
+
+class MasterPlaylist:
+    __slots__ = ('variants', 'renditions')
+
+    def __init__(self, variants, renditions):
+        self.variants = variants
+        self.renditions = renditions
+
+    @classmethod
+    def parse(cls, lines):
+        """
+        Parse a master playlist
+
+        Args:
+            lines: Playlist text or any iterable of lines (e.g. response.iter_lines)
+        """
+        if isinstance(lines, str):
+            lines = lines.splitlines()
+
+        variants = []
+        renditions = []
+        pending = None
+
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            line = line.rstrip('\r\n')
+
+            if pending is not None:
+                # The URI of a variant is the next non-tag, non-empty line
+                if line and not line.startswith('#'):
+                    variants.append(Variant(pending, line))
+                    pending = None
+                continue
+
+            if line.startswith(STREAM_INF):
+                pending = line
+            elif line.startswith(MEDIA):
+                renditions.append(Rendition(line))
+
+        return cls(variants, renditions)
+
+    def audio_renditions(self):
+        # Keep only AUDIO (some manifests may omit TYPE) with their own URI
+        return [r for r in self.renditions if r.uri and r.type in ('AUDIO', '')]
+
+
+## -- VARIANT POLICIES
+# Each policy narrows the candidate list, the highest bandwidth of what is
+# left wins. A policy that would leave nothing keeps the list untouched.
+
+class HighestBandwidth:
+    def narrow(self, variants):
+        return variants
+
+
+class ResolutionCap:
+    def __init__(self, max_height):
+        self.max_height = _int(max_height)
+
+    def narrow(self, variants):
+        if not self.max_height:
+            return variants
+        sized = [(v.height, v) for v in variants if v.height]
+        capped = [v for height, v in sized if height <= self.max_height]
+        if capped:
+            return capped
+        # Everything is above the cap, use the smallest resolution available
+        if not sized:
+            return variants
+        lowest = min(height for height, _ in sized)
+        return [v for height, v in sized if height == lowest]
+
+
+class BandwidthCap:
+    def __init__(self, max_bandwidth):
+        self.max_bandwidth = _int(max_bandwidth)
+
+    def narrow(self, variants):
+        if not self.max_bandwidth:
+            return variants
+        return [v for v in variants if v.bandwidth <= self.max_bandwidth] or variants
+
+
+class CodecPreference:
+    def __init__(self, preferred):
+        """
+        Args:
+            preferred (list|str): Codec prefixes in order of preference,
+                e.g. ['avc1', 'vp09', 'av01'] or "avc1,vp09,av01"
+        """
+        if isinstance(preferred, str):
+            preferred = preferred.split(',')
+        self.preferred = [p.strip().lower() for p in preferred if p.strip()]
+
+    def narrow(self, variants):
+        for prefix in self.preferred:
+            matches = [v for v in variants if any(c.startswith(prefix) for c in v.codecs)]
+            if matches:
+                return matches
+        return variants
+
+
+def select_variant(variants, policies=()):
+    candidates = list(variants)
+    for policy in policies:
+        narrowed = policy.narrow(candidates)
+        if narrowed:
+            candidates = narrowed
+
+    best = None
+    for variant in candidates:
+        # Strictly greater, the first of equal bandwidths wins
+        if best is None or variant.bandwidth > best.bandwidth:
+            best = variant
+    return best
+
+
+## -- AUDIO SCORING
+
+class AudioLanguageScore:
+    def __init__(self, original_lang=None):
+        self.original_lang = original_lang
+
+    def score(self, rendition):
+        # Scoring: prefer ORIGINAL, then English, then best available
+        score = 0
+
+        # 1) Original language first
+        if self.original_lang and rendition.language.startswith(self.original_lang):
+            score += 400
+
+        # 2) English next
+        if rendition.language.startswith('en'):
+            score += 200
+        if 'english' in rendition.name:
+            score += 200
+
+        # Tie-breakers
+        if rendition.default:
+            score += 40
+        if rendition.autoselect:
+            score += 10
+
+        # Keep the old heuristic as a minor tie-breaker
+        if '234' in rendition.line or rendition.group_id == '234':
+            score += 3
+
+        return score
+
+
+def select_audio(renditions, scorer):
+    best = None
+    best_score = None
+    for rendition in renditions:
+        score = scorer.score(rendition)
+        if best is None or score > best_score:
+            best = rendition
+            best_score = score
+    return best
+
+
+## -- REWRITER
+
+def rewrite_master(content, policies=(), audio_scorer=None, bandwidth_override=279001):
+    """
+    Build a master playlist with only the selected audio rendition and variant
+
+    Args:
+        content: Master playlist text or iterable of lines
+        policies: Variant selection policies, applied in order
+        audio_scorer: Object with score(rendition), AudioLanguageScore by default
+        bandwidth_override (int|None): BANDWIDTH written for the selected
+            variant so players don't downgrade it, None keeps the original
+    """
+    playlist = MasterPlaylist.parse(content)
+    variant = select_variant(playlist.variants, policies)
+    audio = select_audio(playlist.audio_renditions(), audio_scorer or AudioLanguageScore())
+
+    output = ['#EXTM3U', '#EXT-X-INDEPENDENT-SEGMENTS']
+
+    if audio:
+        output.append(audio.line)
+
+    if variant:
+        info = variant.line
+        if variant.bandwidth and bandwidth_override:
+            info = _BANDWIDTH_RE.sub(f'BANDWIDTH={bandwidth_override}', info, count=1)
+        output.append(info)
+        output.append(variant.uri)
+
+    return '\n'.join(output) + '\n'
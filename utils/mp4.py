@@ -0,0 +1,169 @@
+"""
+Fragmented MP4 seek index.
+Reads the top-level boxes of a fragmented MP4 (ftyp, moov, moof/mdat...) as it
+is being written and maps the start time of every fragment to its byte offset.
+The init segment (everything before the first moof) followed by the fragments
+from any offset is itself a valid fragmented MP4, so a player can start at a
+given second without remuxing again.
+"""
+import bisect
+import struct
+
+def read_box_header(data, offset):
+    """
+    (size, type, header_size) of the box at offset, None if the header is
+    incomplete. size 0 (box until the end of the file) is returned as is.
+    """
+    if len(data) - offset < 8:
+        return None
+    size, box_type = struct.unpack_from('>I4s', data, offset)
+    if size == 1:
+        if len(data) - offset < 16:
+            return None
+        size = struct.unpack_from('>Q', data, offset + 8)[0]
+        return size, box_type, 16
+    return size, box_type, 8
+
+
+def iter_boxes(data, start=0, end=None):
+    """Yield (type, payload_start, box_end) of the complete boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    offset = start
+    while offset < end:
+        header = read_box_header(data, offset)
+        if header is None:
+            return
+        size, box_type, header_size = header
+        if size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            return
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def _full_box_version(data, payload_start):
+    return data[payload_start]
+
+
+def parse_moov(data, start, end):
+    """{track_id: (timescale, handler)} of the tracks in a moov payload."""
+    tracks = {}
+    for box_type, payload, box_end in iter_boxes(data, start, end):
+        if box_type != b'trak':
+            continue
+        track_id = timescale = handler = None
+        for child, child_payload, child_end in iter_boxes(data, payload, box_end):
+            if child == b'tkhd':
+                version = _full_box_version(data, child_payload)
+                # version, flags, creation and modification times, then the track ID
+                id_offset = child_payload + (20 if version == 1 else 12)
+                track_id = struct.unpack_from('>I', data, id_offset)[0]
+            elif child == b'mdia':
+                for mdia_child, mdia_payload, _ in iter_boxes(data, child_payload, child_end):
+                    if mdia_child == b'mdhd':
+                        version = _full_box_version(data, mdia_payload)
+                        scale_offset = mdia_payload + (20 if version == 1 else 12)
+                        timescale = struct.unpack_from('>I', data, scale_offset)[0]
+                    elif mdia_child == b'hdlr':
+                        handler = data[mdia_payload + 8:mdia_payload + 12]
+        if track_id is not None and timescale:
+            tracks[track_id] = (timescale, handler)
+    return tracks
+
+
+def parse_moof(data, start, end):
+    """{track_id: base_media_decode_time} of the track fragments in a moof payload."""
+    times = {}
+    for box_type, payload, box_end in iter_boxes(data, start, end):
+        if box_type != b'traf':
+            continue
+        track_id = decode_time = None
+        for child, child_payload, _ in iter_boxes(data, payload, box_end):
+            if child == b'tfhd':
+                track_id = struct.unpack_from('>I', data, child_payload + 4)[0]
+            elif child == b'tfdt':
+                if _full_box_version(data, child_payload) == 1:
+                    decode_time = struct.unpack_from('>Q', data, child_payload + 4)[0]
+                else:
+                    decode_time = struct.unpack_from('>I', data, child_payload + 4)[0]
+        if track_id is not None and decode_time is not None:
+            times[track_id] = decode_time
+    return times
+
+
+class FragmentIndex:
+    """
+    Seek index of a fragmented MP4 that may still be growing. update() reads
+    the boxes added since the last call, only complete boxes are indexed.
+    """
+
+    def __init__(self):
+        self.position = 0
+        self.init_end = None
+        self.tracks = {}
+        self.fragments = []
+        self.starts = []
+
+    def reference_track(self):
+        """Video track if there is one, the first track otherwise."""
+        for track_id, (_, handler) in sorted(self.tracks.items()):
+            if handler == b'vide':
+                return track_id
+        return min(self.tracks) if self.tracks else None
+
+    def update(self, file, size):
+        """
+        Index the boxes of file (opened in binary mode) up to size bytes
+
+        Returns:
+            int: Fragments indexed so far
+        """
+        while self.position + 8 <= size:
+            file.seek(self.position)
+            header = read_box_header(file.read(16), 0)
+            if header is None:
+                break
+            box_size, box_type, header_size = header
+            if box_size < header_size or self.position + box_size > size:
+                break
+            if box_type in (b'moov', b'moof'):
+                file.seek(self.position)
+                data = file.read(box_size)
+                if box_type == b'moov':
+                    self.tracks = parse_moov(data, header_size, box_size)
+                else:
+                    self.add_fragment(parse_moof(data, header_size, box_size))
+            self.position += box_size
+        return len(self.fragments)
+
+    def add_fragment(self, times):
+        if self.init_end is None:
+            self.init_end = self.position
+        track_id = self.reference_track()
+        if track_id not in times or track_id not in self.tracks:
+            return
+        seconds = times[track_id] / self.tracks[track_id][0]
+        self.fragments.append((seconds, self.position))
+        self.starts.append(seconds)
+
+    @property
+    def duration(self):
+        """Start time of the last indexed fragment."""
+        return self.fragments[-1][0] if self.fragments else 0.0
+
+    def offset_for(self, seconds, complete=False):
+        """
+        Byte offset of the last fragment starting at or before seconds
+
+        Args:
+            complete (bool): The file is finished, seconds past the last
+                fragment start are inside it
+
+        Returns:
+            int: None if the index doesn't reach seconds yet
+        """
+        if not self.fragments or (seconds > self.duration and not complete):
+            return None
+        position = max(0, bisect.bisect_right(self.starts, seconds) - 1)
+        return self.fragments[position][1]
@@ -4,6 +4,26 @@ while only removing characters that are actually problematic for filesystems.
 """
 import re
 import unicodedata
+from functools import lru_cache
+
+# Windows forbidden characters: < > : " / \ | ? * -> fullwidth alternatives,
+# control characters (0x00-0x1F and 0x7F-0x9F) -> removed. One translate pass.
+_TRANSLATE_TABLE = str.maketrans({
+    '<': '＜',   # Fullwidth less-than
+    '>': '＞',   # Fullwidth greater-than
+    ':': '：',   # Fullwidth colon
+    '"': '＂',   # Fullwidth quotation mark
+    '/': '／',   # Fullwidth solidus
+    '\\': '＼',  # Fullwidth reverse solidus
+    '|': '｜',   # Fullwidth vertical line
+    '?': '？',   # Fullwidth question mark
+    '*': '＊',   # Fullwidth asterisk
+    **{chr(c): None for c in range(0, 32)},
+    **{chr(c): None for c in range(127, 160)},
+})
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
 
 def sanitize(filename, max_length=255):
     """
@@ -14,6 +34,9 @@ def sanitize(filename, max_length=255):
     - Control characters (0x00-0x1F)
     - Leading/trailing dots and spaces
     
+    Results are memoized, the same channel and title strings are sanitized
+    several times per video.
+    
     Args:
         filename: The filename to sanitize
         max_length: Maximum filename length (default 255)
@@ -23,55 +46,48 @@ def sanitize(filename, max_length=255):
     """
     if not filename:
         return "unnamed"
+    return _sanitize(filename, max_length)
+
+
+def sanitize_many(filenames, max_length=255):
+    """
+    Sanitize a list of filenames
     
+    Args:
+        filenames: Iterable of filenames
+        max_length: Maximum filename length (default 255)
+    
+    Returns:
+        List of sanitized filenames in the same order
+    """
+    return [sanitize(filename, max_length) for filename in filenames]
+
+
+@lru_cache(maxsize=4096)
+def _sanitize(filename, max_length):
     # Normalize Unicode (NFC form - canonical composition)
     filename = unicodedata.normalize('NFC', filename)
     
-    # Replace problematic filesystem characters with safe alternatives
-    # Windows forbidden characters: < > : " / \ | ? *
-    replacements = {
-        '<': '＜',   # Fullwidth less-than
-        '>': '＞',   # Fullwidth greater-than
-        ':': '：',   # Fullwidth colon
-        '"': '＂',   # Fullwidth quotation mark
-        '/': '／',   # Fullwidth solidus
-        '\\': '＼',  # Fullwidth reverse solidus
-        '|': '｜',   # Fullwidth vertical line
-        '?': '？',   # Fullwidth question mark
-        '*': '＊',   # Fullwidth asterisk
-    }
-    
-    for char, replacement in replacements.items():
-        filename = filename.replace(char, replacement)
-    
-    # Remove control characters (0x00-0x1F and 0x7F-0x9F)
-    filename = ''.join(char for char in filename if ord(char) >= 32 and not (127 <= ord(char) <= 159))
+    # Replace forbidden characters and drop control characters
+    filename = filename.translate(_TRANSLATE_TABLE)
     
     # Remove leading/trailing dots and spaces
     filename = filename.strip('. ')
     
     # Replace multiple spaces with single space
-    filename = re.sub(r'\s+', ' ', filename)
+    filename = _WHITESPACE_RE.sub(' ', filename)
     
     # Ensure filename is not empty after sanitization
     if not filename:
         return "unnamed"
     
     # Truncate to max_length while trying to preserve complete characters
-    if len(filename.encode('utf-8')) > max_length:
-        # Truncate by bytes, then decode back
-        encoded = filename.encode('utf-8')[:max_length]
-        # Try to decode, ignoring errors at the end if we cut in the middle of a character
-        try:
-            filename = encoded.decode('utf-8')
-        except UnicodeDecodeError:
-            # If we cut in the middle of a multi-byte character, trim back
-            for i in range(1, 5):  # UTF-8 characters are max 4 bytes
-                try:
-                    filename = encoded[:-i].decode('utf-8')
-                    break
-                except UnicodeDecodeError:
-                    continue
+    # (ASCII-only names can't exceed it if len() doesn't)
+    if len(filename) > max_length // 4:
+        encoded = filename.encode('utf-8')
+        if len(encoded) > max_length:
+            # Truncate by bytes, dropping a multi-byte character cut in half
+            filename = encoded[:max_length].decode('utf-8', errors='ignore')
     
     # Final check: remove trailing dots and spaces again
     filename = filename.strip('. ')